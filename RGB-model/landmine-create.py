@@ -1,33 +1,118 @@
 import bpy
-import random
-import math
+import sys
+import os
 
-# Path to the .fbx file (replace with your own path)
-fbx_path = r"path\to\your\pomz.fbx"
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from placement import plan_layout
+from render_and_label import MINES
 
-# Import the .fbx model once
-bpy.ops.import_scene.fbx(filepath=fbx_path)
-original_obj = bpy.context.selected_objects[-1]
+# Default settings — change these if you want
+default_config = {
+    'fbx_dir': r"path\to\your\fbx",      # One <class>.fbx per mine type (mon.fbx, pomz.fbx, ...)
+    'count': 60,                          # How many mines to place
+    'area': (-10, 10, -10, 10),           # min_x, max_x, min_y, max_y in meters
+    'min_distance': 0.5,                  # Smallest gap between two mines in meters
+    'seed': None,                         # Fix it to get the same scene again
+}
 
-for _ in range(60):
-    # Duplicate the original object
-    bpy.ops.object.duplicate()
-    obj = bpy.context.selected_objects[-1]
+# Joins the meshes of one FBX import into one object and frees it from its parents (keeping its
+# world transform), so the template is the whole mine however the file splits it into parts
+def merge_import(meshes):
+    bpy.ops.object.select_all(action='DESELECT')
+    for obj in meshes:
+        obj.select_set(True)
+    bpy.context.view_layer.objects.active = meshes[0]
+    if len(meshes) > 1:
+        bpy.ops.object.join()
+    bpy.ops.object.parent_clear(type='CLEAR_KEEP_TRANSFORM')
+    return bpy.context.view_layer.objects.active
 
-    # Move the object along the X axis by a random distance from -10 to 10 meters
-    obj.location.x = random.uniform(-10, 10)
+# Imports <class>.fbx once per mine type and keeps all its meshes as one hidden template object
+def load_templates(fbx_dir, collection_name="MineTemplates"):
+    templates = bpy.data.collections.get(collection_name)
+    if templates is None:
+        templates = bpy.data.collections.new(collection_name)
+        bpy.context.scene.collection.children.link(templates)
 
-    # Move the object along the Y axis by a random distance from -10 to 10 meters
-    obj.location.y = random.uniform(-10, 10)
+    result = {}
+    for label in MINES:
+        if label in templates.objects:
+            result[label] = templates.objects[label]
+            continue
+        path = os.path.join(fbx_dir, label + '.fbx')
+        if not os.path.isfile(path):
+            print(f"No {label}.fbx in {fbx_dir}, skipping {label}")
+            continue
+        bpy.ops.import_scene.fbx(filepath=path)
+        imported = list(bpy.context.selected_objects)
+        meshes = [obj for obj in imported if obj.type == 'MESH']
+        others = [obj for obj in imported if obj.type != 'MESH']
+        if not meshes:
+            for obj in imported:
+                bpy.data.objects.remove(obj, do_unlink=True)
+            raise ValueError(f"{path} has no mesh objects")
+        template = merge_import(meshes)
+        for obj in others:
+            bpy.data.objects.remove(obj, do_unlink=True)
+        template.name = label
+        for collection in template.users_collection:
+            collection.objects.unlink(template)
+        templates.objects.link(template)
+        template.hide_render = True
+        template.hide_set(True)
+        result[label] = template
+    return result
 
-    # Move the object along the Z axis by a random distance from 0.1207 to 0.2007 meters
-    obj.location.z = random.uniform(0.1207, 0.2007)
+# Removes the mines a previous run placed in the collection
+def clear_mines(collection):
+    for obj in list(collection.objects):
+        if obj.name.split('.')[0] in MINES:
+            bpy.data.objects.remove(obj, do_unlink=True)
 
-    t_f = random.choice([0, 1])
+# Places the mines as linked instances: every object shares its template's mesh data,
+# so thousands of mines cost one mesh per type and no operator calls
+def populate(collection, templates, count, area, min_distance, seed=None):
+    positions, tilts, labels = plan_layout(count, list(templates), area, min_distance, seed=seed)
+    if len(positions) < count:
+        print(f"Only {len(positions)} mines fit at {min_distance} m spacing")
 
-    if t_f == 1:
-        # Add a random tilt along the X axis in degrees
-        obj.rotation_euler.x = math.radians(random.uniform(0, 15))
+    for (x, y, z), (tilt_x, tilt_y), label in zip(positions.tolist(), tilts.tolist(), labels):
+        template = templates[label]
+        obj = bpy.data.objects.new(label, template.data)
+        obj.scale = template.scale
+        obj.rotation_mode = template.rotation_mode
+        obj.rotation_euler = template.rotation_euler
+        obj.location = (x, y, z)
+        if tilt_x or tilt_y:
+            obj.rotation_euler.x = tilt_x
+            obj.rotation_euler.y = tilt_y
+        collection.objects.link(obj)
+    return len(positions)
 
-        # Add a random tilt along the Y axis in degrees
-        obj.rotation_euler.y = math.radians(random.uniform(0, 15))
+def main(fbx_dir, count, area, min_distance, seed=None):
+    collection = bpy.data.collections['Collection']
+    templates = load_templates(fbx_dir)
+    if not templates:
+        raise FileNotFoundError(f"No mine .fbx files found in {fbx_dir}")
+    clear_mines(collection)
+    placed = populate(collection, templates, count, area, min_distance, seed)
+    print(f"Placed {placed} mines of {len(templates)} types")
+
+# Run it
+if __name__ == "__main__":
+    if "--" in sys.argv:
+        # Grab settings from command line: blender scene.blend -b -P landmine-create.py -- --count 500
+        args = sys.argv[sys.argv.index("--") + 1:]
+        arg_dict = dict(zip(args[::2], args[1::2]))
+        config = {
+            'fbx_dir': str(arg_dict.get("--fbx_dir", default_config['fbx_dir'])),
+            'count': int(arg_dict.get("--count", default_config['count'])),
+            'area': tuple(float(v) for v in arg_dict["--area"].split(',')) if "--area" in arg_dict
+                    else default_config['area'],
+            'min_distance': float(arg_dict.get("--min_distance", default_config['min_distance'])),
+            'seed': int(arg_dict["--seed"]) if "--seed" in arg_dict else default_config['seed'],
+        }
+    else:
+        config = default_config
+
+    main(**config)
@@ -0,0 +1,103 @@
+import math
+import numpy as np
+
+# Pure NumPy mine placement used by landmine-create.py.
+# Nothing here imports bpy, so layouts can be generated and checked outside Blender.
+
+
+# Offsets of the 5x5 grid cells that can hold a point closer than min_distance
+_NEIGHBOURS = np.array([(dy, dx) for dy in range(-2, 3) for dx in range(-2, 3)])
+
+
+# Poisson-disk sampling (Bridson): points in [0, width) x [0, height), no two closer than
+# min_distance. A grid with cells of min_distance / sqrt(2) holds at most one point per
+# cell, so checking a candidate only looks at the 5x5 cells around it
+def poisson_disk(width, height, min_distance, seed=None, k=30):
+    rng = np.random.default_rng(seed)
+    cell = min_distance / math.sqrt(2)
+    rows, cols = int(math.ceil(height / cell)), int(math.ceil(width / cell))
+    grid = np.full((rows + 4, cols + 4), -1, dtype=np.int64)      # 2-cell border, no bounds checks
+    points = np.empty((rows * cols, 2))
+
+    def add(point, count):
+        points[count] = point
+        grid[int(point[1] / cell) + 2, int(point[0] / cell) + 2] = count
+        return count + 1
+
+    count = add(rng.uniform([0, 0], [width, height]), 0)
+    active = [0]
+    while active:
+        slot = int(rng.integers(len(active)))
+        center = points[active[slot]]
+
+        # k candidates in the ring between min_distance and 2 * min_distance
+        angles = rng.uniform(0, 2 * math.pi, k)
+        radii = np.sqrt(rng.uniform(min_distance ** 2, 4 * min_distance ** 2, k))
+        candidates = center + np.stack([np.cos(angles), np.sin(angles)], axis=1) * radii[:, None]
+        candidates = candidates[(candidates[:, 0] >= 0) & (candidates[:, 0] < width)
+                                & (candidates[:, 1] >= 0) & (candidates[:, 1] < height)]
+
+        cells = (candidates[:, ::-1] / cell).astype(np.int64) + 2
+        neighbours = grid[cells[:, None, 0] + _NEIGHBOURS[:, 0], cells[:, None, 1] + _NEIGHBOURS[:, 1]]
+        gaps = np.linalg.norm(points[np.maximum(neighbours, 0)] - candidates[:, None], axis=2)
+        free = np.all((neighbours < 0) | (gaps >= min_distance), axis=1)
+
+        if free.any():
+            count = add(candidates[int(free.argmax())], count)
+            active.append(count - 1)
+        else:
+            active[slot] = active[-1]
+            active.pop()
+    return points[:count].copy()
+
+
+# Spreads count mines over the classes in equal shares (shuffled), or by weights
+def assign_classes(count, classes, weights=None, seed=None):
+    rng = np.random.default_rng(seed)
+    classes = list(classes)
+    if weights is None:
+        picks = np.resize(np.arange(len(classes)), count)
+    else:
+        weights = np.asarray(weights, dtype=np.float64)
+        picks = rng.choice(len(classes), size=count, p=weights / weights.sum())
+    rng.shuffle(picks)
+    return [classes[i] for i in picks]
+
+
+# Layout of count mines over area = (min_x, max_x, min_y, max_y) metres.
+# Returns positions (N, 3), tilts (N, 2) in radians around X and Y, and a class name per mine.
+# Heights and tilts follow the old landmine-create.py: z in z_range, and half of the
+# mines tilted by up to max_tilt degrees. If the area can't hold count mines at
+# min_distance, fewer are returned
+def plan_layout(count, classes, area=(-10, 10, -10, 10), min_distance=0.5, z_range=(0.1207, 0.2007),
+                tilt_probability=0.5, max_tilt=15.0, weights=None, seed=None):
+    rng = np.random.default_rng(seed)
+    min_x, max_x, min_y, max_y = area
+    xy = poisson_disk(max_x - min_x, max_y - min_y, min_distance, seed=rng.integers(2 ** 32))
+    if len(xy) > count:
+        # A random subset of a full sample keeps the spacing and covers the whole area
+        xy = xy[np.sort(rng.choice(len(xy), size=count, replace=False))]
+    xy += [min_x, min_y]
+
+    n = len(xy)
+    positions = np.concatenate([xy, rng.uniform(z_range[0], z_range[1], (n, 1))], axis=1)
+    tilted = rng.uniform(size=n) < tilt_probability
+    tilts = np.where(tilted[:, None], np.deg2rad(rng.uniform(0, max_tilt, (n, 2))), 0.0)
+    return positions, tilts, assign_classes(n, classes, weights, seed=rng.integers(2 ** 32))
+
+
+# Smallest distance between any two points (for checking layouts)
+def min_spacing(points):
+    points = np.asarray(points, dtype=np.float64)[:, :2]
+    if len(points) < 2:
+        return np.inf
+    order = np.argsort(points[:, 0])
+    points = points[order]
+    best = np.inf
+    # Sweep along x: only points closer than the best gap in x can beat it
+    for i in range(len(points) - 1):
+        j = i + 1
+        while j < len(points) and points[j, 0] - points[i, 0] < best:
+            best = min(best, float(np.hypot(*(points[j] - points[i]))))
+            j += 1
+    return best
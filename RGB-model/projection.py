@@ -0,0 +1,70 @@
+import numpy as np
+
+# Pure NumPy camera projection used by render_and_label.py.
+# Nothing here imports bpy, so it can be used and checked outside Blender.
+
+
+# Turns a 4x4 matrix (mathutils.Matrix or nested lists) into a NumPy array
+def matrix_to_array(matrix):
+    return np.array([list(row) for row in matrix], dtype=np.float64)
+
+
+# Applies a 4x4 affine transform to an (N, 3) array of points
+def transform_points(co, matrix):
+    matrix = np.asarray(matrix, dtype=np.float64)
+    co = np.asarray(co, dtype=np.float64).reshape(-1, 3)
+    return co @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+# Projects (N, 3) camera-space points onto the camera frame, returns x and y (0-1 inside the frame)
+def project_points(co, frame, perspective=True):
+    co = np.asarray(co, dtype=np.float64).reshape(-1, 3)
+    frame = np.asarray(frame, dtype=np.float64)
+    min_x, max_x = frame[1, 0], frame[2, 0]
+    min_y, max_y = frame[0, 1], frame[1, 1]
+
+    if not perspective:
+        x = (co[:, 0] - min_x) / (max_x - min_x)
+        y = (co[:, 1] - min_y) / (max_y - min_y)
+        return x, y
+
+    # Frame corners scale linearly with depth, so rescale once per vertex depth
+    z = -co[:, 2]
+    on_plane = z == 0.0
+    scale = np.where(on_plane, 1.0, z) / frame[0, 2]
+    x = (co[:, 0] - min_x * scale) / ((max_x - min_x) * scale)
+    y = (co[:, 1] - min_y * scale) / ((max_y - min_y) * scale)
+    x[on_plane] = 0.5
+    y[on_plane] = 0.5
+    return x, y
+
+
+# Gets normalized (min_x, min_y, max_x, max_y) bounds of the projected points
+def view_bounds_2d(co, frame, perspective=True):
+    if len(co) == 0:
+        return 0., 0., 0., 0.
+    return tuple(float(v) for v in view_bounds_2d_batch(co, [0], frame, perspective)[0])
+
+
+# Same as view_bounds_2d for many objects stacked in one array.
+# offsets holds the first row of every object in co; returns an (M, 4) array
+def view_bounds_2d_batch(co, offsets, frame, perspective=True):
+    offsets = np.asarray(offsets, dtype=np.intp)
+    if offsets.size == 0:
+        return np.zeros((0, 4))
+    x, y = project_points(co, frame, perspective)
+
+    lx_min = np.minimum.reduceat(x, offsets)
+    lx_max = np.maximum.reduceat(x, offsets)
+    ly_min = np.minimum.reduceat(y, offsets)
+    ly_max = np.maximum.reduceat(y, offsets)
+    center_x = np.clip((lx_max + lx_min) / 2, 0., 1.)
+    center_y = np.clip((ly_max + ly_min) / 2, 0., 1.)
+
+    bad_bbox = np.isin(center_x, (0., 1.)) & np.isin(center_y, (0., 1.))
+    bad_bbox |= (lx_min <= 0) & (lx_max >= 1)
+    bad_bbox |= (ly_min <= 0) & (ly_max >= 1)
+
+    bounds = np.clip(np.stack([lx_min, ly_min, lx_max, ly_max], axis=1), 0., 1.)
+    bounds[bad_bbox] = 0.
+    return bounds
@@ -4,6 +4,16 @@ import numpy as np
 import shutil
 import os
 import json
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from projection import matrix_to_array, transform_points, view_bounds_2d_batch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.boxes import frame_bounds_to_xywh, xywh_to_yolo
+from common.labels import LabelSink, LabelStore
+from common.manifest import MANIFEST_FILE, BuildManifest
+from common.profiling import StageStats, profiled
 
 # Default settings — change these if you want
 default_config = {
@@ -13,138 +23,250 @@ default_config = {
     'altitude': 3,                       # How high the camera flies
     'tilt_angle': 0,                     # Camera tilt (0 = down, 90 = horizon)
     'FOV': 60,                           # Camera field of view
+    'path_end': None,                    # Frame where the flight path ends (None = frame_end)
+    'label_format': 'txt',               # 'txt' files per frame or 'store' (LabelStore arrays)
+    'incremental': False,                # Keep earlier renders, only render missing/stale frames
+    'profile': False,                    # Run under cProfile and save project_dir/profile.prof
 }
 
 # Mine types with their IDs
 MINES = {'mon': 0, 'ozm': 1, 'pfm': 2, 'pmn': 3, 'pmn2': 4, 'pom': 5, 'pomz': 6, 'tm': 7}
 
-# Class for bounding boxes
-class Box:
-    dim_x = 1
-    dim_y = 1
-
-    def __init__(self, min_x, min_y, max_x, max_y, dim_x=dim_x, dim_y=dim_y):
-        self.min_x = min_x
-        self.min_y = min_y
-        self.max_x = max_x
-        self.max_y = max_y
-        self.dim_x = dim_x
-        self.dim_y = dim_y
-
-    @property
-    def x(self):
-        return round(self.min_x * self.dim_x)
-
-    @property
-    def y(self):
-        return round(self.dim_y - self.max_y * self.dim_y)
-
-    @property
-    def width(self):
-        return round((self.max_x - self.min_x) * self.dim_x)
-
-    @property
-    def height(self):
-        return round((self.max_y - self.min_y) * self.dim_y)
-
-    def to_tuple(self):
-        if self.width == 0 or self.height == 0:
-            return (0, 0, 0, 0)
-        return (self.x, self.y, self.width, self.height)
-
-# Makes box coords fit the frame size
-def normalize(data, frame_width, frame_height):
-    x_center = (data[0] + data[2] / 2) / frame_width
-    y_center = (data[1] + data[3] / 2) / frame_height
-    width = data[2] / frame_width
-    height = data[3] / frame_height
-    return x_center, y_center, width, height
-
-# Finds where an object is in the camera’s view
-def camera_view_bounds_2d(scene, cam_ob, me_ob):
-    mat = cam_ob.matrix_world.normalized().inverted()
-    depsgraph = bpy.context.evaluated_depsgraph_get()
-    me = me_ob.to_mesh(preserve_all_data_layers=True, depsgraph=depsgraph)
-    me.transform(me_ob.matrix_world)
-    me.transform(mat)
-
-    camera = cam_ob.data
-    frame = [-v for v in camera.view_frame(scene=scene)[:3]]
-    camera_persp = camera.type != 'ORTHO'
-
-    lx = []
-    ly = []
-
-    for v in me.vertices:
-        co_local = v.co
-        z = -co_local.z
-        if camera_persp and z == 0.0:
-            lx.append(0.5)
-            ly.append(0.5)
-        else:
-            if camera_persp:
-                frame = [(v / (v.z / z)) for v in frame]
-            min_x, max_x = frame[1].x, frame[2].x
-            min_y, max_y = frame[0].y, frame[1].y
-            x = (co_local.x - min_x) / (max_x - min_x)
-            y = (co_local.y - min_y) / (max_y - min_y)
-            lx.append(x)
-            ly.append(y)
-
-    center_x = clamp((max(lx) + min(lx)) / 2, 0., 1.)
-    center_y = clamp((max(ly) + min(ly)) / 2, 0., 1.)
-
-    bad_bbox = False
-    if center_x in (0., 1.) and center_y in (0., 1.):
-        bad_bbox = True
-    if min(lx) <= 0 and max(lx) >= 1:
-        bad_bbox = True
-    if min(ly) <= 0 and max(ly) >= 1:
-        bad_bbox = True
-
-    if bad_bbox:
-        min_x = max_x = min_y = max_y = 0.
-    else:
-        min_x = clamp(min(lx), 0.0, 1.0)
-        max_x = clamp(max(lx), 0.0, 1.0)
-        min_y = clamp(min(ly), 0.0, 1.0)
-        max_y = clamp(max(ly), 0.0, 1.0)
+# Reads all mesh vertex coordinates into an (N, 3) array in one call
+def mesh_vertices(me):
+    co = np.empty(len(me.vertices) * 3, dtype=np.float32)
+    me.vertices.foreach_get("co", co)
+    return co.reshape(-1, 3)
 
-    r = scene.render
-    fac = r.resolution_percentage * 0.01
-    dim_x = r.resolution_x * fac
-    dim_y = r.resolution_y * fac
-    return Box(min_x, min_y, max_x, max_y, dim_x, dim_y)
-
-# Keeps numbers in range
-def clamp(x, minimum, maximum):
-    return max(minimum, min(x, maximum))
-
-# Gets box coords for a frame
-def write_bounds_2d(scene, cam_ob, me_ob, cur_frame):
-    bpy.context.scene.frame_set(cur_frame)
-    box = camera_view_bounds_2d(scene, cam_ob, me_ob).to_tuple()
-    if np.count_nonzero(np.array(box)) != 0:
-        return box
-    return None
-
-# Main function to render and label
-def main(context, project_dir, frame_start, frame_end, tilt_angle, altitude, FOV):
+# Gets an object's evaluated mesh as object-space vertices
+def local_vertices(me_ob, depsgraph):
+    me = me_ob.to_mesh(preserve_all_data_layers=True, depsgraph=depsgraph)
+    co = mesh_vertices(me)
+    me_ob.to_mesh_clear()
+    return co
+
+# Labels all mines of a frame at once while the animation renders.
+# prepare() steps through the frames before the render and keeps the camera and mine
+# matrices of each one, because the scene a render_write handler sees is not guaranteed
+# to be evaluated at the frame that was just written. Mines usually stay put, so their
+# world-space vertices are cached and only rebuilt when one of the matrices changes.
+# stats (common.profiling.StageStats) gets the depsgraph, projection and label write times
+class FrameLabeler:
+    def __init__(self, collection, label_sink, stats=None):
+        self.label_sink = label_sink
+        self.stats = StageStats() if stats is None else stats
+        self.views = {}
+
+        self.objects, classes, verts = [], [], []
+        with self.stats.stage('depsgraph'):
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+            for obj in collection.objects:
+                label = obj.name.split('.')[0]
+                if label in MINES and obj.type == 'MESH':
+                    co = local_vertices(obj, depsgraph)
+                    if len(co):
+                        self.objects.append(obj)
+                        classes.append(MINES[label])
+                        verts.append(co)
+
+        self.classes = np.array(classes, dtype=int)
+        self.verts = verts
+        self.offsets = np.cumsum([0] + [len(co) for co in verts[:-1]]) if verts else []
+        self.placement = self.object_matrices()
+        self.world = self.world_vertices(self.placement)
+
+    # World matrices of the mines as an (M, 4, 4) array
+    def object_matrices(self):
+        return np.array([matrix_to_array(obj.matrix_world) for obj in self.objects]).reshape(-1, 4, 4)
+
+    # World-space vertices of every mine, stacked in one array
+    def world_vertices(self, matrices):
+        if not self.verts:
+            return np.zeros((0, 3))
+        return np.concatenate([transform_points(co, matrix) for co, matrix in zip(self.verts, matrices)])
+
+    # World -> camera matrix, mine matrices, view frame and projection type of the scene's current frame
+    def current_view(self, scene):
+        cam_ob = scene.camera
+        camera = matrix_to_array(cam_ob.matrix_world.normalized().inverted())
+        frame = [-v for v in cam_ob.data.view_frame(scene=scene)[:3]]
+        return camera, self.object_matrices(), frame, cam_ob.data.type != 'ORTHO'
+
+    # What the labels of a frame are made from, for the incremental build key: mine classes,
+    # vertex counts and the camera and mine matrices prepare() found for the frame. Covers
+    # scenes changed in the session without saving the .blend file
+    def frame_inputs(self, frame):
+        camera, placement, view_frame, perspective = self.views[frame]
+        return {"classes": self.classes.tolist(), "vertices": [len(co) for co in self.verts],
+                "camera": np.round(camera, 6).tolist(), "placement": np.round(placement, 6).tolist(),
+                "view_frame": [[round(float(v), 6) for v in corner] for corner in view_frame],
+                "perspective": perspective}
+
+    # One frame_set per frame, then back to the frame the scene was on
+    def prepare(self, scene, frames):
+        current = scene.frame_current
+        with self.stats.stage('depsgraph'):
+            for frame in frames:
+                scene.frame_set(frame)
+                self.views[frame] = self.current_view(scene)
+            scene.frame_set(current)
+
+    # Projects every mine through the camera of the frame, returns (classes, yolo_boxes).
+    # Frames prepare() did not cover use the scene as it is
+    def label_frame(self, scene, frame=None):
+        frame = scene.frame_current if frame is None else frame
+        camera, placement, view_frame, perspective = self.views.get(frame) or self.current_view(scene)
+        if not np.array_equal(placement, self.placement):
+            self.placement, self.world = placement, self.world_vertices(placement)
+        co = transform_points(self.world, camera)
+        bounds = view_bounds_2d_batch(co, self.offsets, view_frame, perspective)
+
+        r = scene.render
+        fac = r.resolution_percentage * 0.01
+        dim_x = r.resolution_x * fac
+        dim_y = r.resolution_y * fac
+
+        xywh = frame_bounds_to_xywh(bounds, dim_x, dim_y)
+        visible = np.any(xywh != 0, axis=1)
+        yolo = xywh_to_yolo(xywh[visible], r.resolution_x, r.resolution_y)
+        return self.classes[visible], yolo
+
+    # Hands the labels of the scene's current frame to the sink
+    def write_frame(self, scene):
+        frame_str = str(scene.frame_current).zfill(4)
+        with self.stats.stage('projection'):
+            classes, boxes = self.label_frame(scene)
+        with self.stats.stage('label_write'):
+            self.label_sink.add(f'landmine_frame_{frame_str}', classes, boxes)
+        self.stats.count('frames')
+        self.stats.count('boxes', len(boxes))
+
+    # render_write handler: runs right after each animation frame is saved
+    def on_render_write(self, scene, *args):
+        self.write_frame(scene)
+
+    def register(self):
+        bpy.app.handlers.render_write.append(self.on_render_write)
+
+    def unregister(self):
+        if self.on_render_write in bpy.app.handlers.render_write:
+            bpy.app.handlers.render_write.remove(self.on_render_write)
+        self.label_sink.close()
+
+# Times every animation frame: 'render' from render_pre to render_post, 'write' from
+# render_post until the image is on disk. Registered before the labeler so its render_write runs first
+class FrameTimer:
+    def __init__(self, stats):
+        self.stats = stats
+        self.started = None
+
+    def on_render_pre(self, scene, *args):
+        self.started = time.perf_counter()
+
+    def on_render_post(self, scene, *args):
+        now = time.perf_counter()
+        if self.started is not None:
+            self.stats.add('render', now - self.started)
+        self.started = now
+
+    def on_render_write(self, scene, *args):
+        if self.started is not None:
+            self.stats.add('write', time.perf_counter() - self.started)
+        self.started = None
+
+    def register(self):
+        bpy.app.handlers.render_pre.append(self.on_render_pre)
+        bpy.app.handlers.render_post.append(self.on_render_post)
+        bpy.app.handlers.render_write.append(self.on_render_write)
+
+    def unregister(self):
+        for handlers, handler in [(bpy.app.handlers.render_pre, self.on_render_pre),
+                                  (bpy.app.handlers.render_post, self.on_render_post),
+                                  (bpy.app.handlers.render_write, self.on_render_write)]:
+            if handler in handlers:
+                handlers.remove(handler)
+
+# Image and label file of a frame
+def frame_files(renders_prefix, labels_dir, frame):
+    frame_str = str(frame).zfill(4)
+    return [f"{renders_prefix}{frame_str}.png", os.path.join(labels_dir, f'landmine_frame_{frame_str}.txt')]
+
+# Incremental renders: works out which frames are up to date, deletes the stale
+# and orphaned ones and records every frame in the manifest as soon as it is written.
+# frame_inputs(frame) adds per-frame inputs to the key, e.g. FrameLabeler.frame_inputs
+class FrameManifest:
+    def __init__(self, manifest, renders_prefix, labels_dir, frame_start, frame_end, inputs, frame_inputs=None):
+        self.manifest = manifest
+        self.renders_prefix = renders_prefix
+        self.labels_dir = labels_dir
+        self.keys = {frame: manifest.key(frame=frame, **inputs, **(frame_inputs(frame) if frame_inputs else {}))
+                     for frame in range(frame_start, frame_end + 1)}
+
+        for frame, key in self.keys.items():
+            if not manifest.is_current(str(frame), key):
+                manifest.discard(str(frame))
+                for path in frame_files(renders_prefix, labels_dir, frame):
+                    if os.path.exists(path):
+                        os.remove(path)
+        manifest.prune(str(frame) for frame in self.keys)
+        manifest.save()
+
+    # Frames that still have to be rendered
+    def missing(self):
+        return [frame for frame, key in self.keys.items() if not self.manifest.is_current(str(frame), key)]
+
+    # render_write handler, registered after the labeler so the label file is already written
+    def on_render_write(self, scene, *args):
+        frame = scene.frame_current
+        if frame in self.keys:
+            self.manifest.record(str(frame), self.keys[frame], frame_files(self.renders_prefix, self.labels_dir, frame))
+            self.manifest.save()
+
+    def register(self):
+        bpy.app.handlers.render_write.append(self.on_render_write)
+
+    def unregister(self):
+        if self.on_render_write in bpy.app.handlers.render_write:
+            bpy.app.handlers.render_write.remove(self.on_render_write)
+        self.manifest.save()
+
+# Main function to render and label.
+# incremental=True keeps earlier renders and only renders frames that are missing or whose
+# inputs (scene file, mine layout, camera pose, altitude, tilt, FOV, path, resolution) changed.
+# Per-stage timings (p50/p95) go into meta.json; profile=True also saves a cProfile dump
+def main(context, project_dir, frame_start, frame_end, tilt_angle, altitude, FOV, path_end=None, label_format='txt',
+         incremental=False, profile=False):
+    with profiled(os.path.join(project_dir, "profile.prof") if profile else None):
+        render(context, project_dir, frame_start, frame_end, tilt_angle, altitude, FOV, path_end, label_format,
+               incremental)
+
+# Sets up the flight path and camera, then renders and labels frame_start..frame_end
+def render(context, project_dir, frame_start, frame_end, tilt_angle, altitude, FOV, path_end, label_format,
+           incremental):
+    start = time.perf_counter()
+    stats = StageStats()
     # Set up folders
     renders_dir = os.path.join(project_dir, "rendered")
     labels_dir = os.path.join(project_dir, "labels")
     meta_path = os.path.join(project_dir, "meta.json")
 
+    if incremental and label_format == 'store':
+        raise ValueError("Incremental renders need label_format='txt'")
+
     if not os.path.isdir(project_dir):
         os.mkdir(project_dir)
-    if os.path.isdir(renders_dir):
+    if os.path.isdir(renders_dir) and not incremental:
         shutil.rmtree(renders_dir)
-    if os.path.isdir(labels_dir):
+    if os.path.isdir(labels_dir) and not incremental:
         shutil.rmtree(labels_dir)
-    os.mkdir(renders_dir)
-    os.mkdir(labels_dir)
+    os.makedirs(renders_dir, exist_ok=True)
+    os.makedirs(labels_dir, exist_ok=True)
     renders_dir = os.path.join(renders_dir, "ILLIA_PMN_1_frame_")
 
+    # Shards render part of the frames but must follow the full flight path
+    if path_end is None:
+        path_end = frame_end
+
     scene = context.scene
     camera = bpy.data.objects['Camera']
     camera.data.angle = np.deg2rad(FOV)
@@ -174,8 +296,9 @@ def main(context, project_dir, frame_start, frame_end, tilt_angle, altitude, FOV
     flight_path.name = "FlightPath"
 
     # Tilt camera and set target
-    depsgraph = bpy.context.evaluated_depsgraph_get()
-    path_length = sum(s.calc_length() for s in sphere_path.evaluated_get(depsgraph).data.splines)
+    with stats.stage('depsgraph'):
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        path_length = sum(s.calc_length() for s in sphere_path.evaluated_get(depsgraph).data.splines)
     tilt_tang = np.tan(np.deg2rad(tilt_angle))
     target_offset_meters = tilt_tang * altitude
     offset = min(max(target_offset_meters / path_length, 0.001), 0.999)
@@ -191,7 +314,7 @@ def main(context, project_dir, frame_start, frame_end, tilt_angle, altitude, FOV
     constraint.offset_factor = 0.0
     constraint.keyframe_insert(data_path="offset_factor", frame=1)
     constraint.offset_factor = 1.0 - offset
-    constraint.keyframe_insert(data_path="offset_factor", frame=frame_end)
+    constraint.keyframe_insert(data_path="offset_factor", frame=path_end)
 
     # Add a target sphere
     if "SurfSphere" in bpy.data.objects:
@@ -215,37 +338,51 @@ def main(context, project_dir, frame_start, frame_end, tilt_angle, altitude, FOV
     constraint_sphere.offset_factor = offset
     constraint_sphere.keyframe_insert(data_path="offset_factor", frame=1)
     constraint_sphere.offset_factor = 1.0
-    constraint_sphere.keyframe_insert(data_path="offset_factor", frame=frame_end)
+    constraint_sphere.keyframe_insert(data_path="offset_factor", frame=path_end)
 
-    # Set up rendering
+    # Set up rendering, labels are written by the handler as frames finish
     scene.render.image_settings.file_format = 'PNG'
     scene.render.filepath = renders_dir
-    bpy.ops.render.render(animation=True)
-
-    # Label objects
-    google_collection = bpy.data.collections.get("Collection")
-    frame_width = scene.render.resolution_x
-    frame_height = scene.render.resolution_y
-
-    for frame in range(frame_start, frame_end + 1):
-        all_data = ''
-        for obj in google_collection.objects:
-            label = obj.name.split('.')[0]
-            if label in MINES:
-                data = write_bounds_2d(scene, camera, bpy.data.objects[obj.name], frame)
-                if data:
-                    x_center, y_center, width, height = normalize(data, frame_width, frame_height)
-                    all_data += f"{MINES[label]} {x_center} {y_center} {width} {height}\n"
-
-        frame_str = str(frame).zfill(4)
-        label_file = os.path.join(labels_dir, f'landmine_frame_{frame_str}.txt')
-        with open(label_file, 'w') as f:
-            f.write(all_data)
-
-    # Save some info
+    if label_format == 'store':
+        label_sink = LabelStore(os.path.join(project_dir, "label_store"))
+    else:
+        label_sink = LabelSink(labels_dir, max_pending=1 if incremental else 16)
+    labeler = FrameLabeler(bpy.data.collections.get("Collection"), label_sink, stats)
+    labeler.prepare(scene, range(frame_start, frame_end + 1))
+    handlers = [FrameTimer(stats), labeler]
+
+    if incremental:
+        r = scene.render
+        manifest = BuildManifest(os.path.join(project_dir, MANIFEST_FILE))
+        inputs = {
+            "blend_file": manifest.file_hash(bpy.data.filepath) if bpy.data.filepath else None,
+            "altitude": altitude, "tilt_angle": tilt_angle, "FOV": FOV, "path_end": path_end,
+            "resolution": [r.resolution_x, r.resolution_y, r.resolution_percentage],
+        }
+        frames = FrameManifest(manifest, renders_dir, labels_dir, frame_start, frame_end, inputs,
+                               labeler.frame_inputs)
+        handlers.append(frames)
+        print(f"{len(frames.missing())} of {frame_end - frame_start + 1} frames need rendering")
+        # Blender skips frames whose image is already on disk
+        scene.render.use_overwrite = False
+
+    for handler in handlers:
+        handler.register()
+    try:
+        with stats.stage('animation'):
+            bpy.ops.render.render(animation=True)
+    finally:
+        for handler in handlers:
+            handler.unregister()
+
+    # Save some info; resolution is the size of the rendered images in pixels
+    r = scene.render
     data = {
         "altitude": altitude, "tilt_angle": tilt_angle, "path_length": path_length,
-        "frame_start": frame_start, "frame_end": frame_end
+        "frame_start": frame_start, "frame_end": frame_end, "FOV": FOV, "path_end": path_end,
+        "resolution": [int(r.resolution_x * r.resolution_percentage / 100),
+                       int(r.resolution_y * r.resolution_percentage / 100)],
+        "timing": stats.report(seconds=round(time.perf_counter() - start, 3))
     }
     with open(meta_path, 'w') as json_file:
         json.dump(data, json_file)
@@ -265,15 +402,19 @@ if __name__ == "__main__":
             'frame_end': int(arg_dict.get("--frame_end", default_config['frame_end'])),
             'tilt_angle': float(arg_dict.get("--tilt_angle", default_config['tilt_angle'])),
             'altitude': float(arg_dict.get("--altitude", default_config['altitude'])),
-            'FOV': float(arg_dict.get("--FOV", default_config['FOV']))
+            'FOV': float(arg_dict.get("--FOV", default_config['FOV'])),
+            'path_end': int(arg_dict["--path_end"]) if "--path_end" in arg_dict else None,
+            'label_format': str(arg_dict.get("--label_format", default_config['label_format'])),
+            'incremental': str(arg_dict.get("--incremental", default_config['incremental'])).lower() in ('1', 'true'),
+            'profile': str(arg_dict.get("--profile", default_config['profile'])).lower() in ('1', 'true')
         }
 
-    os.makedirs(project_dir, exist_ok=True)
+    os.makedirs(config['project_dir'], exist_ok=True)
     old_stdout = sys.stdout
-    log_file = open(os.path.join(project_dir, "message.log"), "w")
+    log_file = open(os.path.join(config['project_dir'], "message.log"), "w")
     sys.stdout = log_file
 
-    main(bpy.context, project_dir, frame_start, frame_end, tilt_angle, altitude, FOV)
+    main(bpy.context, **config)
 
     sys.stdout = old_stdout
     log_file.close()
\ No newline at end of file
@@ -0,0 +1,180 @@
+import argparse
+import itertools
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Runs render_and_label.py in several headless Blender processes at once.
+# Every worker renders one shard (part of the frame range for one altitude/tilt/FOV)
+# into its own folder, then all shards are merged into a single YOLO dataset.
+
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "render_and_label.py")
+
+
+# Splits frame_start..frame_end into chunks of at most frames_per_shard frames
+def split_frames(frame_start, frame_end, frames_per_shard):
+    frames_per_shard = max(1, int(frames_per_shard))
+    return [(start, min(start + frames_per_shard - 1, frame_end))
+            for start in range(frame_start, frame_end + 1, frames_per_shard)]
+
+
+# Builds one shard per (altitude, tilt, FOV, frame chunk) combination
+def make_shards(frame_start, frame_end, frames_per_shard, altitudes, tilt_angles, fovs):
+    shards = []
+    for altitude, tilt_angle, fov in itertools.product(altitudes, tilt_angles, fovs):
+        for start, end in split_frames(frame_start, frame_end, frames_per_shard):
+            shards.append({
+                'name': f"alt{altitude:g}_tilt{tilt_angle:g}_fov{fov:g}_f{start:04d}-{end:04d}",
+                'frame_start': start,
+                'frame_end': end,
+                'path_end': frame_end,
+                'altitude': altitude,
+                'tilt_angle': tilt_angle,
+                'FOV': fov,
+            })
+    return shards
+
+
+# Makes a function that returns the worker command line for a shard
+# incremental=True lets every worker keep the frames its shard folder already has,
+# profile=True makes every worker save a cProfile dump in its shard folder
+def blender_command(blender="blender", blend_file=None, script=SCRIPT_PATH, threads=None, incremental=False,
+                    profile=False):
+    base = shlex.split(blender) if isinstance(blender, str) else list(blender)
+
+    def command(shard, project_dir):
+        cmd = base + ["-b"]
+        if blend_file:
+            cmd.append(blend_file)
+        if threads:
+            cmd += ["-t", str(threads)]
+        cmd += ["-P", script, "--",
+                "--project_dir", project_dir,
+                "--frame_start", str(shard['frame_start']),
+                "--frame_end", str(shard['frame_end']),
+                "--path_end", str(shard['path_end']),
+                "--altitude", str(shard['altitude']),
+                "--tilt_angle", str(shard['tilt_angle']),
+                "--FOV", str(shard['FOV'])]
+        if incremental:
+            cmd += ["--incremental", "1"]
+        if profile:
+            cmd += ["--profile", "1"]
+        return cmd
+
+    return command
+
+
+# Runs one worker and keeps its console output next to the shard
+def run_worker(shard, command, shards_dir):
+    project_dir = os.path.join(shards_dir, shard['name'])
+    os.makedirs(project_dir, exist_ok=True)
+    with open(os.path.join(project_dir, "worker.log"), "w") as log:
+        code = subprocess.call(command(shard, project_dir), stdout=log, stderr=subprocess.STDOUT)
+    return shard, code
+
+
+# Runs all shards, at most `workers` processes at a time, reporting each as it finishes
+def run_shards(shards, command, shards_dir, workers=os.cpu_count()):
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        jobs = [pool.submit(run_worker, shard, command, shards_dir) for shard in shards]
+        for done, job in enumerate(as_completed(jobs), start=1):
+            shard, code = job.result()
+            status = "ok" if code == 0 else f"failed ({code})"
+            print(f"Shard {shard['name']} {status} - {done}/{len(shards)}")
+            if code != 0:
+                failed.append(shard['name'])
+    if failed:
+        raise RuntimeError(f"{len(failed)} shard(s) failed: {', '.join(failed)}")
+
+
+# Gets the frame number from names like ILLIA_PMN_1_frame_0012.png
+def frame_number(filename):
+    return int(os.path.splitext(filename)[0].split('_')[-1])
+
+
+# Collects every shard into output_dir/images, output_dir/labels and one meta.json.
+# The merged folders are rebuilt from the shards, so nothing from older sweeps is left over
+def merge_shards(shards, shards_dir, output_dir, move=False):
+    images_dir = os.path.join(output_dir, "images")
+    labels_dir = os.path.join(output_dir, "labels")
+    for path in [images_dir, labels_dir]:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+    os.makedirs(images_dir, exist_ok=True)
+    os.makedirs(labels_dir, exist_ok=True)
+    transfer = shutil.move if move else shutil.copy2
+
+    merged = []
+    for shard in shards:
+        project_dir = os.path.join(shards_dir, shard['name'])
+        shard_labels = {frame_number(fn): fn for fn in os.listdir(os.path.join(project_dir, "labels"))}
+        renders_dir = os.path.join(project_dir, "rendered")
+
+        # Images and labels share a name so YOLO can pair them
+        count = 0
+        for image in sorted(os.listdir(renders_dir)):
+            frame = frame_number(image)
+            if frame not in shard_labels:
+                continue
+            name = f"{shard['name']}_frame_{frame:04d}"
+            transfer(os.path.join(renders_dir, image), os.path.join(images_dir, name + os.path.splitext(image)[1]))
+            transfer(os.path.join(project_dir, "labels", shard_labels[frame]), os.path.join(labels_dir, name + ".txt"))
+            count += 1
+
+        meta = dict(shard)
+        meta_path = os.path.join(project_dir, "meta.json")
+        if os.path.isfile(meta_path):
+            with open(meta_path) as json_file:
+                meta.update(json.load(json_file))
+        meta['images'] = count
+        merged.append(meta)
+
+    with open(os.path.join(output_dir, "meta.json"), 'w') as json_file:
+        json.dump({"images": sum(m['images'] for m in merged), "shards": merged}, json_file, indent=2)
+    return merged
+
+
+# Parses comma separated numbers like "3,5,8"
+def float_list(value):
+    return [float(v) for v in value.split(',') if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render and label frames in parallel Blender workers")
+    parser.add_argument("--output_dir", default="./blender_dataset")
+    parser.add_argument("--blend_file", default=None, help=".blend scene to open in every worker")
+    parser.add_argument("--blender", default="blender", help="Blender executable (or any worker command)")
+    parser.add_argument("--frame_start", type=int, default=0)
+    parser.add_argument("--frame_end", type=int, default=75)
+    parser.add_argument("--frames_per_shard", type=int, default=10)
+    parser.add_argument("--altitudes", type=float_list, default=[3])
+    parser.add_argument("--tilt_angles", type=float_list, default=[0])
+    parser.add_argument("--fovs", type=float_list, default=[60])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--threads", type=int, default=None, help="Render threads per worker (-t)")
+    parser.add_argument("--move", action="store_true", help="Move shard files instead of copying")
+    parser.add_argument("--incremental", action="store_true", help="Only render missing or stale frames")
+    parser.add_argument("--profile", action="store_true", help="Save a cProfile dump per shard")
+    args = parser.parse_args(argv)
+    if args.incremental and args.move:
+        parser.error("--move empties the shard folders that --incremental builds on")
+
+    shards = make_shards(args.frame_start, args.frame_end, args.frames_per_shard,
+                         args.altitudes, args.tilt_angles, args.fovs)
+    threads = args.threads or max(1, (os.cpu_count() or 1) // max(1, args.workers))
+    command = blender_command(args.blender, args.blend_file, threads=threads, incremental=args.incremental,
+                              profile=args.profile)
+
+    shards_dir = os.path.join(args.output_dir, "shards")
+    run_shards(shards, command, shards_dir, args.workers)
+    merge_shards(shards, shards_dir, args.output_dir, move=args.move)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,144 @@
+import math
+import numpy as np
+import cv2
+
+# Array version of the augmentation chain (crop -> blur -> rotate -> overlay).
+# Everything works on HxWx4 uint8 RGBA buffers: crops are views, blur and
+# compositing write back into the buffer, right-angle rotations make one copy.
+
+
+# Crops the centre of the array to crop_size (a view, nothing is copied)
+def crop_array(img, crop_size=(1980, 1980)):
+    height, width = img.shape[:2]
+    if width < crop_size[0] or height < crop_size[1]:
+        raise ValueError(f"Image {width}x{height} is smaller than the crop {crop_size[0]}x{crop_size[1]}")
+    left = (width - crop_size[0]) // 2
+    top = (height - crop_size[1]) // 2
+    return img[top:top + crop_size[1], left:left + crop_size[0]]
+
+
+# cv2.rotate codes for counter-clockwise quarter turns
+ROTATIONS = {1: cv2.ROTATE_90_COUNTERCLOCKWISE, 2: cv2.ROTATE_180, 3: cv2.ROTATE_90_CLOCKWISE}
+
+
+# Rotates counter-clockwise like PIL rotate(angle, expand=True), only for multiples of 90.
+# The result is a contiguous copy: compositing on a transposed np.rot90 view is ~2.5x slower
+def rotate_array(img, angle):
+    if angle % 90 != 0:
+        raise ValueError(f"Only right-angle rotations are supported, got {angle}")
+    turns = (angle // 90) % 4
+    return cv2.rotate(img, ROTATIONS[turns]) if turns else img
+
+
+# Box radius that makes `passes` box blurs behave like a Gaussian (same formula as PIL)
+def box_radius(radius, passes=3):
+    sigma2 = radius * radius / passes
+    box_length = math.sqrt(12.0 * sigma2 + 1.0)
+    l = math.floor((box_length - 1.0) / 2.0)
+    a = (2 * l + 1) * (l * (l + 1) - 3 * sigma2)
+    a /= 6 * (sigma2 - (l + 1) * (l + 1))
+    return l + a
+
+
+# One box blur pass with a fractional radius: whole pixels weigh 1, the two edge pixels the fraction
+def box_kernel(radius, passes=3):
+    r = box_radius(radius, passes)
+    whole = int(r)
+    box = np.ones(2 * whole + 3, dtype=np.float32)
+    box[0] = box[-1] = r - whole
+    box /= 2 * r + 1
+    return np.trim_zeros(box)
+
+
+# All box passes as one kernel. It has to be exactly symmetric: OpenCV only takes its
+# fast path for symmetric kernels, float rounding in the convolution would break that
+def gaussian_kernel(radius, passes=3):
+    box = box_kernel(radius, passes).astype(np.float64)
+    kernel = np.array([1.0])
+    for _ in range(passes):
+        kernel = np.convolve(kernel, box)
+    return ((kernel + kernel[::-1]) / 2).astype(np.float32)
+
+
+# The box passes one by one like PIL: rows, then columns, replicated edges, rounded each time
+def box_blur_passes(img, box, passes=3):
+    one = np.ones(1, dtype=np.float32)
+    for kernel_x, kernel_y in [(box, one)] * passes + [(one, box)] * passes:
+        out = cv2.sepFilter2D(img, -1, kernel_x, kernel_y, dst=img, borderType=cv2.BORDER_REPLICATE)
+        if out is not img:
+            img[...] = out
+    return img
+
+
+# Gaussian blur written back into img (uint8 HxWxC, may be a crop view), within a level of
+# PIL GaussianBlur. One pass of the combined kernel, rounded once; PIL replicates the edge on
+# every box pass, so the bands the kernel reaches past the border are blurred pass by pass.
+def gaussian_blur(img, radius=2, passes=3):
+    if radius <= 0:
+        return img
+    box = box_kernel(radius, passes)
+    band = passes * (len(box) // 2)
+    height, width = img.shape[:2]
+    if height <= 4 * band or width <= 4 * band:
+        return box_blur_passes(img, box, passes)
+
+    # Each band is blurred with as much image again behind it, so only its far side is off
+    edges = [(np.s_[:band], box_blur_passes(img[:2 * band].copy(), box, passes)[:band]),
+             (np.s_[height - band:], box_blur_passes(img[height - 2 * band:].copy(), box, passes)[band:]),
+             (np.s_[:, :band], box_blur_passes(img[:, :2 * band].copy(), box, passes)[:, :band]),
+             (np.s_[:, width - band:], box_blur_passes(img[:, width - 2 * band:].copy(), box, passes)[:, band:])]
+    kernel = gaussian_kernel(radius, passes)
+    out = cv2.sepFilter2D(img, -1, kernel, kernel, dst=img, borderType=cv2.BORDER_REPLICATE)
+    if out is not img:
+        img[...] = out
+    for region, values in edges:
+        img[region] = values
+    return img
+
+
+# Image.alpha_composite for every (overlay alpha, background alpha) pair, indexed by
+# overlay_alpha << 8 | background_alpha: the overlay's weight in the colour (0-255) and the
+# output alpha, from the same integer formulas as PIL
+def composite_tables():
+    src_a = np.arange(256, dtype=np.int64)[:, None]
+    dst_a = np.arange(256, dtype=np.int64)[None, :]
+    out_a255 = src_a * 255 + dst_a * (255 - src_a)
+    weight = np.rint(src_a * 255 * 255 / np.maximum(out_a255, 1))
+    out_a = out_a255 + 128
+    out_a = ((out_a >> 8) + out_a) >> 8
+    return weight.astype(np.uint8).ravel(), out_a.astype(np.uint8).ravel()
+
+
+COMPOSITE_WEIGHT, COMPOSITE_ALPHA = composite_tables()
+
+
+# Composites overlay (RGBA) on top of background (RGBA) in place, like Image.alpha_composite.
+# out = (src * w + dst * (255 - w)) / 255 in 16-bit integers with w from the tables, rounded like
+# PIL; rows go in blocks so the 16-bit temporaries stay in cache
+def alpha_composite(background, overlay, block_rows=64):
+    for top in range(0, background.shape[0], block_rows):
+        dst = background[top:top + block_rows]
+        src = overlay[top:top + block_rows]
+        index = src[..., 3].astype(np.uint16)
+        index <<= 8
+        index |= dst[..., 3]
+        weight = COMPOSITE_WEIGHT[index]
+        weight = cv2.merge([weight] * 4).astype(np.uint16)
+        color = src * weight
+        weight ^= 255
+        weight *= dst
+        color += weight
+        color += 128
+        color += color >> 8
+        color >>= 8
+        dst[...] = color
+        dst[..., 3] = COMPOSITE_ALPHA[index]
+    return background
+
+
+# Runs the whole chain on a decoded RGBA array and returns the rotated result
+def augment_array(img, overlay, crop_size=(1980, 1980), angle=0, blur_radius=2):
+    img = crop_array(img, crop_size)
+    gaussian_blur(img, blur_radius)
+    img = rotate_array(img, angle)
+    return alpha_composite(img, overlay)
@@ -1,9 +1,30 @@
+import math
 import os
+import sys
 import shutil
 import numpy as np
 import cv2
 from PIL import Image, ImageFilter
 import random
+import queue
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from array_backend import augment_array, crop_array
+from auto_annotate import find_hotspots, load_bbox_spec, spec_bboxes
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.boxes import clip_boxes, drop_empty, rotate_boxes, xyxy_to_yolo
+from common.labels import LabelSink, LabelStore
+from common.manifest import MANIFEST_FILE, BuildManifest
+from common.profiling import StageStats, profiled, write_timing
+
+# Build files (manifest, timing report) go into <dataset_path>_build next to the dataset,
+# so the dataset folder only holds the augmented images
+BUILD_DIR_SUFFIX = '_build'
+TIMING_FILE = 'timing.json'
 
 # Turns image grayscale, keeps transparency
 def to_grayscale(img):
@@ -11,10 +32,15 @@ def to_grayscale(img):
     grayscale_image.putalpha(img.getchannel('A'))
     return grayscale_image
 
+# 256-entry table that scales alpha values by factor
+@lru_cache(maxsize=None)
+def alpha_lut(factor):
+    return tuple(round(p * factor) for p in range(256))
+
 # Makes image more or less see-through
 def transparent(img, factor):
     alpha = img.getchannel('A')
-    alpha = alpha.point(lambda p: p * factor)
+    alpha = alpha.point(alpha_lut(factor))
     img.putalpha(alpha)
     return img
 
@@ -41,6 +67,81 @@ def overlay(background, overlay_img):
         overlay_img = overlay_img.convert(background.mode)
     return Image.alpha_composite(background, overlay_img)
 
+# Keeps decoded biomes ready to composite: grayscale, with the alpha already
+# scaled for each transparency factor and resized to the background. Least
+# recently used entries are dropped once max_bytes is reached.
+class BiomeCache:
+    def __init__(self, biome_path, max_bytes=256 * 1024 * 1024):
+        self.biome_path = biome_path
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.entries = OrderedDict()
+
+    # Biome ready for overlay() on a background of this size and mode
+    def get(self, filename, factor, size, mode='RGBA'):
+        key = (filename, factor, tuple(size), mode)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        img = self.prepare(filename, factor, size, mode)
+        self.put(key, img)
+        return img
+
+    # Same steps and order as overlay(), so the output doesn't change
+    def prepare(self, filename, factor, size, mode):
+        img = transparent(self.base(filename).copy(), factor)
+        img = img.resize(tuple(size), Image.LANCZOS)
+        if img.mode != mode:
+            img = img.convert(mode)
+        return img
+
+    # Decoded grayscale biome
+    def base(self, filename):
+        key = (filename, None, None, None)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        with Image.open(os.path.join(self.biome_path, filename)) as biome:
+            img = to_grayscale(biome.convert('RGBA'))
+        self.put(key, img)
+        return img
+
+    # Same as get() but as a read-only HxWx4 array for array_backend. Only the array is
+    # cached, the PIL image it comes from is dropped
+    def get_array(self, filename, factor, size):
+        key = (filename, factor, tuple(size), 'array')
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        array = np.asarray(self.prepare(filename, factor, size, 'RGBA'))
+        self.put(key, array)
+        return array
+
+    def put(self, key, img):
+        self.entries[key] = img
+        self.used_bytes += image_bytes(img)
+        while self.used_bytes > self.max_bytes and len(self.entries) > 1:
+            _, old = self.entries.popitem(last=False)
+            self.used_bytes -= image_bytes(old)
+
+# Memory taken by a decoded image or array
+def image_bytes(img):
+    if isinstance(img, np.ndarray):
+        return img.nbytes
+    return img.width * img.height * len(img.getbands())
+
+# One cache per process, so pool workers reuse it between images
+_biome_caches = {}
+
+def get_biome_cache(biome_path, max_bytes):
+    cache = _biome_caches.get(biome_path)
+    if cache is None or cache.max_bytes != max_bytes:
+        cache = _biome_caches[biome_path] = BiomeCache(biome_path, max_bytes)
+    return cache
+
 # Crops image to a square
 def crop(img, crop_size=(1980, 1980)):
     width, height = img.size
@@ -50,37 +151,15 @@ def crop(img, crop_size=(1980, 1980)):
     bottom = top + crop_size[1]
     return img.crop((left, top, right, bottom))
 
-# Rotates a box around the center
-def rotate_bbox(bbox, angle, center):
-    x_min, y_min, x_max, y_max = bbox
-    cx, cy = center
-    x_min -= cx
-    y_min -= cy
-    x_max -= cx
-    y_max -= cy
-    radians = angle * np.pi / 180
-    new_x_min = x_min * np.cos(radians) + y_min * np.sin(radians)
-    new_y_min = -x_min * np.sin(radians) + y_min * np.cos(radians)
-    new_x_max = x_max * np.cos(radians) + y_max * np.sin(radians)
-    new_y_max = -x_max * np.sin(radians) + y_max * np.cos(radians)
-    return new_x_min + cx, new_y_min + cy, new_x_max + cx, new_y_max + cy
-
-# Changes box format to x, y, width, height
-def convert_coordinates(bbox):
-    x1, y1, x2, y2 = bbox
-    x = min(x1, x2)
-    y = min(y1, y2)
-    w = abs(x2 - x1)
-    h = abs(y2 - y1)
-    return x, y, w, h
-
-# Scales box coords to 0-1
-def normalize(x, y, w, h, width, height):
-    x_center = (x + w / 2) / width
-    y_center = (y + h / 2) / height
-    width = w / width
-    height = h / height
-    return x_center, y_center, width, height
+# Image file as a writable RGBA array for array_backend. RGB and grayscale images are
+# cropped first and converted by OpenCV in one copy; other modes go through PIL whole
+def decode_crop(path, crop_size):
+    with Image.open(path) as source:
+        width, height = source.size
+        code = {'RGB': cv2.COLOR_RGB2RGBA, 'L': cv2.COLOR_GRAY2RGBA}.get(source.mode)
+        if code is None or width < crop_size[0] or height < crop_size[1]:
+            return np.array(source.convert('RGBA'))
+        return cv2.cvtColor(np.asarray(crop(source, crop_size)), code)
 
 # Lets you draw boxes with the mouse
 def draw_bboxes(image):
@@ -113,66 +192,368 @@ def draw_bboxes(image):
     cv2.destroyAllWindows()
     return bboxes
 
-# Main function to tweak images and make labels
-def augment(img_path, biome_path, dataset_path, label_path, crop_size=(1980, 1980), angles=[0, 90, 180, 270]):
-    # Clear old folders and make new ones
-    for path in [dataset_path, label_path]:
-        if os.path.exists(path):
-            shutil.rmtree(path)
-        os.makedirs(path, exist_ok=True)
+# Lets you draw the boxes on a cropped image, returns them in full-size pixels
+def capture_bboxes(background):
+    image = np.array(background)
+    screen_width, screen_height = 600, 600
+    scale_factor = min(screen_width / image.shape[1], screen_height / image.shape[0])
+    resized_image = cv2.resize(image, None, fx=scale_factor, fy=scale_factor)
+    bboxes = draw_bboxes(resized_image)
+    return [(int(x1 / scale_factor), int(y1 / scale_factor), int(x2 / scale_factor), int(y2 / scale_factor))
+            for x1, y1, x2, y2 in bboxes]
 
-    biomes = os.listdir(biome_path)
-    num_images = len(os.listdir(img_path))
-    bboxes = []
+# Rotation angle and biome for an image, drawn from the image's seed
+def draw_choices(seed, angles, biomes):
+    rng = random.Random(seed)
+    angle = rng.choice(angles)
+    biome_filename = rng.choice(biomes)
+    return angle, biome_filename
+
+# Boxes of one image: the given ones, or the signatures found in the cropped frame
+def image_bboxes(bboxes, cropped, annotate_params=None):
+    if bboxes is not None:
+        return bboxes
+    return find_hotspots(np.asarray(cropped), **(annotate_params or {}))
+
+# Size of an image after rotate(angle, expand=True), computed the way PIL does it;
+# right angles are plain transposes, same as array_backend.rotate_array
+def rotated_size(size, angle):
+    width, height = size
+    if angle % 90 == 0:
+        return (width, height) if angle % 180 == 0 else (height, width)
+    # PIL's own arithmetic: corners go through the inverse matrix, translation included,
+    # since the floor/ceil of the shifted corners decides the size for odd widths and heights
+    radians = -math.radians(angle)
+    a, b = round(math.cos(radians), 15), round(math.sin(radians), 15)
+    d, e = round(-math.sin(radians), 15), round(math.cos(radians), 15)
+    cx, cy = width / 2, height / 2
+    c = a * -cx + b * -cy + cx
+    f = d * -cx + e * -cy + cy
+    corners = [(0, 0), (width, 0), (width, height), (0, height)]
+    xx = [a * x + b * y + c for x, y in corners]
+    yy = [d * x + e * y + f for x, y in corners]
+    return (math.ceil(max(xx)) - math.floor(min(xx)), math.ceil(max(yy)) - math.floor(min(yy)))
 
-    for index, filename in enumerate(os.listdir(img_path)):
-        with Image.open(os.path.join(img_path, filename)).convert('RGBA') as background:
-            fn = os.path.splitext(filename)[0]
-            background = crop(background, crop_size)
-
-            # Draw boxes just on the first image
-            if index == 0:
-                image = np.array(background)
-                screen_width, screen_height = 600, 600
-                scale_factor = min(screen_width / image.shape[1], screen_height / image.shape[0])
-                resized_image = cv2.resize(image, None, fx=scale_factor, fy=scale_factor)
-                bboxes = draw_bboxes(resized_image)
-                bboxes = [(int(x1 / scale_factor), int(y1 / scale_factor), int(x2 / scale_factor), int(y2 / scale_factor))
-                          for x1, y1, x2, y2 in bboxes]
-
-            # Blur and rotate the image
+# YOLO boxes after rotating the crop, all boxes at once. The rotated image is bigger than the
+# crop for non-right angles (and transposed at 90/270), so boxes move to its centre and are
+# clipped and normalized by its size
+def rotated_labels(bboxes, angle, crop_size):
+    width, height = rotated_size(crop_size, angle)
+    center = (crop_size[0] / 2, crop_size[1] / 2)
+    rotated = clip_boxes(rotate_boxes(bboxes, angle, center, (width / 2, height / 2)), width, height)
+    return xyxy_to_yolo(drop_empty(rotated), width, height)
+
+# Builds one augmented image; every random choice comes from the image's own seed,
+# so the result doesn't depend on which worker runs it.
+# backend='numpy' runs right-angle rotations through array_backend instead of PIL.
+# bboxes=None annotates the frame with auto_annotate.find_hotspots(**annotate_params).
+# stats (common.profiling.StageStats) gets the time of every step.
+# Returns the image name, the image (PIL image or RGBA array) and its YOLO boxes
+def compose_image(filename, img_path, biome_path, biomes, crop_size, angles, bboxes, seed,
+                  biome_cache_bytes=256 * 1024 * 1024, backend='pil', annotate_params=None, stats=None):
+    stats = StageStats() if stats is None else stats
+    biome_cache = get_biome_cache(biome_path, biome_cache_bytes)
+    fn = os.path.splitext(filename)[0]
+    angle, biome_filename = draw_choices(seed, angles, biomes)
+
+    if backend == 'numpy' and angle % 90 == 0:
+        with stats.stage('decode'):
+            background = decode_crop(os.path.join(img_path, filename), crop_size)
+        with stats.stage('annotate'):
+            bboxes = image_bboxes(bboxes, crop_array(background, crop_size), annotate_params)
+        with stats.stage('biome'):
+            size = crop_size if angle % 180 == 0 else crop_size[::-1]
+            biome = biome_cache.get_array(biome_filename, factor_func(fn), size)
+        with stats.stage('composite'):
+            img = np.ascontiguousarray(augment_array(background, biome, crop_size, angle))
+    else:
+        with stats.stage('decode'):
+            with Image.open(os.path.join(img_path, filename)) as source:
+                background = crop(source.convert('RGBA'), crop_size)
+        with stats.stage('annotate'):
+            bboxes = image_bboxes(bboxes, background, annotate_params)
+
+        # Blur and rotate the image
+        with stats.stage('filter'):
             background = background.filter(ImageFilter.GaussianBlur(radius=2))
-            angle = random.choice(angles)
             background = background.rotate(angle, expand=True)
 
-            # Update boxes after rotation
-            center = (crop_size[0] // 2, crop_size[1] // 2)
-            for bbox in bboxes:
-                rotated_bbox = rotate_bbox(bbox, angle, center)
-                box = convert_coordinates(rotated_bbox)
-                x, y, w, h = normalize(*box, crop_size[0], crop_size[1])
-                bbox_filename = fn + '.txt'
-                bbox_path = os.path.join(label_path, bbox_filename)
-                with open(bbox_path, 'a') as bbox_file:
-                    bbox_file.write(f'0 {x} {y} {w} {h}\n')
-
-            # Add a random biome on top
-            biome_filename = random.choice(biomes)
-            with Image.open(os.path.join(biome_path, biome_filename)).convert('RGBA') as biome:
-                biome = to_grayscale(biome)
-                biome = transparent(biome, factor_func(fn))
-                img = overlay(background, biome)
-                img.save(os.path.join(dataset_path, fn + '.png'))
-
-        # Show progress
+        # Add a random biome on top
+        with stats.stage('biome'):
+            biome = biome_cache.get(biome_filename, factor_func(fn), background.size, background.mode)
+        with stats.stage('composite'):
+            img = Image.alpha_composite(background, biome)
+    with stats.stage('labels'):
+        labels = rotated_labels(bboxes, angle, crop_size)
+    stats.count('boxes', len(labels))
+    return fn, img, labels
+
+# Everything compose_image needs for one image, as plan_jobs() builds it for augment() and augment_stream()
+ImageJob = namedtuple('ImageJob', ['filename', 'img_path', 'biome_path', 'biomes', 'crop_size', 'angles', 'bboxes',
+                                   'seed', 'biome_cache_bytes', 'backend', 'annotate_params'])
+
+# Augments one image and saves it as PNG; the parent process writes the labels.
+# Also returns the image's StageStats so pool workers can report their timings
+def augment_image(job, dataset_path):
+    stats = StageStats()
+    fn, img, labels = compose_image(**job._asdict(), stats=stats)
+    with stats.stage('encode'):
+        if isinstance(img, np.ndarray):
+            img = Image.fromarray(img)
+        img.save(os.path.join(dataset_path, fn + '.png'))
+    return fn, labels, stats
+
+# Same as compose_image but always hands back an HxWx4 uint8 array
+def compose_sample(job):
+    fn, img, labels = compose_image(**job._asdict())
+    return fn, np.asarray(img), labels
+
+# Collects labels, timings and shows progress as images finish; on_saved(fn) runs for every image
+def collect_results(finished, num_images, label_sink, on_saved=None, stats=None):
+    stats = StageStats() if stats is None else stats
+    for index, (fn, labels, image_stats) in enumerate(finished):
+        stats.merge(image_stats.times, image_stats.counters)
+        stats.count('images')
+        with stats.stage('label_write'):
+            label_sink.add(fn, 0, labels)
+        if on_saved:
+            on_saved(fn)
         progress_percentage = (index + 1) / num_images * 100
         print(f'Saved {fn}.png - {progress_percentage:.2f}% done')
 
+# Sorted inputs, a run seed and the boxes of every image.
+# Boxes come from the spec file entry of the image, then from bboxes, then from
+# annotation: 'auto' leaves them as None so each frame is annotated on its own,
+# 'manual' draws them once on the first image
+def plan_run(img_path, biome_path, crop_size, seed=None, bboxes=None, annotation='auto', bbox_spec=None):
+    biomes = sorted(os.listdir(biome_path))
+    filenames = sorted(os.listdir(img_path))
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    if bboxes is None and annotation == 'manual' and filenames:
+        with Image.open(os.path.join(img_path, filenames[0])).convert('RGBA') as first:
+            bboxes = capture_bboxes(crop(first, crop_size)) or []
+    spec = load_bbox_spec(bbox_spec) if bbox_spec else None
+    file_bboxes = []
+    for filename in filenames:
+        from_spec = spec_bboxes(spec, filename)
+        file_bboxes.append(from_spec if from_spec is not None else bboxes)
+    return filenames, biomes, seed, file_bboxes
+
+# One ImageJob per input image (see plan_run), each with its own seed derived from the run seed.
+# Returns the jobs and the run seed
+def plan_jobs(img_path, biome_path, crop_size, angles, seed=None, bboxes=None, annotation='auto', bbox_spec=None,
+              biome_cache_mb=256, backend='pil', annotate_params=None):
+    filenames, biomes, seed, file_bboxes = plan_run(img_path, biome_path, crop_size, seed, bboxes,
+                                                    annotation, bbox_spec)
+    jobs = [ImageJob(filename, img_path, biome_path, biomes, crop_size, angles, image_boxes, f'{seed}-{filename}',
+                     biome_cache_mb * 1024 * 1024, backend, annotate_params)
+            for filename, image_boxes in zip(filenames, file_bboxes)]
+    return jobs, seed
+
+# Main function to tweak images and make labels.
+# workers > 1 runs the per-image work in a process pool, seed fixes the random choices,
+# biome_cache_mb limits the memory each process keeps for prepared biomes,
+# backend is 'pil' or 'numpy' (array_backend.py, pixel-close to PIL),
+# label_format is 'txt' (one file per image) or 'store' (LabelStore arrays in label_path),
+# bboxes gives the same boxes for every image, bbox_spec a JSON file of boxes per image,
+# images without boxes are annotated automatically (annotation='auto', tuned by
+# annotate_params, see auto_annotate.py) or by drawing on the first image (annotation='manual').
+# incremental=True keeps earlier output and only rebuilds images that are missing or
+# whose inputs changed (see common/manifest.py, the manifest is kept in build_dir(dataset_path));
+# the seed and boxes of the first run are reused.
+# Per-stage timings (p50/p95 of decode, annotate, filter, biome, composite, encode...) are
+# written to build_dir(dataset_path)/timing.json; profile='run.prof' also runs the parent under cProfile
+def augment(img_path, biome_path, dataset_path, label_path, crop_size=(1980, 1980), angles=[0, 90, 180, 270],
+            workers=1, seed=None, biome_cache_mb=256, backend='pil', label_format='txt', bboxes=None,
+            incremental=False, annotation='auto', bbox_spec=None, annotate_params=None, profile=None):
+    with profiled(profile):
+        _augment(img_path, biome_path, dataset_path, label_path, crop_size, angles, workers, seed, biome_cache_mb,
+                 backend, label_format, bboxes, incremental, annotation, bbox_spec, annotate_params)
+
+def _augment(img_path, biome_path, dataset_path, label_path, crop_size, angles, workers, seed, biome_cache_mb,
+             backend, label_format, bboxes, incremental, annotation, bbox_spec, annotate_params):
+    start = time.perf_counter()
+    stats = StageStats()
+    # Clear old folders and make new ones
+    for path in [dataset_path, label_path]:
+        if os.path.exists(path) and not incremental:
+            shutil.rmtree(path)
+        os.makedirs(path, exist_ok=True)
+
+    # Older runs kept the manifest and timings inside the dataset; full rebuilds start without a manifest
+    manifest_path = os.path.join(build_dir(dataset_path), MANIFEST_FILE)
+    stale = [os.path.join(dataset_path, name) for name in [MANIFEST_FILE, TIMING_FILE]]
+    stale += [] if incremental else [manifest_path]
+    for path in stale:
+        if os.path.exists(path):
+            os.remove(path)
+
+    manifest = None
+    if incremental:
+        manifest = BuildManifest(manifest_path)
+        seed = manifest.settings.get('seed') if seed is None else seed
+        bboxes = manifest.settings.get('bboxes') if bboxes is None else bboxes
+
+    with stats.stage('plan'):
+        jobs, seed = plan_jobs(img_path, biome_path, crop_size, angles, seed, bboxes, annotation, bbox_spec,
+                               biome_cache_mb, backend, annotate_params)
+
+    label_sink = LabelStore(label_path) if label_format == 'store' else LabelSink(label_path)
+    on_saved = None
+    if manifest is not None:
+        if annotation == 'manual' and jobs:
+            bboxes = jobs[0].bboxes if bboxes is None else bboxes
+        manifest.settings.update(seed=seed, bboxes=None if bboxes is None else [list(bbox) for bbox in bboxes])
+        with stats.stage('manifest'):
+            jobs, keys = skip_current(manifest, jobs, label_sink, label_format, label_path)
+            manifest.prune(keys)
+        stats.count('skipped', len(keys) - len(jobs))
+
+        def on_saved(fn):
+            files = [os.path.join(dataset_path, fn + '.png')]
+            if label_format != 'store':
+                files.append(os.path.join(label_path, fn + '.txt'))
+            manifest.record(fn, keys[fn], files)
+
+    num_images = len(jobs)
+    try:
+        with label_sink:
+            if workers > 1:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    futures = [pool.submit(augment_image, job, dataset_path) for job in jobs]
+                    done = (future.result() for future in as_completed(futures))
+                    collect_results(done, num_images, label_sink, on_saved, stats)
+            else:
+                collect_results((augment_image(job, dataset_path) for job in jobs), num_images, label_sink,
+                                on_saved, stats)
+    finally:
+        if manifest is not None:
+            manifest.save()
+
+    seconds = time.perf_counter() - start
+    os.makedirs(build_dir(dataset_path), exist_ok=True)
+    write_timing(os.path.join(build_dir(dataset_path), TIMING_FILE), stats, seconds=round(seconds, 3),
+                 images_per_s=round(num_images / seconds, 3), workers=workers, backend=backend)
+
+# Folder next to the dataset for the files that describe a build
+def build_dir(dataset_path):
+    return os.path.normpath(dataset_path) + BUILD_DIR_SUFFIX
+
+# ImageJob fields left out of the key: where files are read from, how much is cached, and the
+# angle and biome lists (only what the seed draws from them matters, and that is hashed)
+UNHASHED_JOB_FIELDS = {'img_path', 'biome_path', 'biome_cache_bytes', 'angles', 'biomes'}
+
+# Hash of everything an augmented image is made from: every ImageJob field by name (files by
+# content), what the seed picks for it, and the label output. A field added to ImageJob is
+# hashed unless it is listed in UNHASHED_JOB_FIELDS
+def image_key(manifest, job, labels):
+    angle, biome_filename = draw_choices(job.seed, job.angles, job.biomes)
+    fields = {name: value for name, value in job._asdict().items() if name not in UNHASHED_JOB_FIELDS}
+    fields.update(crop_size=list(job.crop_size),
+                  bboxes=None if job.bboxes is None else [list(bbox) for bbox in job.bboxes],
+                  annotate_params=job.annotate_params if job.bboxes is None else None)
+    return manifest.key(**fields, source=manifest.file_hash(os.path.join(job.img_path, job.filename)),
+                        biome=manifest.file_hash(os.path.join(job.biome_path, biome_filename)),
+                        biome_filename=biome_filename, angle=angle,
+                        factor=factor_func(os.path.splitext(job.filename)[0]), labels=labels)
+
+# Drops jobs whose output is up to date, returns the remaining jobs and the key of every image.
+# Labels of skipped images only need rewriting when they all live in one LabelStore
+def skip_current(manifest, jobs, label_sink, label_format, label_path):
+    remaining, keys = [], {}
+    for job in jobs:
+        fn = os.path.splitext(job.filename)[0]
+        keys[fn] = image_key(manifest, job, [label_format, os.path.abspath(label_path)])
+        if not manifest.is_current(fn, keys[fn]):
+            manifest.discard(fn)
+            remaining.append(job)
+        elif label_format == 'store':
+            angle, _ = draw_choices(job.seed, job.angles, job.biomes)
+            bboxes = job.bboxes
+            if bboxes is None:
+                with Image.open(os.path.join(job.img_path, job.filename)) as source:
+                    cropped = crop_array(np.asarray(source.convert('RGB')), job.crop_size)
+                bboxes = image_bboxes(None, cropped, job.annotate_params)
+            label_sink.add(fn, 0, rotated_labels(bboxes, angle, job.crop_size))
+    print(f'{len(jobs) - len(remaining)} of {len(jobs)} images are up to date')
+    return remaining, keys
+
+# Runs an iterator in a background thread, keeping at most `size` items ready
+def prefetch(iterable, size):
+    buffer = queue.Queue(maxsize=max(1, size))
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except Exception as error:
+            put((done, error))
+            return
+        put((done, None))
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+
+# Streams augmented samples instead of writing PNGs: yields (image_array, yolo_labels)
+# in input order, or (name, image_array, yolo_labels) with with_names=True.
+# Up to `prefetch` samples are prepared ahead, by `workers` processes if workers > 1.
+# Jobs come from the same plan_jobs() as augment(), so a streamed sample matches the image augment() would save
+def augment_stream(img_path, biome_path, bboxes=None, crop_size=(1980, 1980), angles=[0, 90, 180, 270],
+                   workers=1, seed=None, biome_cache_mb=256, backend='pil', prefetch_size=4, with_names=False,
+                   annotation='auto', bbox_spec=None, annotate_params=None):
+    jobs, _ = plan_jobs(img_path, biome_path, crop_size, angles, seed, bboxes, annotation, bbox_spec,
+                        biome_cache_mb, backend, annotate_params)
+
+    if workers > 1:
+        samples = _pool_samples(jobs, workers, prefetch_size)
+    else:
+        samples = prefetch((compose_sample(job) for job in jobs), prefetch_size)
+    for fn, image, labels in samples:
+        yield (fn, image, labels) if with_names else (image, labels)
+
+# Keeps at most `in_flight` jobs queued in the pool and yields them in order
+def _pool_samples(jobs, workers, in_flight):
+    pool = ProcessPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for job in jobs:
+            pending.append(pool.submit(compose_sample, job))
+            if len(pending) >= max(in_flight, workers):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
 # Folders — change these to your own
 INPUT_IMAGES_DIR = "path/to/your/input/images"    # Your starting images
 BIOME_IMAGES_DIR = "path/to/your/biome/images"    # Biome overlays
 OUTPUT_DATASET_DIR = "path/to/output/dataset"     # Where new images go
 OUTPUT_LABELS_DIR = "path/to/output/labels"       # Where labels go
+WORKERS = os.cpu_count()                          # Processes used for augmentation
 
 # Start it up
-augment(INPUT_IMAGES_DIR, BIOME_IMAGES_DIR, OUTPUT_DATASET_DIR, OUTPUT_LABELS_DIR)
\ No newline at end of file
+if __name__ == "__main__":
+    augment(INPUT_IMAGES_DIR, BIOME_IMAGES_DIR, OUTPUT_DATASET_DIR, OUTPUT_LABELS_DIR, workers=WORKERS)
\ No newline at end of file
@@ -0,0 +1,131 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cv2
+from PIL import Image
+from array_backend import crop_array
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.boxes import clip_boxes
+
+# Headless annotation of thermal frames.
+# Mines show up as blobs whose temperature differs from the soil around them, so
+# every pixel is scored against the frame's median with a robust z-score, the
+# outliers are thresholded and each connected blob becomes one box.
+# Box spec files (JSON, {"image.png": [[x1, y1, x2, y2], ...], "*": [...]}) use the
+# same pixel coordinates as draw_bboxes and override the automatic boxes.
+
+DEFAULT_PARAMS = {
+    'signal': 'gray',            # 'gray' for intensity images, 'hue' for rainbow colour maps
+    'polarity': 'both',          # 'hot', 'cold' or 'both'
+    'threshold': 4.0,            # Robust z-score a pixel needs to count as a signature
+    'min_area': 50,              # Smallest blob in pixels
+    'max_area_fraction': 0.05,   # Biggest blob as a part of the frame
+    'open_size': 3,              # Morphological opening that removes speckle
+    'padding': 2,                # Pixels added around every box
+}
+
+
+# Scalar map of an RGB(A) frame used for thresholding
+def signal_map(image, signal='gray'):
+    rgb = np.ascontiguousarray(image[..., :3])
+    if signal == 'hue':
+        return cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV_FULL)[..., 0].astype(np.float32)
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY).astype(np.float32)
+
+
+# Pixels that stand out from the background; median and MAD come from a subsample
+def signature_mask(values, threshold=4.0, polarity='both', sample_step=4):
+    sample = values[::sample_step, ::sample_step]
+    median = np.median(sample)
+    spread = np.median(np.abs(sample - median)) * 1.4826
+    z = (values - median) / max(spread, 1.0)
+    if polarity == 'hot':
+        mask = z > threshold
+    elif polarity == 'cold':
+        mask = z < -threshold
+    else:
+        mask = np.abs(z) > threshold
+    return mask.astype(np.uint8)
+
+
+# Finds mine signatures in one frame, returns (N, 4) xyxy boxes in pixels
+def find_hotspots(image, signal='gray', polarity='both', threshold=4.0, min_area=50, max_area_fraction=0.05,
+                  open_size=3, padding=2):
+    image = np.asarray(image)
+    height, width = image.shape[:2]
+    mask = signature_mask(signal_map(image, signal), threshold, polarity)
+    if open_size > 1:
+        kernel = np.ones((open_size, open_size), np.uint8)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+
+    _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    stats = stats[1:]
+    areas = stats[:, cv2.CC_STAT_AREA]
+    stats = stats[(areas >= min_area) & (areas <= max_area_fraction * width * height)]
+
+    x, y = stats[:, cv2.CC_STAT_LEFT], stats[:, cv2.CC_STAT_TOP]
+    boxes = np.stack([x - padding, y - padding,
+                      x + stats[:, cv2.CC_STAT_WIDTH] + padding,
+                      y + stats[:, cv2.CC_STAT_HEIGHT] + padding], axis=1)
+    return clip_boxes(boxes, width, height)
+
+
+# Reads a box spec file
+def load_bbox_spec(path):
+    with open(path) as spec_file:
+        return {name: [tuple(box) for box in boxes] for name, boxes in json.load(spec_file).items()}
+
+
+# Boxes for a file from a spec: its own entry, then the "*" entry, else None
+def spec_bboxes(spec, filename):
+    if not spec:
+        return None
+    return spec.get(filename, spec.get('*'))
+
+
+# Annotates the centre crop of one file, the same crop the augmentation uses
+def annotate_file(path, crop_size=(1980, 1980), params=None):
+    with Image.open(path) as img:
+        image = np.asarray(img.convert('RGB'))
+    return find_hotspots(crop_array(image, crop_size), **{**DEFAULT_PARAMS, **(params or {})})
+
+
+# Annotates every image of a folder, spec entries win over detections
+def annotate_batch(img_path, crop_size=(1980, 1980), params=None, spec=None, workers=1):
+    filenames = sorted(os.listdir(img_path))
+    todo = [fn for fn in filenames if spec_bboxes(spec, fn) is None]
+    paths = [os.path.join(img_path, fn) for fn in todo]
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            found = list(pool.map(annotate_file, paths, [crop_size] * len(paths), [params] * len(paths)))
+    else:
+        found = [annotate_file(path, crop_size, params) for path in paths]
+
+    result = {fn: [tuple(box) for box in spec_bboxes(spec, fn)] for fn in filenames if fn not in todo}
+    result.update({fn: [tuple(box) for box in boxes.tolist()] for fn, boxes in zip(todo, found)})
+    return {fn: result[fn] for fn in filenames}
+
+
+# python auto_annotate.py <images> <spec.json>: writes the boxes so they can be checked or edited
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find mine signatures in thermal frames")
+    parser.add_argument("img_path")
+    parser.add_argument("output")
+    parser.add_argument("--crop", type=int, nargs=2, default=[1980, 1980])
+    parser.add_argument("--spec", default=None, help="Existing box spec that overrides detections")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    for name, value in DEFAULT_PARAMS.items():
+        parser.add_argument(f"--{name}", type=type(value), default=value)
+    args = parser.parse_args()
+
+    params = {name: getattr(args, name) for name in DEFAULT_PARAMS}
+    spec = load_bbox_spec(args.spec) if args.spec else None
+    boxes = annotate_batch(args.img_path, tuple(args.crop), params, spec, args.workers)
+    with open(args.output, 'w') as output_file:
+        json.dump({fn: [list(box) for box in b] for fn, b in boxes.items()}, output_file, indent=1)
+    print(f"Annotated {len(boxes)} images, {sum(len(b) for b in boxes.values())} boxes")
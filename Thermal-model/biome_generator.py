@@ -0,0 +1,145 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cv2
+
+# Procedural grass overlays, a CPU alternative to the Blender renders of grass-augmentation.py.
+# An overlay is an RGBA image with a transparent background, the same kind of PNG
+# augment() reads from the biome folder. Four layers of blades are drawn back to front;
+# their densities are drawn from the same ranges as the four "Distribute On Faces"
+# node groups of the Blender scene, and multi-octave noise makes the grass patchy.
+# Every overlay comes from its own seed, so a (seed, index) pair always gives the same image.
+
+# Per layer: density range (as in grass-augmentation.py), blades per unit of density on a
+# 1920 px overlay, blade length and width in px, blades per clump, brightness
+LAYERS = [
+    {'density': (1, 15), 'blades': 60, 'length': (60, 140), 'width': (5, 9), 'clump': 6, 'shade': 0.55},    # Distribute On Faces
+    {'density': (10, 15), 'blades': 80, 'length': (40, 90), 'width': (4, 7), 'clump': 4, 'shade': 0.7},      # .001
+    {'density': (50, 75), 'blades': 60, 'length': (15, 40), 'width': (2, 4), 'clump': 1, 'shade': 0.85},     # .002
+    {'density': (15, 25), 'blades': 40, 'length': (25, 60), 'width': (3, 5), 'clump': 3, 'shade': 1.0},      # .003
+]
+
+BASE_COLOR = np.array([90, 150, 60])   # RGB of a mid-tone blade
+SHADES = 8                             # Colour steps; blades of one step are drawn in one call
+POINTS = 6                             # Points along each blade edge
+NOISE_SCALE = 8                        # Noise is only sampled at blade roots, so a coarse map is enough
+
+
+# Multi-octave value noise in [0, 1]: random grids of growing resolution, upscaled and summed
+def value_noise(size, rng, octaves=4, base_cells=4, persistence=0.5):
+    width, height = size
+    noise = np.zeros((height, width), dtype=np.float32)
+    amplitude, total = 1.0, 0.0
+    for octave in range(octaves):
+        cells = base_cells * 2 ** octave
+        grid = rng.random((cells + 1, cells + 1), dtype=np.float32)
+        noise += amplitude * cv2.resize(grid, (width, height), interpolation=cv2.INTER_CUBIC)
+        total += amplitude
+        amplitude *= persistence
+    noise /= total
+    return np.clip((noise - noise.min()) / max(float(noise.max() - noise.min()), 1e-6), 0, 1)
+
+
+# Noise value at (N, 2) pixel positions of the full-size overlay
+def sample_noise(noise, points):
+    height, width = noise.shape
+    x = np.clip((points[:, 0] / NOISE_SCALE).astype(int), 0, width - 1)
+    y = np.clip((points[:, 1] / NOISE_SCALE).astype(int), 0, height - 1)
+    return noise[y, x]
+
+
+# Blade roots: clump centres spread where the noise is high, blades scattered around them
+def blade_roots(count, clump, noise, size, rng, spread=12.0):
+    clumps = max(1, count // clump)
+    # Rejection against the noise makes dense and sparse patches
+    candidates = rng.random((clumps * 4, 2)) * size
+    keep = sample_noise(noise, candidates) > rng.random(len(candidates))
+    centres = candidates[keep][:clumps]
+    roots = np.repeat(centres, clump, axis=0)
+    if clump > 1:
+        roots += rng.normal(0, spread, roots.shape)
+    return roots
+
+
+# Tapered, bent blades seen from above as (N, 2 * POINTS, 2) polygons
+def blade_polygons(roots, rng, length, width):
+    n = len(roots)
+    t = np.linspace(0, 1, POINTS)
+    angle = rng.uniform(0, 2 * np.pi, n)[:, None]
+    bend = rng.uniform(-0.6, 0.6, n)[:, None]
+    lengths = rng.uniform(*length, n)[:, None]
+    widths = rng.uniform(*width, n)[:, None]
+
+    heading = angle + bend * t                                  # the blade curves along its length
+    step = lengths / (POINTS - 1)
+    x = roots[:, :1] + np.cumsum(np.cos(heading) * step, axis=1) - np.cos(heading[:, :1]) * step
+    y = roots[:, 1:] + np.cumsum(np.sin(heading) * step, axis=1) - np.sin(heading[:, :1]) * step
+    half = widths * (1 - t) / 2 + 0.5                          # tapered to a point
+    nx, ny = -np.sin(heading) * half, np.cos(heading) * half
+    left = np.stack([x + nx, y + ny], axis=2)
+    right = np.stack([x - nx, y - ny], axis=2)[:, ::-1]
+    return np.concatenate([left, right], axis=1)
+
+
+# One RGBA overlay as an HxWx4 uint8 array. densities=None draws them from LAYERS
+def make_biome(seed, size=(1920, 1920), densities=None):
+    rng = np.random.default_rng(seed)
+    width, height = size
+    scale = width * height / 1920 ** 2
+    canvas = np.zeros((height, width, 4), dtype=np.uint8)
+    noise_size = (max(1, width // NOISE_SCALE), max(1, height // NOISE_SCALE))
+    patches = value_noise(noise_size, rng)
+    tint = value_noise(noise_size, rng, octaves=3, base_cells=2)
+
+    for i, layer in enumerate(LAYERS):
+        density = densities[i] if densities is not None else rng.integers(layer['density'][0],
+                                                                          layer['density'][1] + 1)
+        count = int(density * layer['blades'] * scale)
+        if count == 0:
+            continue
+        roots = blade_roots(count, layer['clump'], patches, size, rng)
+        polygons = np.round(blade_polygons(roots, rng, layer['length'], layer['width']) * 4).astype(np.int32)
+
+        # Brightness per blade from the layer shade, the tint noise and a little jitter
+        brightness = layer['shade'] * (0.75 + 0.5 * sample_noise(tint, roots)) * rng.uniform(0.85, 1.15, len(roots))
+        steps = np.clip((brightness / 1.5 * SHADES).astype(int), 0, SHADES - 1)
+        for step in np.unique(steps):
+            color = np.clip(BASE_COLOR * (step + 0.5) / SHADES * 1.5, 0, 255)
+            cv2.fillPoly(canvas, list(polygons[steps == step]), (*color.tolist(), 255), cv2.LINE_AA, shift=2)
+    return canvas
+
+
+# Writes overlay `index` of a run; PNG compression 1 keeps encoding fast
+def write_biome(output_dir, seed, index, size=(1920, 1920)):
+    biome = make_biome([seed, index], size)
+    path = os.path.join(output_dir, f'biome_{index:05d}.png')
+    cv2.imwrite(path, cv2.cvtColor(biome, cv2.COLOR_RGBA2BGRA), [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    return path
+
+
+# Generates count overlays into output_dir (the BIOME_IMAGES_DIR of augmentation.py)
+def generate_biomes(output_dir, count, seed=0, size=(1920, 1920), workers=1):
+    os.makedirs(output_dir, exist_ok=True)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(write_biome, [output_dir] * count, [seed] * count, range(count),
+                                 [size] * count, chunksize=8))
+    return [write_biome(output_dir, seed, index, size) for index in range(count)]
+
+
+# python biome_generator.py <output_dir> --count 1000 --seed 0
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate procedural grass overlays for augment()")
+    parser.add_argument("output_dir")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--size", type=int, nargs=2, default=[1920, 1920])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    paths = generate_biomes(args.output_dir, args.count, args.seed, tuple(args.size), args.workers)
+    seconds = time.perf_counter() - start
+    print(f"Generated {len(paths)} overlays in {seconds:.1f} s ({len(paths) / seconds * 60:.0f} per minute)")
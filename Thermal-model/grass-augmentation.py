@@ -1,5 +1,6 @@
 import bpy
 import random 
+import sys
 
 # Render settings
 render = bpy.context.scene.render
@@ -8,32 +9,34 @@ render.resolution_x = 1920  # Set resolution width to 1920px
 render.resolution_y = 1920  # Set resolution height to 1920px
 
 
+# Density ranges of the grass node groups (biome_generator.py draws from the same ranges)
+DENSITY_RANGES = {
+    "Distribute On Faces": (1, 15),
+    "Distribute On Faces.001": (10, 15),
+    "Distribute On Faces.002": (50, 75),
+    "Distribute On Faces.003": (15, 25),
+}
+
+
 # Function to generate images with randomized grass settings
-def generate_image(frame_number, output_dir="D:/blender_tm/grass/"):
+def generate_image(frame_number, output_dir="D:/blender_tm/grass/", rng=random):
     """
     Generate a single image with randomized grass seed and density.
 
     Args:
         frame_number (int): The frame number to set and use in the filename.
         output_dir (str): Directory where the rendered image will be saved.
+        rng (random.Random): Source of the random seeds and densities.
     """
     # Set the current frame
     bpy.context.scene.frame_set(frame_number)
 
-    # Random seed for grass distribution
-    bpy.data.node_groups["Distribute On Faces.001"].nodes["effect"].inputs[5].default_value = random.randint(-1000,
-                                                                                                             1000)
-    bpy.data.node_groups["Distribute On Faces.002"].nodes["effect"].inputs[5].default_value = random.randint(-1000,
-                                                                                                             1000)
-    bpy.data.node_groups["Distribute On Faces.003"].nodes["effect"].inputs[5].default_value = random.randint(-1000,
-                                                                                                             1000)
-    bpy.data.node_groups["Distribute On Faces"].nodes["effect"].inputs[5].default_value = random.randint(-1000, 1000)
-
-    # Random density for grass
-    bpy.data.node_groups["Distribute On Faces"].nodes["effect"].inputs[3].default_value = random.randint(1, 15)
-    bpy.data.node_groups["Distribute On Faces.001"].nodes["effect"].inputs[3].default_value = random.randint(10, 15)
-    bpy.data.node_groups["Distribute On Faces.002"].nodes["effect"].inputs[3].default_value = random.randint(50, 75)
-    bpy.data.node_groups["Distribute On Faces.003"].nodes["effect"].inputs[3].default_value = random.randint(15, 25)
+    for group, (low, high) in DENSITY_RANGES.items():
+        effect = bpy.data.node_groups[group].nodes["effect"]
+        # Random seed for grass distribution
+        effect.inputs[5].default_value = rng.randint(-1000, 1000)
+        # Random density for grass
+        effect.inputs[3].default_value = rng.randint(low, high)
 
     # Set the output filepath for the rendered image
     render.filepath = f"{output_dir}image_{frame_number}.png"
@@ -41,7 +44,21 @@ def generate_image(frame_number, output_dir="D:/blender_tm/grass/"):
     bpy.ops.render.render(write_still=True)
 
 
-# Generate 3 images
+# Renders count images; with a seed every image gets its own fixed settings, so a
+# batch can be split over several Blender processes with different start values
+def render_batch(count, output_dir, seed=None, start=0):
+    for frame_number in range(start, start + count):
+        rng = random.Random(f'{seed}-{frame_number}') if seed is not None else random
+        generate_image(frame_number, output_dir, rng)
+
+
 output_directory = "D:/blender_tm/grass/"  # Change this to your preferred output directory
-for frame_number in range(3):
-    generate_image(frame_number, output_directory)
+if "--" in sys.argv:
+    # Batch mode: blender grass.blend -b -P grass-augmentation.py -- --count 200 --output_dir out/ --seed 1
+    args = sys.argv[sys.argv.index("--") + 1:]
+    arg_dict = dict(zip(args[::2], args[1::2]))
+    render_batch(int(arg_dict.get("--count", 3)), arg_dict.get("--output_dir", output_directory),
+                 int(arg_dict["--seed"]) if "--seed" in arg_dict else None, int(arg_dict.get("--start", 0)))
+else:
+    # Generate 3 images
+    render_batch(3, output_directory)
@@ -0,0 +1 @@
+# Performance benchmarks for the dataset and inference hot paths
@@ -0,0 +1,253 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import cv2
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'RGB-model'))
+sys.path.append(os.path.join(ROOT, 'Thermal-model'))
+
+from projection import transform_points, view_bounds_2d, view_bounds_2d_batch
+from augmentation import augment
+from biome_generator import make_biome
+from common.boxes import frame_bounds_to_xywh, xywh_to_yolo
+from common.labels import LabelSink, LabelStore
+from inference.detectors import StubDetector
+from inference.video import run_pipeline
+
+# CPU-only benchmarks of the hot paths. Every benchmark is timed `repeat` times (median
+# reported), then run once more under tracemalloc for its peak memory. The report is JSON;
+# with a baseline report, slowdowns beyond the tolerance are listed as regressions.
+#   python -m benchmarks.run --output report.json --baseline benchmarks/baseline.json
+#   python -m benchmarks.run --save_baseline benchmarks/baseline.json
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+# Benchmark factories: each takes (workdir, quick) and returns a list of
+# (name, function, items, unit); setup happens here, only the function is timed
+SUITES = []
+
+
+def suite(func):
+    SUITES.append(func)
+    return func
+
+
+# A camera looking down -Z with a 60 degree FOV, frame as render_and_label.py passes it
+def camera_setup():
+    half = np.tan(np.deg2rad(30))
+    frame = np.array([[half, half, 1.0], [half, -half, 1.0], [-half, -half, 1.0]])
+    matrix = np.eye(4)
+    matrix[2, 3] = -10.0
+    return frame, matrix
+
+
+# Sphere-like mesh with `count` vertices around a point
+def synthetic_mesh(count, center, rng):
+    directions = rng.normal(size=(count, 3))
+    return center + directions / np.linalg.norm(directions, axis=1, keepdims=True) * 0.1
+
+
+@suite
+def projection_suite(workdir, quick):
+    rng = np.random.default_rng(0)
+    frame, matrix = camera_setup()
+    cases = []
+    # view_bounds_2d: one object per call
+    for count in ([1000, 10000] if quick else [1000, 10000, 100000, 1000000]):
+        co = synthetic_mesh(count, [0.5, -0.3, 0.0], rng)
+
+        def run(co=co):
+            bounds = view_bounds_2d(transform_points(co, matrix), frame)
+            return frame_bounds_to_xywh([bounds], 1920, 1920)
+        cases.append((f'view_bounds_2d/{count}_vertices', run, count, 'vertices'))
+
+    # view_bounds_2d_batch: the projection step of FrameLabeler.label_frame, every mine of a scene in one batch
+    mines = 60 if quick else 2000
+    meshes = [synthetic_mesh(500, rng.uniform(-5, 5, 3) * [1, 1, 0], rng) for _ in range(mines)]
+    co = np.concatenate(meshes)
+    offsets = np.arange(mines) * 500
+
+    def run_batch():
+        bounds = view_bounds_2d_batch(transform_points(co, matrix), offsets, frame)
+        return xywh_to_yolo(frame_bounds_to_xywh(bounds, 1920, 1920), 1920, 1920)
+    cases.append((f'view_bounds_batch/{mines}_mines', run_batch, mines, 'mines'))
+    return cases
+
+
+# Thermal-like 2100 px frames with a few warm blobs, and procedural biome overlays
+def augment_inputs(workdir, images, size=2100):
+    rng = np.random.default_rng(0)
+    img_dir, biome_dir = os.path.join(workdir, 'thermal'), os.path.join(workdir, 'biomes')
+    os.makedirs(img_dir, exist_ok=True)
+    os.makedirs(biome_dir, exist_ok=True)
+    for i in range(images):
+        img = cv2.GaussianBlur(rng.normal(100, 8, (size, size)).astype(np.float32), (0, 0), 3)
+        for x, y in rng.uniform(200, size - 200, (4, 2)).astype(int):
+            cv2.circle(img, (int(x), int(y)), 30, 160.0, -1)
+        Image.fromarray(np.clip(img, 0, 255).astype(np.uint8)).convert('RGB').save(
+            os.path.join(img_dir, f'thermal_{i + 1}.png'))
+    for i in range(2):
+        Image.fromarray(make_biome([0, i])).save(os.path.join(biome_dir, f'biome_{i}.png'))
+    return img_dir, biome_dir
+
+
+@suite
+def augment_suite(workdir, quick):
+    images = 2 if quick else 6
+    img_dir, biome_dir = augment_inputs(workdir, images)
+    out_dir = os.path.join(workdir, 'augmented')
+    cases = []
+    for backend in ['pil', 'numpy']:
+        for annotation, bboxes in [('given_boxes', [(100, 100, 200, 200), (900, 900, 1000, 1000)]), ('auto', None)]:
+            def run(backend=backend, bboxes=bboxes):
+                augment(img_dir, biome_dir, os.path.join(out_dir, 'images'), os.path.join(out_dir, 'labels'),
+                        crop_size=(1980, 1980), seed=0, backend=backend, bboxes=bboxes)
+            cases.append((f'augment_1980/{backend}/{annotation}', run, images, 'images'))
+    return cases
+
+
+@suite
+def label_suite(workdir, quick):
+    rng = np.random.default_rng(0)
+    images = 500 if quick else 5000
+    boxes = [rng.uniform(0, 1, (5, 4)) for _ in range(images)]
+    classes = [rng.integers(0, 8, 5) for _ in range(images)]
+    names = [f'frame_{i:05d}' for i in range(images)]
+    label_dir = os.path.join(workdir, 'labels')
+
+    def sink():
+        with LabelSink(os.path.join(label_dir, 'txt')) as labels:
+            for name, c, b in zip(names, classes, boxes):
+                labels.add(name, c, b)
+
+    def store():
+        with LabelStore(os.path.join(label_dir, 'store')) as labels:
+            for name, c, b in zip(names, classes, boxes):
+                labels.add(name, c, b)
+
+    def export():
+        LabelStore.load(os.path.join(label_dir, 'store')).export_yolo(os.path.join(label_dir, 'exported'))
+
+    return [('labels/LabelSink', sink, images, 'images'), ('labels/LabelStore', store, images, 'images'),
+            ('labels/LabelStore.export_yolo', export, images, 'images')]
+
+
+@suite
+def video_suite(workdir, quick):
+    frames = [np.full((720, 1280, 3), i % 255, dtype=np.uint8) for i in range(30 if quick else 120)]
+    encoded = []
+    cases = []
+    for batch_size, infer_every in [(1, 1), (4, 1), (1, 2)]:
+        def run(batch_size=batch_size, infer_every=infer_every):
+            # Stub model: 10 ms per call + 2 ms per frame, like a small model on a slow CPU
+            detector = StubDetector(latency=0.01, per_frame=0.002)
+            encode = lambda frame, detections: encoded.append(cv2.imencode('.jpg', frame)[1])
+            run_pipeline(iter(frames), detector, encode, batch_size=batch_size, infer_every=infer_every)
+            encoded.clear()
+        cases.append((f'video/batch{batch_size}_every{infer_every}', run, len(frames), 'frames'))
+    return cases
+
+
+# Median-ready run times and the peak of Python/NumPy allocations (tracemalloc doesn't see
+# memory PIL or OpenCV allocate internally; max_rss_mb in the report covers the whole process)
+def measure(func, repeat):
+    with contextlib.redirect_stdout(io.StringIO()):
+        func()                                  # warm-up (imports, caches, first allocations)
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return times, peak
+
+
+def run_benchmarks(quick=False, repeat=3, only=None):
+    results = {}
+    workdir = tempfile.mkdtemp(prefix='mineguard_bench_')
+    try:
+        for make_cases in SUITES:
+            for name, func, items, unit in make_cases(workdir, quick):
+                if only and not any(part in name for part in only):
+                    continue
+                times, peak = measure(func, repeat)
+                median = float(np.median(times))
+                results[name] = {'median_s': round(median, 6), 'min_s': round(min(times), 6), 'items': items,
+                                 'unit': unit, 'throughput': round(items / median, 2) if median > 0 else None,
+                                 'peak_traced_mb': round(peak / 2 ** 20, 2)}
+                print(f"{name:45s} {median * 1000:10.2f} ms  {results[name]['throughput']:>12} {unit}/s  "
+                      f"{results[name]['peak_traced_mb']:8.1f} MB", flush=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'quick': quick, 'repeat': repeat,
+            'machine': {'platform': platform.platform(), 'processor': platform.processor(),
+                        'cpus': os.cpu_count(), 'python': platform.python_version(), 'numpy': np.__version__,
+                        'opencv': cv2.__version__},
+            'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            'results': results}
+
+
+# Ratio current / baseline median time per benchmark; above 1 + tolerance is a regression
+def compare(report, baseline, tolerance=0.2):
+    comparison = {}
+    for name, result in report['results'].items():
+        old = baseline.get('results', {}).get(name)
+        if not old:
+            continue
+        ratio = result['median_s'] / old['median_s'] if old['median_s'] else None
+        comparison[name] = {'baseline_s': old['median_s'], 'current_s': result['median_s'],
+                            'ratio': round(ratio, 3) if ratio is not None else None,
+                            'regression': ratio is not None and ratio > 1 + tolerance}
+    return comparison
+
+
+# python -m benchmarks.run [--quick] [--only augment video] [--output report.json]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the MineGuard CPU benchmarks")
+    parser.add_argument("--output", default=None, help="Where to write the JSON report")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Report to compare against")
+    parser.add_argument("--save_baseline", default=None, help="Also write the report as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before a regression")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--quick", action="store_true", help="Smaller inputs for a fast check")
+    parser.add_argument("--only", nargs='*', default=None, help="Run benchmarks whose name contains one of these")
+    parser.add_argument("--fail_on_regression", action="store_true")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.quick, args.repeat, args.only)
+    regressions = []
+    if args.baseline and os.path.isfile(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get('quick') != args.quick:
+            print("Baseline was made with a different --quick setting, skipping the comparison")
+        else:
+            report['comparison'] = compare(report, baseline, args.tolerance)
+            regressions = [name for name, c in report['comparison'].items() if c['regression']]
+            for name, c in report['comparison'].items():
+                print(f"{name:45s} x{c['ratio']}{'  REGRESSION' if c['regression'] else ''}")
+
+    for path in [args.output, args.save_baseline]:
+        if path:
+            with open(path, 'w') as report_file:
+                json.dump(report, report_file, indent=1)
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
@@ -0,0 +1 @@
+# Code shared by the RGB and thermal pipelines
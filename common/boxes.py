@@ -0,0 +1,145 @@
+import numpy as np
+
+# Bounding box math shared by the RGB and thermal pipelines.
+# Every function takes and returns (N, 4) float arrays, one box per row:
+#   xyxy - x_min, y_min, x_max, y_max in pixels
+#   xywh - x_min, y_min, width, height in pixels
+#   yolo - x_center, y_center, width, height scaled to 0-1 (YOLO label format)
+
+
+# Makes sure boxes is an (N, 4) float array
+def as_boxes(boxes):
+    return np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+
+# Changes box format to x, y, width, height (corners may come in any order)
+def xyxy_to_xywh(boxes):
+    boxes = as_boxes(boxes)
+    x_min = np.minimum(boxes[:, 0], boxes[:, 2])
+    y_min = np.minimum(boxes[:, 1], boxes[:, 3])
+    w = np.abs(boxes[:, 2] - boxes[:, 0])
+    h = np.abs(boxes[:, 3] - boxes[:, 1])
+    return np.stack([x_min, y_min, w, h], axis=1)
+
+
+def xywh_to_xyxy(boxes):
+    boxes = as_boxes(boxes)
+    return np.concatenate([boxes[:, :2], boxes[:, :2] + boxes[:, 2:]], axis=1)
+
+
+# Scales x, y, width, height boxes to YOLO centre format
+def xywh_to_yolo(boxes, width, height):
+    boxes = as_boxes(boxes)
+    scale = np.array([width, height, width, height], dtype=np.float64)
+    centers = boxes[:, :2] + boxes[:, 2:] / 2
+    return np.concatenate([centers, boxes[:, 2:]], axis=1) / scale
+
+
+def yolo_to_xywh(boxes, width, height):
+    boxes = as_boxes(boxes) * np.array([width, height, width, height], dtype=np.float64)
+    return np.concatenate([boxes[:, :2] - boxes[:, 2:] / 2, boxes[:, 2:]], axis=1)
+
+
+def xyxy_to_yolo(boxes, width, height):
+    return xywh_to_yolo(xyxy_to_xywh(boxes), width, height)
+
+
+def yolo_to_xyxy(boxes, width, height):
+    return xywh_to_xyxy(yolo_to_xywh(boxes, width, height))
+
+
+# Corners of every box as an (N, 4, 2) array
+def box_corners(boxes):
+    x1, y1, x2, y2 = as_boxes(boxes).T
+    return np.stack([np.stack([x1, y1], 1), np.stack([x2, y1], 1),
+                     np.stack([x2, y2], 1), np.stack([x1, y2], 1)], axis=1)
+
+
+# Rotates boxes around center like PIL Image.rotate (counter-clockwise, y axis down).
+# All four corners are rotated and the axis-aligned envelope is returned;
+# new_center moves the result, e.g. to the centre of an expanded image.
+def rotate_boxes(boxes, angle, center, new_center=None):
+    corners = box_corners(boxes) - np.asarray(center, dtype=np.float64)
+    if angle % 90 == 0:
+        # Exact values keep right-angle rotations free of rounding noise
+        cos, sin = [(1, 0), (0, 1), (-1, 0), (0, -1)][int(angle // 90) % 4]
+    else:
+        radians = np.deg2rad(angle)
+        cos, sin = np.cos(radians), np.sin(radians)
+    cx, cy = center if new_center is None else new_center
+    x = corners[..., 0] * cos + corners[..., 1] * sin + cx
+    y = -corners[..., 0] * sin + corners[..., 1] * cos + cy
+    return np.stack([x.min(axis=1), y.min(axis=1), x.max(axis=1), y.max(axis=1)], axis=1)
+
+
+# Keeps xyxy boxes inside a width x height image
+def clip_boxes(boxes, width, height):
+    boxes = as_boxes(boxes).copy()
+    boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, width)
+    boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, height)
+    return boxes
+
+
+def box_areas(boxes):
+    boxes = as_boxes(boxes)
+    return np.abs(boxes[:, 2] - boxes[:, 0]) * np.abs(boxes[:, 3] - boxes[:, 1])
+
+
+# Drops zero-area xyxy boxes; extra arrays (classes, scores...) are filtered the same way
+def drop_empty(boxes, *others, min_area=0.0):
+    boxes = as_boxes(boxes)
+    keep = box_areas(boxes) > min_area
+    if not others:
+        return boxes[keep]
+    return (boxes[keep],) + tuple(np.asarray(other)[keep] for other in others)
+
+
+# IoU of every box in a with every box in b, an (N, M) array
+def box_iou(a, b):
+    a, b = as_boxes(a), as_boxes(b)
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    union = box_areas(a)[:, None] + box_areas(b)[None, :] - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+# Class offset for class-aware NMS (ultralytics max_wh): larger than any frame side in pixels
+MAX_WH = 7680
+
+
+# Greedy non-maximum suppression on xyxy boxes; returns the kept indices, best first.
+# With classes, boxes only suppress boxes of their own class; max_keep stops after that many boxes
+def nms(boxes, scores, iou_threshold=0.5, classes=None, max_keep=None):
+    boxes = as_boxes(boxes)
+    if classes is not None and len(boxes):
+        # Shifting every class to its own region keeps classes from overlapping,
+        # whatever the sign of the coordinates, as long as boxes span less than MAX_WH
+        boxes = boxes + (np.asarray(classes, dtype=np.float64) * MAX_WH)[:, None]
+    order = np.argsort(-np.asarray(scores), kind='stable')
+    keep = []
+    while len(order) and (max_keep is None or len(keep) < max_keep):
+        best = order[0]
+        keep.append(best)
+        iou = box_iou(boxes[best], boxes[order[1:]])[0]
+        order = order[1:][iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+# Normalized camera-frame bounds (min_x, min_y, max_x, max_y, y up) to rounded pixel
+# xywh boxes with y down; boxes that round to zero size become all zeros
+def frame_bounds_to_xywh(bounds, dim_x, dim_y):
+    bounds = as_boxes(bounds)
+    xywh = np.round(np.stack([bounds[:, 0] * dim_x,
+                              dim_y - bounds[:, 3] * dim_y,
+                              (bounds[:, 2] - bounds[:, 0]) * dim_x,
+                              (bounds[:, 3] - bounds[:, 1]) * dim_y], axis=1))
+    xywh[(xywh[:, 2] == 0) | (xywh[:, 3] == 0)] = 0
+    return xywh
+
+
+# YOLO label lines ("class x y w h") for a set of boxes
+def yolo_lines(classes, boxes):
+    boxes = as_boxes(boxes)
+    classes = np.broadcast_to(np.asarray(classes), (len(boxes),))
+    return ''.join(f"{int(c)} {x} {y} {w} {h}\n" for c, (x, y, w, h) in zip(classes.tolist(), boxes.tolist()))
@@ -0,0 +1,149 @@
+import argparse
+import json
+import os
+import numpy as np
+
+from common.boxes import as_boxes, yolo_lines
+
+# Label outputs shared by the RGB and thermal pipelines.
+# Both sinks take whole images: add(name, classes, yolo_boxes), then close().
+#   LabelSink  - YOLO txt files, one per image, each written exactly once
+#   LabelStore - every label in one (N, 6) array + offsets index, saved as .npy
+
+
+# Buffers labels per image and writes each <name>.txt in one go
+class LabelSink:
+    def __init__(self, label_dir, max_pending=256):
+        self.label_dir = label_dir
+        self.max_pending = max_pending
+        self.pending = {}
+        os.makedirs(label_dir, exist_ok=True)
+
+    def add(self, name, classes, boxes):
+        self.pending[name] = self.pending.get(name, '') + yolo_lines(classes, boxes)
+        if len(self.pending) >= self.max_pending:
+            self.flush()
+
+    def flush(self):
+        for name, text in self.pending.items():
+            with open(os.path.join(self.label_dir, name + '.txt'), 'w') as label_file:
+                label_file.write(text)
+        self.pending = {}
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# All labels of a dataset in one contiguous array.
+# rows[i] = (image_id, class, cx, cy, w, h); labels of image k are rows[offsets[k]:offsets[k + 1]]
+class LabelStore:
+    ROWS_FILE = 'rows.npy'
+    OFFSETS_FILE = 'offsets.npy'
+    NAMES_FILE = 'names.json'
+
+    def __init__(self, path=None, rows=None, offsets=None, names=None):
+        self.path = path
+        self.names = list(names or [])
+        self.rows = rows if rows is not None else np.zeros((0, 6), dtype=np.float32)
+        self.offsets = offsets if offsets is not None else np.zeros(1, dtype=np.int64)
+        self.chunks = []
+
+    # Appends one image; all labels of an image must be added in one call
+    def add(self, name, classes, boxes):
+        boxes = as_boxes(boxes)
+        chunk = np.empty((len(boxes), 6), dtype=np.float32)
+        chunk[:, 0] = len(self.names)
+        chunk[:, 1] = classes
+        chunk[:, 2:] = boxes
+        self.names.append(name)
+        self.chunks.append(chunk)
+
+    # Folds added images into rows/offsets
+    def compact(self):
+        if not self.chunks:
+            return
+        sizes = [len(chunk) for chunk in self.chunks]
+        self.rows = np.concatenate([np.asarray(self.rows)] + self.chunks)
+        self.offsets = np.concatenate([np.asarray(self.offsets), self.offsets[-1] + np.cumsum(sizes)])
+        self.chunks = []
+
+    def __len__(self):
+        return len(self.names)
+
+    # Labels of image i as (classes, yolo_boxes)
+    def labels(self, i):
+        self.compact()
+        rows = self.rows[self.offsets[i]:self.offsets[i + 1]]
+        return rows[:, 1].astype(int), rows[:, 2:]
+
+    def save(self, path=None):
+        path = path or self.path
+        self.compact()
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, self.ROWS_FILE), np.asarray(self.rows, dtype=np.float32))
+        np.save(os.path.join(path, self.OFFSETS_FILE), np.asarray(self.offsets, dtype=np.int64))
+        with open(os.path.join(path, self.NAMES_FILE), 'w') as names_file:
+            json.dump(self.names, names_file)
+
+    def close(self):
+        if self.path:
+            self.save()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Opens a saved store; mmap=True maps the arrays instead of reading them
+    @classmethod
+    def load(cls, path, mmap=True):
+        mmap_mode = 'r' if mmap else None
+        rows = np.load(os.path.join(path, cls.ROWS_FILE), mmap_mode=mmap_mode)
+        offsets = np.load(os.path.join(path, cls.OFFSETS_FILE), mmap_mode=mmap_mode)
+        with open(os.path.join(path, cls.NAMES_FILE)) as names_file:
+            names = json.load(names_file)
+        return cls(path, rows, offsets, names)
+
+    # Writes <label_dir>/<name>.txt for every image, the layout YOLOv8 reads next to images/
+    def export_yolo(self, label_dir, precision=6):
+        self.compact()
+        os.makedirs(label_dir, exist_ok=True)
+        rows = np.asarray(self.rows)
+        fmt = f'%d %.{precision}f %.{precision}f %.{precision}f %.{precision}f\n'
+        # Format all rows in one pass, then cut the lines per image with the offsets
+        lines = [fmt % tuple(row) for row in rows[:, 1:].tolist()]
+        for i, name in enumerate(self.names):
+            with open(os.path.join(label_dir, name + '.txt'), 'w') as label_file:
+                label_file.write(''.join(lines[self.offsets[i]:self.offsets[i + 1]]))
+
+
+# Writes a data.yaml that model.train(data=...) understands
+def write_data_yaml(path, class_names, train='train/images', val='valid/images', test=None):
+    lines = [f"train: {train}", f"val: {val}"]
+    if test:
+        lines.append(f"test: {test}")
+    lines.append(f"nc: {len(class_names)}")
+    lines.append("names: [" + ", ".join(f"'{name}'" for name in class_names) + "]")
+    with open(path, 'w') as yaml_file:
+        yaml_file.write('\n'.join(lines) + '\n')
+
+
+# python -m common.labels <store_dir> <label_dir> [--data_yaml data.yaml --names a,b]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a LabelStore to YOLOv8 txt labels")
+    parser.add_argument("store_dir")
+    parser.add_argument("label_dir")
+    parser.add_argument("--data_yaml", default=None)
+    parser.add_argument("--names", default="mine", help="Comma separated class names for data.yaml")
+    args = parser.parse_args()
+
+    LabelStore.load(args.store_dir).export_yolo(args.label_dir)
+    if args.data_yaml:
+        write_data_yaml(args.data_yaml, args.names.split(','))
@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+
+# Manifest for incremental dataset builds.
+# Every output (one image with its label) is stored under a name together with
+# a hash of everything it was made from. A rerun compares the hashes and only
+# rebuilds outputs that are missing or stale; outputs whose inputs are gone
+# are deleted.
+
+# Default manifest name, kept next to the outputs rather than among them
+MANIFEST_FILE = 'manifest.json'
+
+
+# SHA-256 of a file's content
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BuildManifest:
+    def __init__(self, path):
+        self.path = path
+        self.root = os.path.dirname(os.path.abspath(path))
+        data = {}
+        if os.path.isfile(path):
+            with open(path) as manifest_file:
+                data = json.load(manifest_file)
+        self.entries = data.get('entries', {})          # name -> {"key": ..., "files": [...]}
+        self.settings = data.get('settings', {})        # run-wide values such as the seed
+        self.file_hashes = data.get('file_hashes', {})  # path -> [size, mtime_ns, sha256]
+
+    # Content hash of an input file, reused while its size and mtime don't change
+    def file_hash(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        cached = self.file_hashes.get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = hash_file(path)
+        self.file_hashes[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    # Hash of the inputs of one output; values must be JSON friendly
+    @staticmethod
+    def key(**inputs):
+        text = json.dumps(inputs, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _abs(self, path):
+        return os.path.join(self.root, path)
+
+    # True if the output was built from the same inputs and its files are still there
+    def is_current(self, name, key):
+        entry = self.entries.get(name)
+        return (entry is not None and entry['key'] == key
+                and all(os.path.exists(self._abs(f)) for f in entry['files']))
+
+    def record(self, name, key, files):
+        self.entries[name] = {'key': key, 'files': [os.path.relpath(os.path.abspath(f), self.root) for f in files]}
+
+    # Deletes the files of an output and forgets it
+    def discard(self, name):
+        entry = self.entries.pop(name, None)
+        for f in (entry or {}).get('files', []):
+            if os.path.exists(self._abs(f)):
+                os.remove(self._abs(f))
+
+    # Removes outputs that are no longer produced by the current inputs
+    def prune(self, names):
+        names = set(names)
+        orphans = [name for name in self.entries if name not in names]
+        for name in orphans:
+            self.discard(name)
+        return orphans
+
+    # Writes through a temporary file so a crash never leaves half a manifest
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as manifest_file:
+            json.dump({'settings': self.settings, 'entries': self.entries, 'file_hashes': self.file_hashes},
+                      manifest_file)
+        os.replace(tmp_path, self.path)
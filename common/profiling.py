@@ -0,0 +1,91 @@
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import time
+from contextlib import contextmanager
+import numpy as np
+
+# Run instrumentation shared by the dataset generators and the inference pipeline.
+#   StageStats - wall time per stage (one entry per frame/image) and plain counters,
+#                summarised as count/total/mean/p50/p95
+#   profiled   - optional cProfile around a block, dumped to a .prof file
+# A timed stage costs two perf_counter() calls and a list append, so it can stay on.
+
+
+# Latencies per stage, reported as mean/p50/p95 in milliseconds
+class StageStats:
+    def __init__(self):
+        self.times = {}
+        self.counters = {}
+
+    def add(self, stage, seconds):
+        self.times.setdefault(stage, []).append(seconds)
+
+    # with stats.stage('encode'): ... adds the time the block took
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    # Adds the raw times/counters of another run, e.g. the ones a pool worker sent back
+    def merge(self, times, counters=None):
+        for stage, values in times.items():
+            self.times.setdefault(stage, []).extend(values)
+        for name, amount in (counters or {}).items():
+            self.count(name, amount)
+
+    def summary(self):
+        result = {}
+        for stage, times in self.times.items():
+            ms = np.asarray(times) * 1000
+            result[stage] = {'count': len(ms), 'total_s': round(float(ms.sum()) / 1000, 4),
+                             'mean_ms': round(float(ms.mean()), 3),
+                             'p50_ms': round(float(np.percentile(ms, 50)), 3),
+                             'p95_ms': round(float(np.percentile(ms, 95)), 3)}
+        return result
+
+    # Stage summary and counters as one JSON friendly dict
+    def report(self, **extra):
+        return {**extra, 'stages': self.summary(), 'counters': dict(self.counters)}
+
+
+# Writes a timing report next to a run's output
+def write_timing(path, stats, **extra):
+    with open(path, 'w') as timing_file:
+        json.dump(stats.report(**extra), timing_file, indent=1)
+
+
+# Profiles the block with cProfile if path is set, otherwise does nothing.
+# Only the calling process is profiled, pool workers are not
+@contextmanager
+def profiled(path=None):
+    if not path:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        profiler.dump_stats(path)
+
+
+# python -m common.profiling run.prof: prints the most expensive functions of a profile
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the top functions of a cProfile dump")
+    parser.add_argument("profile")
+    parser.add_argument("--sort", default="cumulative", help="pstats sort key, e.g. cumulative or tottime")
+    parser.add_argument("--top", type=int, default=30)
+    args = parser.parse_args()
+
+    pstats.Stats(args.profile).sort_stats(args.sort).print_stats(args.top)
@@ -0,0 +1,249 @@
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+from common.boxes import as_boxes
+from common.labels import LabelStore
+
+# Memory-mapped dataset shards for training.
+# A shard is a folder with every image as a fixed-size uint8 tensor in one raw file
+# (images.bin, (N, H, W, 3) BGR), the labels as a LabelStore (rows.npy, offsets.npy,
+# names.json) and an index (shard.json). Reading sample i maps a view of images.bin,
+# so nothing is decoded or copied and every sample costs the same at any dataset size.
+
+IMAGES_FILE = 'images.bin'
+INDEX_FILE = 'shard.json'
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+PAD_VALUE = 114      # Grey used by YOLOv8 letterboxing
+
+
+# Scales an image into an imgsz x imgsz square (top-left, grey padding).
+# Returns the image and the factors that map normalized labels into the square
+def fit_image(image, imgsz=None):
+    if imgsz is None:
+        return image, (1.0, 1.0)
+    height, width = image.shape[:2]
+    scale = imgsz / max(width, height)
+    new_width, new_height = max(1, round(width * scale)), max(1, round(height * scale))
+    out = np.full((imgsz, imgsz, image.shape[2]), PAD_VALUE, dtype=np.uint8)
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    out[:new_height, :new_width] = cv2.resize(image, (new_width, new_height), interpolation=interpolation)
+    return out, (new_width / imgsz, new_height / imgsz)
+
+
+class ShardWriter:
+    def __init__(self, path, imgsz=640):
+        self.path = path
+        self.imgsz = imgsz
+        self.shape = None
+        self.original_shapes = []
+        os.makedirs(path, exist_ok=True)
+        self.images = open(os.path.join(path, IMAGES_FILE), 'wb')
+        self.labels = LabelStore(path)
+
+    # image: HxWx3 uint8 BGR; boxes: YOLO boxes normalized to the image
+    def add(self, name, image, classes, boxes):
+        self.original_shapes.append(list(image.shape[:2]))
+        image, (scale_x, scale_y) = fit_image(image, self.imgsz)
+        if self.shape is None:
+            self.shape = image.shape
+        elif image.shape != self.shape:
+            raise ValueError(f"{name} is {image.shape}, the shard holds {self.shape} images; set imgsz to resize")
+        self.images.write(np.ascontiguousarray(image, dtype=np.uint8).tobytes())
+        self.labels.add(name, classes, as_boxes(boxes) * [scale_x, scale_y, scale_x, scale_y])
+
+    def close(self):
+        self.images.close()
+        self.labels.save()
+        with open(os.path.join(self.path, INDEX_FILE), 'w') as index_file:
+            json.dump({'count': len(self.labels), 'shape': list(self.shape or (0, 0, 3)), 'dtype': 'uint8',
+                       'channels': 'BGR', 'imgsz': self.imgsz, 'original_shapes': self.original_shapes}, index_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShardReader:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as index_file:
+            self.index = json.load(index_file)
+        shape = (self.index['count'],) + tuple(self.index['shape'])
+        self.images = np.memmap(os.path.join(path, IMAGES_FILE), dtype=np.uint8, mode='r', shape=shape) \
+            if self.index['count'] else np.zeros(shape, dtype=np.uint8)
+        self.labels = LabelStore.load(path)
+
+    def __len__(self):
+        return self.index['count']
+
+    @property
+    def names(self):
+        return self.labels.names
+
+    # (image view HxWx3 BGR, classes, YOLO boxes) of sample i
+    def __getitem__(self, i):
+        classes, boxes = self.labels.labels(i)
+        return self.images[i], classes, boxes
+
+
+# Reads a YOLO txt label file as (classes, boxes)
+def read_yolo_txt(path):
+    with open(path) as label_file:
+        values = np.array(label_file.read().split(), dtype=np.float32).reshape(-1, 5)
+    return values[:, 0].astype(int), values[:, 1:]
+
+
+def frame_number(stem):
+    tail = stem.split('_')[-1]
+    return int(tail) if tail.isdigit() else None
+
+
+# Pairs images with label names: same name first, else the same trailing frame number
+# (render_and_label.py writes ILLIA_PMN_1_frame_0001.png next to landmine_frame_0001.txt).
+# Images without labels are kept as background images, as YOLO does
+def pair_labels(image_names, label_names):
+    label_names = set(label_names)
+    by_frame = {frame_number(name): name for name in label_names if frame_number(name) is not None}
+    pairs = []
+    for image_name in image_names:
+        stem = os.path.splitext(image_name)[0]
+        label = stem if stem in label_names else by_frame.get(frame_number(stem))
+        pairs.append((image_name, label))
+    return pairs
+
+
+# Converts an images folder plus YOLO txt labels (or a LabelStore folder) into a shard
+def convert(images_dir, labels_path, output_dir, imgsz=640, workers=4):
+    image_names = sorted(f for f in os.listdir(images_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+    if os.path.isfile(os.path.join(labels_path, LabelStore.ROWS_FILE)):
+        store = LabelStore.load(labels_path)
+        positions = {name: i for i, name in enumerate(store.names)}
+        read_labels = lambda name: store.labels(positions[name])
+        label_names = store.names
+    else:
+        read_labels = lambda name: read_yolo_txt(os.path.join(labels_path, name + '.txt'))
+        label_names = [os.path.splitext(f)[0] for f in os.listdir(labels_path) if f.endswith('.txt')]
+    pairs = pair_labels(image_names, label_names)
+
+    def load(pair):
+        image_name, label = pair
+        image = cv2.imread(os.path.join(images_dir, image_name), cv2.IMREAD_COLOR)
+        if image is None:
+            raise IOError(f"Could not read {image_name}")
+        classes, boxes = read_labels(label) if label is not None else (np.zeros(0, int), np.zeros((0, 4)))
+        return os.path.splitext(image_name)[0], image, classes, boxes
+
+    # Decoding runs in threads (cv2 releases the GIL); chunks keep memory bounded
+    chunk = max(1, workers) * 4
+    with ShardWriter(output_dir, imgsz) as writer, ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for start in range(0, len(pairs), chunk):
+            for sample in pool.map(load, pairs[start:start + chunk]):
+                writer.add(*sample)
+    return len(pairs)
+
+
+# Samples in the batch format of the YOLOv8 detection trainer (needs torch).
+# augment=True runs ultralytics' training transforms on the shard samples like YOLODataset does:
+# mosaic, random perspective, mixup, HSV and flips, set by the trainer hyperparameters hyp
+class TorchShardDataset:
+    def __init__(self, path, augment=False, hyp=None, imgsz=None):
+        self.reader = ShardReader(path)
+        self.imgsz = imgsz or max(self.reader.index['shape'][:2])
+        self.cache = 'ram'      # Mosaic draws its partners from the whole shard, which is mapped anyway
+        self.data = {}
+        self.transforms = self.build_transforms(hyp) if augment else None
+
+    def __len__(self):
+        return len(self.reader)
+
+    def build_transforms(self, hyp):
+        from ultralytics.data.augment import Format, v8_transforms
+        transforms = v8_transforms(self, self.imgsz, hyp)
+        transforms.append(Format(bbox_format='xywh', normalize=True, batch_idx=True, mask_ratio=hyp.mask_ratio,
+                                 mask_overlap=hyp.overlap_mask, bgr=hyp.bgr))
+        return transforms
+
+    # The trainer calls this for the last close_mosaic epochs
+    def close_mosaic(self, hyp):
+        if self.transforms is not None:
+            hyp.mosaic = hyp.copy_paste = hyp.mixup = hyp.cutmix = 0.0
+            self.transforms = self.build_transforms(hyp)
+
+    # Sample i as the label dict the transforms work on, with a writable copy of the image
+    def get_image_and_label(self, i):
+        from ultralytics.utils.instance import Instances
+        image, classes, boxes = self.reader[i]
+        shape = tuple(image.shape[:2])
+        instances = Instances(np.array(boxes, dtype=np.float32).reshape(-1, 4), np.zeros((0, 1000, 2), np.float32),
+                              bbox_format='xywh', normalized=True)
+        return {'img': np.array(image), 'cls': classes.astype(np.float32).reshape(-1, 1), 'instances': instances,
+                'im_file': self.reader.names[i], 'ori_shape': shape, 'resized_shape': shape, 'ratio_pad': (1.0, 1.0)}
+
+    def __getitem__(self, i):
+        import torch
+        if self.transforms is not None:
+            sample = self.transforms(self.get_image_and_label(i))
+            return {'img': sample['img'], 'cls': sample['cls'].view(-1, 1), 'bboxes': sample['bboxes'].view(-1, 4),
+                    'im_file': sample['im_file'], 'ori_shape': sample['ori_shape'],
+                    'resized_shape': sample['resized_shape'], 'ratio_pad': ((1.0, 1.0), (0.0, 0.0))}
+        image, classes, boxes = self.reader[i]
+        shape = tuple(image.shape[:2])
+        return {'img': torch.from_numpy(np.ascontiguousarray(image[..., ::-1].transpose(2, 0, 1))),  # BGR -> RGB, CHW
+                'cls': torch.from_numpy(classes.astype(np.float32)).view(-1, 1),
+                'bboxes': torch.from_numpy(np.array(boxes, dtype=np.float32)).view(-1, 4),
+                'im_file': self.reader.names[i], 'ori_shape': shape, 'resized_shape': shape,
+                'ratio_pad': ((1.0, 1.0), (0.0, 0.0))}
+
+    # build_dataloader picks the collate function up from the dataset
+    @staticmethod
+    def collate_fn(samples):
+        return collate_yolo(samples)
+
+
+# Stacks samples into one batch; batch_idx tells which image each box belongs to
+def collate_yolo(samples):
+    import torch
+    batch = {'img': torch.stack([s['img'] for s in samples]),
+             'cls': torch.cat([s['cls'] for s in samples]),
+             'bboxes': torch.cat([s['bboxes'] for s in samples]),
+             'batch_idx': torch.cat([torch.full((len(s['cls']),), i, dtype=torch.float32)
+                                     for i, s in enumerate(samples)])}
+    for key in ('im_file', 'ori_shape', 'resized_shape', 'ratio_pad'):
+        batch[key] = [s[key] for s in samples]
+    return batch
+
+
+# YOLOv8 DetectionTrainer that reads shards; the train/val entries of data.yaml are shard folders:
+#   YOLO('yolov8s.pt').train(data='shards.yaml', trainer=shard_trainer(), imgsz=640, plots=False)
+# The loader is ultralytics' InfiniteDataLoader, which the trainer reset()s when it closes mosaic.
+# Training batches get the usual YOLO augmentation; shards should be written at the training imgsz
+def shard_trainer():
+    from ultralytics.data.build import build_dataloader
+    from ultralytics.models.yolo.detect import DetectionTrainer
+
+    class ShardTrainer(DetectionTrainer):
+        def get_dataloader(self, dataset_path, batch_size=16, rank=0, mode='train'):
+            dataset = TorchShardDataset(dataset_path, augment=mode == 'train', hyp=self.args, imgsz=self.args.imgsz)
+            return build_dataloader(dataset, batch_size, self.args.workers, mode == 'train', rank)
+
+    return ShardTrainer
+
+
+# python -m common.shards <images_dir> <labels_dir_or_store> <shard_dir> [--imgsz 640]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a rendered/augmented dataset into a memory-mapped shard")
+    parser.add_argument("images_dir")
+    parser.add_argument("labels")
+    parser.add_argument("output_dir")
+    parser.add_argument("--imgsz", type=int, default=640, help="Square size of the stored images, 0 keeps them as is")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    count = convert(args.images_dir, args.labels, args.output_dir, args.imgsz or None, args.workers)
+    print(f"Wrote {count} samples to {args.output_dir}")
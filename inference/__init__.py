@@ -0,0 +1 @@
+# Detection runtime shared by the RGB and thermal models
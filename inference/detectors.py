@@ -0,0 +1,79 @@
+import time
+from collections import namedtuple
+import numpy as np
+
+# Detectors used by the inference pipelines.
+# A detector is any callable that takes a list of HxWx3 BGR frames and returns
+# one Detections per frame, so the pipelines can run the YOLOv8 models or a
+# stub on a CPU-only machine.
+
+# xyxy pixel boxes (N, 4), scores (N,), class indices (N,) and tracker ids (N,), -1 = untracked
+Detections = namedtuple('Detections', ['boxes', 'scores', 'classes', 'ids'])
+
+
+def make_detections(boxes=(), scores=(), classes=(), ids=None):
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+    classes = np.asarray(classes, dtype=np.int64).reshape(-1)
+    ids = np.full(len(boxes), -1, dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64).reshape(-1)
+    return Detections(boxes, scores, classes, ids)
+
+
+# Keeps the detections with score >= min_conf
+def filter_detections(detections, min_conf):
+    keep = detections.scores >= min_conf
+    return Detections(*(field[keep] for field in detections))
+
+
+# Converts one ultralytics Results object
+def from_ultralytics(result):
+    boxes = result.boxes
+    ids = boxes.id.cpu().numpy() if boxes.id is not None else None
+    return make_detections(boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(), boxes.cls.cpu().numpy(), ids)
+
+
+# YOLOv8 weights (best_rgb.pt, best_thermal.pt...) through ultralytics, imported on first use.
+# track=True runs model.track(persist=True) frame by frame like the notebooks,
+# otherwise a whole batch goes through one predict() call
+class YoloDetector:
+    def __init__(self, weights, track=True, imgsz=640, conf=0.25, device=None):
+        from ultralytics import YOLO
+        self.model = YOLO(weights)
+        self.track = track
+        self.options = {'imgsz': imgsz, 'conf': conf, 'verbose': False}
+        if device is not None:
+            self.options['device'] = device
+
+    @property
+    def names(self):
+        return self.model.names
+
+    def __call__(self, frames):
+        if self.track:
+            return [from_ultralytics(self.model.track(frame, persist=True, **self.options)[0]) for frame in frames]
+        return [from_ultralytics(result) for result in self.model.predict(list(frames), **self.options)]
+
+
+# Stand-in detector for tests and benchmarks: sleeps `latency` seconds per call plus
+# `per_frame` per frame, then returns `count` boxes drawn from a seeded generator
+class StubDetector:
+    def __init__(self, count=3, latency=0.0, per_frame=0.0, num_classes=8, box_size=40, seed=0):
+        self.count = count
+        self.latency = latency
+        self.per_frame = per_frame
+        self.num_classes = num_classes
+        self.box_size = box_size
+        self.rng = np.random.default_rng(seed)
+        self.names = {i: f'class_{i}' for i in range(num_classes)}
+
+    def __call__(self, frames):
+        time.sleep(self.latency + self.per_frame * len(frames))
+        return [self.detect(frame) for frame in frames]
+
+    def detect(self, frame):
+        height, width = frame.shape[:2]
+        size = min(self.box_size, width, height)
+        corners = self.rng.uniform(0, 1, (self.count, 2)) * [width - size, height - size]
+        boxes = np.concatenate([corners, corners + size], axis=1)
+        return make_detections(boxes, self.rng.uniform(0, 1, self.count),
+                               self.rng.integers(0, self.num_classes, self.count))
@@ -0,0 +1,257 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque, namedtuple
+import numpy as np
+import cv2
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.boxes import as_boxes
+from inference.detectors import make_detections
+
+# Fusion of RGB and thermal detections.
+# Thermal boxes are mapped into the RGB image with a homography, matched to RGB boxes
+# through a uniform grid over the box centres, and every RGB frame is paired with the
+# thermal frame closest in time. Matched pairs get a combined (noisy-OR) confidence:
+# 1 - (1 - p_rgb) * (1 - p_thermal).
+
+# Fused detections in RGB pixels. sources: 1 = RGB only, 2 = thermal only, 3 = both;
+# rgb_index / thermal_index point into the input detections (-1 = none)
+FusedDetections = namedtuple('FusedDetections', ['boxes', 'scores', 'classes', 'sources', 'rgb_index',
+                                                 'thermal_index'])
+
+RGB, THERMAL, BOTH = 1, 2, 3
+
+
+# Homography that maps thermal pixels onto RGB pixels, from matching points (at least 4)
+def homography_from_points(thermal_points, rgb_points):
+    matrix, _ = cv2.findHomography(np.asarray(thermal_points, dtype=np.float64),
+                                   np.asarray(rgb_points, dtype=np.float64))
+    return matrix
+
+
+# Applies a 3x3 homography to (N, 2) points
+def apply_homography(matrix, points):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    mapped = points @ matrix[:, :2].T + matrix[:, 2]
+    return mapped[:, :2] / mapped[:, 2:]
+
+
+# Maps xyxy boxes through a homography and returns the axis-aligned envelope
+def warp_boxes(matrix, boxes):
+    boxes = as_boxes(boxes)
+    corners = boxes[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 2)
+    mapped = apply_homography(matrix, corners).reshape(-1, 4, 2)
+    return np.concatenate([mapped.min(axis=1), mapped.max(axis=1)], axis=1)
+
+
+def box_centers(boxes):
+    boxes = as_boxes(boxes)
+    return (boxes[:, :2] + boxes[:, 2:]) / 2
+
+
+# Uniform grid over 2-D points. Points are sorted by cell, so the points of a
+# cell are one slice found with searchsorted; queries look at the 3x3 cells around them
+class GridIndex:
+    def __init__(self, points, cell_size):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.cell_size = cell_size
+        keys = self.cell_keys(self.points)
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+
+    def cell_keys(self, points, dx=0, dy=0):
+        cells = np.floor(points / self.cell_size).astype(np.int64)
+        return ((cells[:, 0] + dx) << 32) + ((cells[:, 1] + dy) & 0xFFFFFFFF)
+
+    # Every (query, point) pair closer than radius (radius <= cell_size): query indices,
+    # point indices and distances
+    def query_pairs(self, queries, radius):
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 2)
+        found_queries, found_points = [], []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                keys = self.cell_keys(queries, dx, dy)
+                lo = np.searchsorted(self.sorted_keys, keys, 'left')
+                counts = np.searchsorted(self.sorted_keys, keys, 'right') - lo
+                total = counts.sum()
+                if total == 0:
+                    continue
+                starts = np.cumsum(counts) - counts
+                slots = np.arange(total) - np.repeat(starts - lo, counts)
+                found_queries.append(np.repeat(np.arange(len(queries)), counts))
+                found_points.append(self.order[slots])
+        if not found_queries:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0)
+        query_index, point_index = np.concatenate(found_queries), np.concatenate(found_points)
+        distances = np.linalg.norm(queries[query_index] - self.points[point_index], axis=1)
+        close = distances <= radius
+        return query_index[close], point_index[close], distances[close]
+
+
+# One-to-one matching of candidate pairs, closest pairs first
+def greedy_match(first, second, distances):
+    order = np.argsort(distances, kind='stable')
+    used_first, used_second = set(), set()
+    matches = []
+    for a, b in zip(first[order].tolist(), second[order].tolist()):
+        if a not in used_first and b not in used_second:
+            used_first.add(a)
+            used_second.add(b)
+            matches.append((a, b))
+    return np.array(matches, dtype=np.int64).reshape(-1, 2)
+
+
+# Fuses the detections of one RGB frame with one thermal frame.
+# radius is the largest centre distance (RGB pixels) of a match; unmatched
+# detections keep their own score times single_sensor_scale
+def fuse_frame(rgb, thermal, homography, radius=40.0, thermal_class=-1, single_sensor_scale=1.0):
+    thermal_boxes = warp_boxes(homography, thermal.boxes) if len(thermal.boxes) else np.zeros((0, 4))
+    index = GridIndex(box_centers(rgb.boxes), radius)
+    thermal_index, rgb_index, distances = index.query_pairs(box_centers(thermal_boxes), radius)
+    matches = greedy_match(rgb_index, thermal_index, distances)
+
+    rgb_only = np.setdiff1d(np.arange(len(rgb.boxes)), matches[:, 0])
+    thermal_only = np.setdiff1d(np.arange(len(thermal_boxes)), matches[:, 1])
+    p_rgb, p_thermal = rgb.scores[matches[:, 0]], thermal.scores[matches[:, 1]]
+
+    boxes = np.concatenate([rgb.boxes[matches[:, 0]], rgb.boxes[rgb_only], thermal_boxes[thermal_only]])
+    scores = np.concatenate([1 - (1 - p_rgb) * (1 - p_thermal),
+                             rgb.scores[rgb_only] * single_sensor_scale,
+                             thermal.scores[thermal_only] * single_sensor_scale])
+    classes = np.concatenate([rgb.classes[matches[:, 0]], rgb.classes[rgb_only],
+                              np.full(len(thermal_only), thermal_class)])
+    sources = np.repeat([BOTH, RGB, THERMAL], [len(matches), len(rgb_only), len(thermal_only)])
+    rgb_ids = np.concatenate([matches[:, 0], rgb_only, np.full(len(thermal_only), -1)])
+    thermal_ids = np.concatenate([matches[:, 1], np.full(len(rgb_only), -1), thermal_only])
+    return FusedDetections(boxes.astype(np.float32), scores.astype(np.float32), classes.astype(np.int64),
+                           sources, rgb_ids.astype(np.int64), thermal_ids.astype(np.int64))
+
+
+# Pairs two time-stamped detection streams and fuses them as they arrive.
+# add_rgb / add_thermal return the RGB frames that are ready as (timestamp, FusedDetections):
+# a frame is ready once a thermal frame at least max_dt newer arrived (no closer one can
+# follow) or once it waited longer than max_wait seconds on clock. clock is any function
+# returning seconds (wall time by default); clock=None measures the wait in frame timestamps,
+# by the newest one of either stream, so replayed streams fuse the same way every time
+class FusionStream:
+    def __init__(self, homography, max_dt=0.05, max_wait=0.1, clock=time.monotonic, **fuse_options):
+        self.homography = homography
+        self.max_dt = max_dt
+        self.max_wait = max_wait
+        self.clock = clock
+        self.fuse_options = fuse_options
+        self.rgb = deque()        # (timestamp, detections, arrival time)
+        self.thermal = deque()    # (timestamp, detections)
+        self.newest = None        # Newest timestamp of either stream
+
+    def now(self):
+        return self.clock() if self.clock is not None else self.newest
+
+    def add_rgb(self, timestamp, detections):
+        self.see(timestamp)
+        self.rgb.append((timestamp, detections, self.now()))
+        return self.ready()
+
+    def add_thermal(self, timestamp, detections):
+        self.see(timestamp)
+        self.thermal.append((timestamp, detections))
+        return self.ready()
+
+    def see(self, timestamp):
+        self.newest = timestamp if self.newest is None else max(self.newest, timestamp)
+
+    # Fuses every waiting RGB frame regardless of what may still arrive
+    def flush(self):
+        return self.ready(force=True)
+
+    def ready(self, force=False):
+        out = []
+        latest = self.thermal[-1][0] if self.thermal else None
+        now = self.now()
+        while self.rgb:
+            timestamp, detections, arrived = self.rgb[0]
+            if not (force or (latest is not None and latest >= timestamp + self.max_dt)
+                    or now - arrived > self.max_wait):
+                break
+            self.rgb.popleft()
+            out.append((timestamp, self.fuse(timestamp, detections)))
+        # Thermal frames too old for any waiting RGB frame are no longer needed
+        oldest = self.rgb[0][0] if self.rgb else (out[-1][0] if out else None)
+        while oldest is not None and len(self.thermal) > 1 and self.thermal[1][0] <= oldest - self.max_dt:
+            self.thermal.popleft()
+        return out
+
+    def fuse(self, timestamp, detections):
+        partner = None
+        if self.thermal:
+            times = np.array([t for t, _ in self.thermal])
+            best = int(np.abs(times - timestamp).argmin())
+            if abs(times[best] - timestamp) <= self.max_dt:
+                partner = self.thermal[best][1]
+        return fuse_frame(detections, partner if partner is not None else make_detections(), self.homography,
+                          **self.fuse_options)
+
+
+# Synthetic streams for tests and benchmarks: `objects` mines seen by both cameras,
+# each detected with probability `recall`, jittered by `noise` pixels, plus `false_positives`
+# per frame. Returns (rgb, thermal, truth): time-sorted [(timestamp, Detections)] streams and the
+# true RGB centres
+def synthetic_streams(homography, frames=100, objects=20, rgb_fps=30.0, thermal_fps=9.0, size=(1920, 1080),
+                      recall=0.9, noise=3.0, false_positives=2, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform([50, 50], [size[0] - 50, size[1] - 50], (objects, 2))
+    inverse = np.linalg.inv(homography)
+    duration = frames / rgb_fps
+
+    def stream(fps, to_sensor):
+        out = []
+        for timestamp in np.arange(0, duration, 1 / fps):
+            seen = centers[rng.uniform(size=objects) < recall]
+            extra = rng.uniform([0, 0], size, (false_positives, 2))
+            points = np.concatenate([seen + rng.normal(0, noise, seen.shape), extra])
+            if to_sensor is not None:
+                points = apply_homography(to_sensor, points)
+            half = rng.uniform(10, 25, (len(points), 1))
+            boxes = np.concatenate([points - half, points + half], axis=1)
+            scores = np.concatenate([rng.uniform(0.4, 0.95, len(seen)), rng.uniform(0.05, 0.5, false_positives)])
+            out.append((float(timestamp), make_detections(boxes, scores, rng.integers(0, 8, len(points)))))
+        return out
+
+    return stream(rgb_fps, None), stream(thermal_fps, inverse), centers
+
+
+# Feeds two streams into a FusionStream in timestamp order; returns the fused frames
+def run_streams(fusion, rgb, thermal):
+    events = sorted([(t, 0, d) for t, d in rgb] + [(t, 1, d) for t, d in thermal], key=lambda e: (e[0], e[1]))
+    fused = []
+    for timestamp, sensor, detections in events:
+        add = fusion.add_rgb if sensor == 0 else fusion.add_thermal
+        fused.extend(add(timestamp, detections))
+    return fused + fusion.flush()
+
+
+# python -m inference.fusion [--frames 1000 --objects 50]: fuses synthetic streams and reports throughput
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fuse synthetic RGB and thermal detection streams")
+    parser.add_argument("--frames", type=int, default=1000)
+    parser.add_argument("--objects", type=int, default=50)
+    parser.add_argument("--radius", type=float, default=40.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    matrix = np.array([[2.9, 0.02, 40.0], [-0.01, 2.9, 25.0], [0.0, 0.0, 1.0]])   # 640x360 thermal -> 1920x1080 RGB
+    rgb_stream, thermal_stream, _ = synthetic_streams(matrix, args.frames, args.objects, seed=args.seed)
+    start = time.perf_counter()
+    result = run_streams(FusionStream(matrix, max_dt=0.06, clock=None, radius=args.radius), rgb_stream,
+                         thermal_stream)
+    seconds = time.perf_counter() - start
+    detections = sum(len(d.boxes) for _, d in rgb_stream) + sum(len(d.boxes) for _, d in thermal_stream)
+    both = sum(int((f.sources == BOTH).sum()) for _, f in result)
+    print(json.dumps({'rgb_frames': len(rgb_stream), 'thermal_frames': len(thermal_stream), 'fused_frames': len(result),
+                      'detections': detections, 'matched': both, 'seconds': round(seconds, 4),
+                      'detections_per_second': round(detections / seconds), 'ms_per_frame':
+                      round(seconds / max(len(result), 1) * 1000, 4)}, indent=1))
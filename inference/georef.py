@@ -0,0 +1,257 @@
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.boxes import as_boxes
+from inference.fusion import GridIndex
+
+# Geo-referencing of detections and the mine map.
+# The camera is the one render_and_label.py flies: a pinhole with FOV across the wider
+# image side, `altitude` metres above flat ground, tilted forward by `tilt_angle`
+# degrees from straight down and looking along the drone heading.
+# Ground coordinates are metres: x east, y north. Drone poses are (N, 4) arrays of
+# x, y, altitude, heading (degrees clockwise from north).
+
+
+class CameraModel:
+    def __init__(self, width, height, fov, tilt_angle=0.0):
+        self.width = width
+        self.height = height
+        self.fov = fov
+        self.tilt_angle = tilt_angle
+        self.focal = max(width, height) / 2 / np.tan(np.deg2rad(fov) / 2)
+
+    # Camera of a render_and_label.py run, from its meta.json (image size in pixels, FOV and tilt)
+    @classmethod
+    def from_meta(cls, meta_path):
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+        if 'resolution' not in meta:
+            raise ValueError(f"{meta_path} has no resolution, re-render it with the current render_and_label.py")
+        width, height = meta['resolution']
+        return cls(width, height, meta['FOV'], meta['tilt_angle'])
+
+    # Camera axes (right, down, forward) in ground coordinates, one (3, 3) matrix per heading
+    def rotations(self, headings):
+        heading = np.deg2rad(np.asarray(headings, dtype=np.float64))
+        tilt = np.deg2rad(self.tilt_angle)
+        axes = np.array([[1.0, 0.0, 0.0],
+                         [0.0, -np.cos(tilt), -np.sin(tilt)],
+                         [0.0, np.sin(tilt), -np.cos(tilt)]])       # rows: right, down, forward at heading 0
+        cos, sin = np.cos(heading)[:, None], np.sin(heading)[:, None]
+        rotated = np.empty(heading.shape + (3, 3))
+        rotated[..., 0] = axes[:, 0] * cos + axes[:, 1] * sin
+        rotated[..., 1] = -axes[:, 0] * sin + axes[:, 1] * cos
+        rotated[..., 2] = axes[:, 2]
+        return np.swapaxes(rotated, -1, -2)                          # columns: right, down, forward
+
+    # Ground points (N, 2) seen at pixels (N, 2) from poses (N, 4); NaN above the horizon
+    def pixels_to_ground(self, pixels, poses):
+        pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+        poses = np.asarray(poses, dtype=np.float64).reshape(-1, 4)
+        rays = np.stack([(pixels[:, 0] - self.width / 2) / self.focal,
+                         (pixels[:, 1] - self.height / 2) / self.focal,
+                         np.ones(len(pixels))], axis=1)
+        rays = np.einsum('nij,nj->ni', self.rotations(poses[:, 3]), rays)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            distance = np.where(rays[:, 2] < 0, poses[:, 2] / -rays[:, 2], np.nan)
+        return poses[:, :2] + rays[:, :2] * distance[:, None]
+
+    # Pixels (N, 2) where ground points (N, 2) appear from poses (N, 4); NaN behind the camera
+    def ground_to_pixels(self, points, poses):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        poses = np.asarray(poses, dtype=np.float64).reshape(-1, 4)
+        offsets = np.concatenate([points - poses[:, :2], -poses[:, 2:3]], axis=1)
+        local = np.einsum('nji,nj->ni', self.rotations(poses[:, 3]), offsets)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            depth = np.where(local[:, 2] > 0, local[:, 2], np.nan)
+            return np.stack([local[:, 0] / depth * self.focal + self.width / 2,
+                             local[:, 1] / depth * self.focal + self.height / 2], axis=1)
+
+
+# Ground position of xyxy boxes (their centres) and their size on the ground in metres
+def boxes_to_ground(camera, boxes, poses):
+    boxes = as_boxes(boxes)
+    poses = np.asarray(poses, dtype=np.float64).reshape(-1, 4)
+    centers = camera.pixels_to_ground((boxes[:, :2] + boxes[:, 2:]) / 2, poses)
+    top_left = camera.pixels_to_ground(boxes[:, :2], poses)
+    bottom_right = camera.pixels_to_ground(boxes[:, 2:], poses)
+    return centers, np.linalg.norm(bottom_right - top_left, axis=1) / np.sqrt(2)
+
+
+# Geo-references a whole flight in one pass: frames is a list of Detections and
+# poses the (F, 4) pose of each frame. Returns ground points, scores, classes and frame indices
+def georeference_flight(camera, frames, poses):
+    counts = np.array([len(d.boxes) for d in frames], dtype=np.int64)
+    frame_index = np.repeat(np.arange(len(frames)), counts)
+    if not counts.sum():
+        return np.zeros((0, 2)), np.zeros(0, np.float32), np.zeros(0, np.int64), frame_index
+    boxes = np.concatenate([d.boxes for d in frames])
+    points, _ = boxes_to_ground(camera, boxes, np.asarray(poses, dtype=np.float64)[frame_index])
+    scores = np.concatenate([d.scores for d in frames])
+    classes = np.concatenate([d.classes for d in frames])
+    keep = np.isfinite(points).all(axis=1)
+    return points[keep], scores[keep], classes[keep], frame_index[keep]
+
+
+# Groups points closer than radius (chains included); returns a group label per point
+def cluster_points(points, radius):
+    labels = np.arange(len(points))
+    if len(points) < 2:
+        return labels
+    first, second, _ = GridIndex(points, radius).query_pairs(points, radius)
+    while True:
+        merged = labels.copy()
+        np.minimum.at(merged, first, labels[second])
+        np.minimum.at(merged, second, labels[first])
+        merged = merged[merged]
+        if np.array_equal(merged, labels):
+            return np.unique(labels, return_inverse=True)[1]
+        labels = merged
+
+
+# One entry per mine, kept across frames and flights. Sightings within `radius` metres of an
+# entry are merged into it: the position is their score-weighted mean, the confidence
+# accumulates as 1 - prod(1 - score) and the class is the one with the highest score sum
+class MineMap:
+    def __init__(self, radius=0.5, num_classes=8):
+        self.radius = radius
+        self.num_classes = num_classes
+        self.position_sums = np.zeros((0, 2))
+        self.weights = np.zeros(0)
+        self.log_miss = np.zeros(0)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.class_scores = np.zeros((0, num_classes))
+
+    def __len__(self):
+        return len(self.weights)
+
+    @property
+    def positions(self):
+        return self.position_sums / np.maximum(self.weights, 1e-12)[:, None]
+
+    @property
+    def confidence(self):
+        return 1 - np.exp(self.log_miss)
+
+    # Most voted class per entry, -1 if only class-less (e.g. thermal) sightings
+    @property
+    def classes(self):
+        best = self.class_scores.argmax(axis=1)
+        return np.where(self.class_scores.max(axis=1) > 0, best, -1)
+
+    # Adds sightings, returns the entry index of each one
+    def add(self, points, scores, classes=None):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        scores = np.clip(np.asarray(scores, dtype=np.float64).reshape(-1), 0, 0.999999)
+        classes = np.full(len(points), -1) if classes is None else np.asarray(classes, dtype=np.int64)
+        entries = np.full(len(points), -1, dtype=np.int64)
+
+        # Nearest existing entry within radius
+        if len(self):
+            sighting, entry, distance = GridIndex(self.positions, self.radius).query_pairs(points, self.radius)
+            order = np.argsort(distance, kind='stable')
+            sighting, entry = sighting[order], entry[order]
+            first = np.unique(sighting, return_index=True)[1]
+            entries[sighting[first]] = entry[first]
+
+        # The rest start new entries, one per group of nearby sightings
+        new = np.flatnonzero(entries < 0)
+        if len(new):
+            groups = cluster_points(points[new], self.radius)
+            entries[new] = len(self) + groups
+            self.grow(groups.max() + 1)
+
+        np.add.at(self.position_sums, entries, points * scores[:, None])
+        np.add.at(self.weights, entries, scores)
+        np.add.at(self.log_miss, entries, np.log1p(-scores))
+        np.add.at(self.counts, entries, 1)
+        voted = (classes >= 0) & (classes < self.num_classes)
+        np.add.at(self.class_scores, (entries[voted], classes[voted]), scores[voted])
+        return entries
+
+    def grow(self, count):
+        self.position_sums = np.concatenate([self.position_sums, np.zeros((count, 2))])
+        self.weights = np.concatenate([self.weights, np.zeros(count)])
+        self.log_miss = np.concatenate([self.log_miss, np.zeros(count)])
+        self.counts = np.concatenate([self.counts, np.zeros(count, dtype=np.int64)])
+        self.class_scores = np.concatenate([self.class_scores, np.zeros((count, self.num_classes))])
+
+    # Entries as plain dicts, e.g. for the interactive map
+    def entries(self, min_confidence=0.0):
+        positions, confidence, classes = self.positions, self.confidence, self.classes
+        return [{'id': i, 'x': float(positions[i, 0]), 'y': float(positions[i, 1]),
+                 'confidence': float(confidence[i]), 'class': int(classes[i]), 'sightings': int(self.counts[i])}
+                for i in np.flatnonzero(confidence >= min_confidence).tolist()]
+
+    def save(self, path):
+        with open(path, 'w') as map_file:
+            json.dump({'radius': self.radius, 'num_classes': self.num_classes,
+                       'position_sums': self.position_sums.tolist(), 'weights': self.weights.tolist(),
+                       'log_miss': self.log_miss.tolist(), 'counts': self.counts.tolist(),
+                       'class_scores': self.class_scores.tolist()}, map_file)
+
+    # Loads a saved map so the next flight extends it with the same entry ids
+    @classmethod
+    def load(cls, path):
+        with open(path) as map_file:
+            data = json.load(map_file)
+        mine_map = cls(data['radius'], data['num_classes'])
+        mine_map.position_sums = np.asarray(data['position_sums'], dtype=np.float64).reshape(-1, 2)
+        mine_map.weights = np.asarray(data['weights'], dtype=np.float64)
+        mine_map.log_miss = np.asarray(data['log_miss'], dtype=np.float64)
+        mine_map.counts = np.asarray(data['counts'], dtype=np.int64)
+        mine_map.class_scores = np.asarray(data['class_scores'], dtype=np.float64).reshape(-1, data['num_classes'])
+        return mine_map
+
+
+# Lawnmower survey over a width x height field: poses (F, 4) every `spacing` metres
+def survey_poses(width, height, altitude, lane_spacing, spacing):
+    poses = []
+    for lane, x in enumerate(np.arange(0, width + 1e-9, lane_spacing)):
+        ys = np.arange(0, height + 1e-9, spacing)
+        heading = 0.0 if lane % 2 == 0 else 180.0
+        poses.extend((x, y, altitude, heading) for y in (ys if lane % 2 == 0 else ys[::-1]))
+    return np.array(poses)
+
+
+# python -m inference.georef: maps a synthetic survey flight and reports the time taken
+if __name__ == "__main__":
+    from inference.detectors import make_detections
+
+    parser = argparse.ArgumentParser(description="Geo-reference a synthetic survey and build the mine map")
+    parser.add_argument("--mines", type=int, default=200)
+    parser.add_argument("--field", type=float, default=100.0, help="Side of the square field in metres")
+    parser.add_argument("--altitude", type=float, default=10.0)
+    parser.add_argument("--tilt_angle", type=float, default=30.0)
+    parser.add_argument("--FOV", type=float, default=60.0)
+    parser.add_argument("--noise", type=float, default=2.0, help="Pixel noise of the detections")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    camera = CameraModel(1920, 1920, args.FOV, args.tilt_angle)
+    mines = rng.uniform(0, args.field, (args.mines, 2))
+    poses = survey_poses(args.field, args.field, args.altitude, args.altitude, 1.0)
+
+    frames = []
+    for pose in poses:
+        pixels = camera.ground_to_pixels(mines, np.repeat(pose[None], len(mines), axis=0))
+        seen = np.isfinite(pixels).all(axis=1) & (pixels >= 0).all(axis=1) & (pixels < 1920).all(axis=1)
+        centers = pixels[seen] + rng.normal(0, args.noise, (seen.sum(), 2))
+        frames.append(make_detections(np.concatenate([centers - 15, centers + 15], axis=1),
+                                      rng.uniform(0.4, 0.9, seen.sum()), rng.integers(0, 8, seen.sum())))
+
+    start = time.perf_counter()
+    points, scores, classes, _ = georeference_flight(camera, frames, poses)
+    mine_map = MineMap(radius=0.5)
+    mine_map.add(points, scores, classes)
+    seconds = time.perf_counter() - start
+    found = GridIndex(mine_map.positions, 0.5).query_pairs(mines, 0.5)[0]
+    print(json.dumps({'frames': len(frames), 'sightings': len(points), 'mines': args.mines,
+                      'map_entries': len(mine_map), 'mines_found': int(len(np.unique(found))),
+                      'seconds': round(seconds, 4)}, indent=1))
@@ -0,0 +1,75 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.boxes import as_boxes, box_iou
+
+# Detection accuracy as YOLOv8 validation reports it: mAP@0.5 and mAP@0.5:0.95 with
+# the same matching and 101-point interpolated AP, so results line up with model.val().
+# Predictions are Detections (detectors.py), ground truth (classes, xyxy boxes) per frame.
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+# (N, T) true positive flags of N detections at every IoU threshold.
+# Pairs are matched best IoU first; every detection and every ground truth box is used once
+def match_detections(boxes, classes, gt_boxes, gt_classes, thresholds=IOU_THRESHOLDS):
+    classes, gt_classes = np.asarray(classes).reshape(-1), np.asarray(gt_classes).reshape(-1)
+    tp = np.zeros((len(classes), len(thresholds)), dtype=bool)
+    if not len(classes) or not len(gt_classes):
+        return tp
+    iou = box_iou(gt_boxes, boxes) * (gt_classes[:, None] == classes[None, :])
+    for j, threshold in enumerate(thresholds):
+        matches = np.argwhere(iou >= threshold)
+        if len(matches):
+            matches = matches[np.argsort(-iou[matches[:, 0], matches[:, 1]], kind='stable')]
+            matches = matches[np.unique(matches[:, 1], return_index=True)[1]]
+            matches = matches[np.unique(matches[:, 0], return_index=True)[1]]
+            tp[matches[:, 1], j] = True
+    return tp
+
+
+# Area under the precision-recall curve, 101-point interpolation (COCO).
+# Precision drops to zero right after the highest recall reached
+def average_precision(recall, precision):
+    recall = np.concatenate([[0.0], recall, [recall[-1] if len(recall) else 1.0, 1.0]])
+    precision = np.flip(np.maximum.accumulate(np.flip(np.concatenate([[1.0], precision, [0.0, 0.0]]))))
+    x = np.linspace(0, 1, 101)
+    y = np.interp(x, recall, precision)
+    return float(((y[1:] + y[:-1]) / 2 * np.diff(x)).sum())
+
+
+# mAP over a set of frames: {'map50', 'map50_95', 'per_class': {class: AP@0.5}}.
+# Classes without ground truth boxes are not counted, as in YOLOv8 validation
+def mean_average_precision(predictions, ground_truth, thresholds=IOU_THRESHOLDS):
+    tps, scores, classes, gt_classes = [], [], [], []
+    for detections, (frame_classes, frame_boxes) in zip(predictions, ground_truth):
+        frame_classes = np.asarray(frame_classes, dtype=np.int64).reshape(-1)
+        tps.append(match_detections(detections.boxes, detections.classes, as_boxes(frame_boxes), frame_classes,
+                                    thresholds))
+        scores.append(detections.scores)
+        classes.append(detections.classes)
+        gt_classes.append(frame_classes)
+    tp = np.concatenate(tps) if tps else np.zeros((0, len(thresholds)), dtype=bool)
+    scores = np.concatenate(scores) if scores else np.zeros(0)
+    classes = np.concatenate(classes) if classes else np.zeros(0, dtype=np.int64)
+    gt_classes = np.concatenate(gt_classes) if gt_classes else np.zeros(0, dtype=np.int64)
+
+    order = np.argsort(-scores, kind='stable')
+    tp, classes = tp[order], classes[order]
+    unique_classes, gt_counts = np.unique(gt_classes, return_counts=True)
+    ap = np.zeros((len(unique_classes), len(thresholds)))
+    for i, (class_id, count) in enumerate(zip(unique_classes, gt_counts)):
+        class_tp = tp[classes == class_id]
+        if not len(class_tp):
+            continue
+        tp_sum = np.cumsum(class_tp, axis=0)
+        fp_sum = np.cumsum(~class_tp, axis=0)
+        recall = tp_sum / count
+        precision = tp_sum / (tp_sum + fp_sum)
+        ap[i] = [average_precision(recall[:, j], precision[:, j]) for j in range(len(thresholds))]
+
+    return {'map50': float(ap[:, 0].mean()) if len(ap) else 0.0,
+            'map50_95': float(ap.mean()) if len(ap) else 0.0,
+            'per_class': {int(c): float(a) for c, a in zip(unique_classes, ap[:, 0])}}
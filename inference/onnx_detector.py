@@ -0,0 +1,103 @@
+import ast
+import os
+import sys
+import numpy as np
+import cv2
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.boxes import clip_boxes, nms
+from common.profiling import StageStats
+from common.shards import PAD_VALUE
+from inference.detectors import make_detections
+
+# YOLOv8 detectors exported to ONNX (FP32 or INT8, see quantize.py) run through
+# ONNX Runtime on the CPU, without torch or ultralytics.
+# Pre- and post-processing work on the whole batch at once:
+#   letterbox     - frames scaled into imgsz squares, BGR->RGB, HWC->CHW and /255 in one pass
+#   decode_output - (B, 4 + classes, anchors) raw output to Detections, best class per anchor,
+#                   cxcywh->xyxy for every anchor at once, then class-aware NMS per frame
+
+
+# Centred letterbox like ultralytics predict: keeps the aspect ratio, pads with grey.
+# Returns the (B, 3, imgsz, imgsz) float32 batch, the scale of every frame and its (left, top) padding
+def letterbox(frames, imgsz=640):
+    shapes = np.array([frame.shape[:2] for frame in frames], dtype=np.float64).reshape(-1, 2)
+    scales = imgsz / shapes.max(axis=1)
+    sizes = np.maximum(1, np.round(shapes[:, ::-1] * scales[:, None])).astype(int)
+    pads = (imgsz - sizes) // 2
+
+    batch = np.full((len(frames), imgsz, imgsz, 3), PAD_VALUE, dtype=np.uint8)
+    for image, frame, (width, height), (left, top) in zip(batch, frames, sizes.tolist(), pads.tolist()):
+        if frame.shape[1] != width or frame.shape[0] != height:
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_LINEAR)
+        image[top:top + height, left:left + width] = frame
+    tensor = np.ascontiguousarray(batch[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32)
+    tensor *= 1 / 255
+    return tensor, scales, pads
+
+
+# Raw YOLOv8 output (B, 4 + classes, anchors) to one Detections per frame in frame pixels.
+# max_candidates caps the boxes that go into NMS, highest scores first
+def decode_output(output, scales, pads, frame_shapes, conf=0.25, iou=0.7, max_det=300, max_candidates=30000):
+    preds = np.asarray(output).transpose(0, 2, 1)
+    classes = preds[..., 4:].argmax(axis=2)
+    scores = np.take_along_axis(preds[..., 4:], classes[..., None], axis=2)[..., 0]
+    centers, sizes = preds[..., :2], preds[..., 2:4] / 2
+    boxes = np.concatenate([centers - sizes, centers + sizes], axis=2)
+
+    results = []
+    for i, (height, width) in enumerate(frame_shapes):
+        candidates = np.flatnonzero(scores[i] >= conf)
+        if len(candidates) > max_candidates:
+            candidates = candidates[np.argpartition(-scores[i, candidates], max_candidates)[:max_candidates]]
+        frame_boxes, frame_scores, frame_classes = boxes[i, candidates], scores[i, candidates], classes[i, candidates]
+        keep = nms(frame_boxes, frame_scores, iou, frame_classes, max_keep=max_det)
+        offset = np.tile(pads[i], 2)
+        frame_boxes = clip_boxes((frame_boxes[keep] - offset) / scales[i], width, height)
+        results.append(make_detections(frame_boxes, frame_scores[keep], frame_classes[keep]))
+    return results
+
+
+# Detector (see detectors.py) over an exported .onnx model.
+# Models exported with a fixed batch size run in chunks of that size; threads sets the
+# ONNX Runtime intra-op threads. stats gets the preprocess/infer/postprocess time of every call
+class OnnxDetector:
+    def __init__(self, path, imgsz=None, conf=0.25, iou=0.7, max_det=300, threads=None, providers=None,
+                 stats=None):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=providers or ['CPUExecutionProvider'])
+        self.path = path
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+        self.stats = StageStats() if stats is None else stats
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, _ = model_input.shape
+        self.batch_size = batch if isinstance(batch, int) else None
+        self.imgsz = imgsz or (height if isinstance(height, int) else 640)
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata['names']) if 'names' in metadata else None
+
+    # Raw output of one letterboxed batch
+    def run(self, tensor):
+        step = self.batch_size or len(tensor)
+        outputs = [self.session.run(None, {self.input_name: tensor[start:start + step]})[0]
+                   for start in range(0, len(tensor), step)]
+        return np.concatenate(outputs) if len(outputs) > 1 else outputs[0]
+
+    def __call__(self, frames):
+        if not len(frames):
+            return []
+        with self.stats.stage('preprocess'):
+            tensor, scales, pads = letterbox(frames, self.imgsz)
+        with self.stats.stage('infer'):
+            output = self.run(tensor)
+        with self.stats.stage('postprocess'):
+            return decode_output(output, scales, pads, [frame.shape[:2] for frame in frames],
+                                 self.conf, self.iou, self.max_det)
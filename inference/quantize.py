@@ -0,0 +1,282 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+import cv2
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.boxes import yolo_to_xyxy
+from common.labels import write_data_yaml
+from common.profiling import StageStats
+from common.shards import IMAGE_EXTENSIONS, pair_labels, read_yolo_txt
+from inference.metrics import mean_average_precision
+from inference.onnx_detector import OnnxDetector, letterbox
+
+# Export-and-serve path for CPU deployment (Jetson-class boxes without a workstation GPU):
+#   build_model   - untrained YOLOv8 from the yaml that ships with ultralytics, nothing is downloaded
+#   train_local   - a short CPU training run of a built model on our frames and labels
+#   export_onnx   - .pt weights (best_rgb.pt, best_thermal.pt) or a built model to a static ONNX file
+#   quantize_int8 - static INT8 (QDQ) quantization calibrated on rendered/augmented frames
+#   compare       - FP32 vs INT8 on the CPU: latency p50/p95 per stage and mAP
+# Exported models run through OnnxDetector (onnx_detector.py); torch, ultralytics and
+# onnx are only needed to export and quantize, onnxruntime to run.
+
+CALIBRATION_METHODS = ['minmax', 'entropy', 'percentile']
+ACTIVATION_TYPES = ['uint8', 'int8']
+
+
+# YOLOv8 of the given scale with random weights and num_classes outputs (8 = the mine
+# types of render_and_label.MINES). Enough to measure latency; an untrained model scores
+# every box the same, so accuracy needs train_local() or trained weights
+def build_model(workdir, scale='n', num_classes=8):
+    import yaml
+    from ultralytics import YOLO
+    from ultralytics.nn.tasks import yaml_model_load
+    config = {key: value for key, value in yaml_model_load(f'yolov8{scale}.yaml').items() if key != 'yaml_file'}
+    config['nc'] = num_classes
+    os.makedirs(workdir, exist_ok=True)
+    # The scale letter in the file name tells ultralytics which width/depth to use
+    path = os.path.join(workdir, f'yolov8{scale}-local.yaml')
+    with open(path, 'w') as yaml_file:
+        yaml.safe_dump(config, yaml_file)
+    return YOLO(path)
+
+
+# Trains a model for a few epochs on frames_dir + labels_dir (YOLO txt) and returns the best weights.
+# YOLOv8 expects images/ and labels/ side by side, so the pairs are linked into workdir/dataset
+def train_local(model, frames_dir, labels_dir, workdir, epochs=30, imgsz=640, batch=8, num_classes=8):
+    dataset = os.path.join(workdir, 'dataset')
+    images, labels = os.path.join(dataset, 'images'), os.path.join(dataset, 'labels')
+    shutil.rmtree(dataset, ignore_errors=True)
+    os.makedirs(images)
+    os.makedirs(labels)
+    image_names = sorted(f for f in os.listdir(frames_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+    label_names = [os.path.splitext(f)[0] for f in os.listdir(labels_dir) if f.endswith('.txt')]
+    for image_name, label in pair_labels(image_names, label_names):
+        link_file(os.path.join(frames_dir, image_name), os.path.join(images, image_name))
+        if label is not None:
+            stem = os.path.splitext(image_name)[0]
+            link_file(os.path.join(labels_dir, label + '.txt'), os.path.join(labels, stem + '.txt'))
+
+    data_yaml = os.path.join(dataset, 'data.yaml')
+    write_data_yaml(data_yaml, [str(i) for i in range(num_classes)], train=os.path.abspath(images),
+                    val=os.path.abspath(images))
+    model.train(data=data_yaml, epochs=epochs, imgsz=imgsz, batch=batch, workers=0, device='cpu',
+                project=os.path.abspath(workdir), name='train', exist_ok=True, plots=False, verbose=False)
+    return str(model.trainer.best)
+
+
+# Symlink, or a copy where links are not allowed (Windows without developer mode)
+def link_file(source, target):
+    try:
+        os.symlink(os.path.abspath(source), target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+# Exports weights (path) or a YOLO model to a fixed-shape ONNX file at output_path
+def export_onnx(model, output_path, imgsz=640, opset=17, batch=1):
+    from ultralytics import YOLO
+    model = YOLO(model) if isinstance(model, str) else model
+    exported = model.export(format='onnx', imgsz=imgsz, opset=opset, batch=batch, simplify=False, dynamic=False)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    if os.path.abspath(exported) != os.path.abspath(output_path):
+        shutil.move(exported, output_path)
+    return output_path
+
+
+def read_image(path):
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise IOError(f"Could not read {path}")
+    return image
+
+
+# A seeded sample of up to count images of a folder, sorted by name
+def sample_images(images_dir, count=None, seed=0):
+    paths = sorted(os.path.join(images_dir, f) for f in os.listdir(images_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+    if count is not None and count < len(paths):
+        chosen = np.random.default_rng(seed).choice(len(paths), count, replace=False)
+        paths = [paths[i] for i in sorted(chosen)]
+    return paths
+
+
+# Feeds letterboxed frames to the calibrator; frames are decoded one batch at a time
+def calibration_reader(paths, input_name, imgsz, batch_size=1):
+    from onnxruntime.quantization import CalibrationDataReader
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self.rewind()
+
+        def get_next(self):
+            start = next(self.starts, None)
+            if start is None:
+                return None
+            frames = [read_image(path) for path in paths[start:start + batch_size]]
+            return {input_name: letterbox(frames, imgsz)[0]}
+
+        def rewind(self):
+            self.starts = iter(range(0, len(paths) - batch_size + 1, batch_size))
+
+    return FrameReader()
+
+
+# Nodes of the Detect head that stay FP32: the DFL (a softmax and a fixed 0..15 convolution)
+# and the box decoding. Quantizing them moves every box, the head convolutions are quantized
+def head_nodes(model):
+    prefixes = {node.name.split('/')[1] for node in model.graph.node
+                if node.name.startswith('/model.') and node.name.split('/')[1][6:].isdigit()}
+    head = '/{}/'.format(max(prefixes, key=lambda prefix: int(prefix[6:]))) if prefixes else None
+    return [node.name for node in model.graph.node
+            if head and node.name.startswith(head) and (node.op_type != 'Conv' or '/dfl/' in node.name)]
+
+
+# Static INT8 quantization of an exported model (QDQ format): signed 8-bit weights per channel,
+# 8-bit activations with ranges measured on calibration_paths. activations='uint8' (U8S8) uses
+# the VNNI/AVX2 integer kernels of x86 CPUs; on an AVX-512 VNNI Xeon U8S8 ran ~1.6x faster than FP32 for
+# yolov8n at 320 px, while int8 (S8S8) was 3x slower than FP32. Try both on ARM boards
+def quantize_int8(fp32_path, int8_path, calibration_paths, method='minmax', activations='uint8', per_channel=True,
+                  keep_head_fp32=True):
+    import onnx
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quant_pre_process, quantize_static
+    if not calibration_paths:
+        raise ValueError("INT8 calibration needs at least one frame")
+    source = onnx.load(fp32_path)
+    dims = source.graph.input[0].type.tensor_type.shape.dim
+    batch_size, imgsz = dims[0].dim_value or 1, dims[2].dim_value
+    if len(calibration_paths) < batch_size:
+        raise ValueError(f"The model takes batches of {batch_size}, got {len(calibration_paths)} calibration frames")
+    methods = {'minmax': CalibrationMethod.MinMax, 'entropy': CalibrationMethod.Entropy,
+               'percentile': CalibrationMethod.Percentile}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Shape inference and constant folding first, as the quantizer expects
+        prepared = os.path.join(tmp, 'prepared.onnx')
+        quant_pre_process(fp32_path, prepared)
+        excluded = head_nodes(onnx.load(prepared)) if keep_head_fp32 else []
+        reader = calibration_reader(calibration_paths, source.graph.input[0].name, imgsz, batch_size)
+        activation_type = QuantType.QUInt8 if activations == 'uint8' else QuantType.QInt8
+        quantize_static(prepared, int8_path, reader, quant_format=QuantFormat.QDQ, activation_type=activation_type,
+                        weight_type=QuantType.QInt8, per_channel=per_channel, calibrate_method=methods[method],
+                        nodes_to_exclude=excluded)
+
+    # Keep the class names, stride and image size that ultralytics stored in the FP32 file
+    quantized = onnx.load(int8_path)
+    onnx.helper.set_model_props(quantized, {prop.key: prop.value for prop in source.metadata_props})
+    onnx.save(quantized, int8_path)
+    return int8_path
+
+
+# Ground truth of every image as (classes, xyxy pixel boxes) from YOLO txt labels
+def load_ground_truth(paths, frames, labels_dir):
+    label_names = [os.path.splitext(f)[0] for f in os.listdir(labels_dir) if f.endswith('.txt')]
+    ground_truth = []
+    for (_, label), frame in zip(pair_labels([os.path.basename(path) for path in paths], label_names), frames):
+        if label is None:
+            ground_truth.append((np.zeros(0, dtype=np.int64), np.zeros((0, 4))))
+            continue
+        classes, boxes = read_yolo_txt(os.path.join(labels_dir, label + '.txt'))
+        ground_truth.append((classes, yolo_to_xyxy(boxes, frame.shape[1], frame.shape[0])))
+    return ground_truth
+
+
+# The best count detections over all frames as pseudo ground truth, one (classes, boxes) per frame.
+# One score cut for every frame, as mAP ranks the detections of all frames together
+def top_detections(detections, count):
+    scores = np.sort(np.concatenate([frame.scores for frame in detections]))[::-1]
+    cut = scores[min(count, len(scores)) - 1] if len(scores) else np.inf
+    return [(frame.classes[frame.scores >= cut], frame.boxes[frame.scores >= cut]) for frame in detections]
+
+
+# One frame at a time, like the video pipeline; per-stage latencies after warmup calls
+def measure_latency(detector, frames, repeat=20, warmup=3):
+    for frame in frames[:warmup]:
+        detector([frame])
+    detector.stats = StageStats()
+    for i in range(repeat):
+        with detector.stats.stage('total'):
+            detector([frames[i % len(frames)]])
+    return detector.stats.summary()
+
+
+# FP32 vs INT8 on the same frames. Accuracy is mAP against labels_dir, or without labels against
+# the best FP32 detections, reference_top per frame on average (how far INT8 drifts from FP32).
+# conf 0.001 and iou 0.7 are the YOLOv8 validation settings
+def compare(fp32_path, int8_path, images_dir, labels_dir=None, count=32, repeat=20, threads=None, conf=0.001,
+            iou=0.7, reference_top=20, seed=0):
+    paths = sample_images(images_dir, count, seed)
+    frames = [read_image(path) for path in paths]
+    report = {'frames': len(frames), 'reference': 'labels' if labels_dir else f'fp32_top{reference_top}'}
+    detections = {}
+    for name, path in [('fp32', fp32_path), ('int8', int8_path)]:
+        detector = OnnxDetector(path, conf=conf, iou=iou, threads=threads)
+        start = time.perf_counter()
+        detections[name] = [detector([frame])[0] for frame in frames]
+        report[name] = {'path': path, 'size_mb': round(os.path.getsize(path) / 2 ** 20, 2),
+                        'imgsz': detector.imgsz, 'eval_s': round(time.perf_counter() - start, 3),
+                        'latency': measure_latency(detector, frames, repeat)}
+
+    if labels_dir:
+        ground_truth = load_ground_truth(paths, frames, labels_dir)
+    else:
+        ground_truth = top_detections(detections['fp32'], reference_top * len(frames))
+    for name in ['fp32', 'int8']:
+        report[name]['map'] = mean_average_precision(detections[name], ground_truth)
+
+    fp32_ms, int8_ms = report['fp32']['latency']['total']['p50_ms'], report['int8']['latency']['total']['p50_ms']
+    report['speedup_p50'] = round(fp32_ms / max(int8_ms, 1e-9), 3)
+    report['map50_95_drop'] = round(report['fp32']['map']['map50_95'] - report['int8']['map']['map50_95'], 4)
+    return report
+
+
+# python -m inference.quantize <frames_dir> [--labels labels_dir] [--weights best_rgb.pt]
+# Without --weights a YOLOv8 (--scale, --classes) is built locally, and with --labels and
+# --train_epochs trained on the frames first
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a detector to ONNX, quantize it to INT8 and compare both")
+    parser.add_argument("frames", help="Rendered or augmented frames used for calibration and evaluation")
+    parser.add_argument("--labels", default=None, help="YOLO txt labels of the frames, for mAP against ground truth")
+    parser.add_argument("--weights", default=None, help=".pt weights or an exported .onnx; default builds a model")
+    parser.add_argument("--scale", default="n", choices=list("nsmlx"))
+    parser.add_argument("--classes", type=int, default=8)
+    parser.add_argument("--train_epochs", type=int, default=0, help="Train the built model on --labels first")
+    parser.add_argument("--output_dir", default="onnx_models")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--calibration", type=int, default=64, help="Frames used for INT8 calibration")
+    parser.add_argument("--method", default="minmax", choices=CALIBRATION_METHODS)
+    parser.add_argument("--activations", default="uint8", choices=ACTIVATION_TYPES)
+    parser.add_argument("--quantize_head", action="store_true", help="Also quantize the box decoding")
+    parser.add_argument("--eval", type=int, default=32, help="Frames used for latency and mAP")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=None, help="ONNX Runtime intra-op threads")
+    parser.add_argument("--report", default=None, help="Write the comparison as JSON")
+    args = parser.parse_args()
+
+    fp32_path = os.path.join(args.output_dir, 'model_fp32.onnx')
+    int8_path = os.path.join(args.output_dir, 'model_int8.onnx')
+    if args.weights and args.weights.endswith('.onnx'):
+        fp32_path = args.weights
+    else:
+        model = args.weights or build_model(args.output_dir, args.scale, args.classes)
+        if not args.weights and args.labels and args.train_epochs:
+            model = train_local(model, args.frames, args.labels, args.output_dir, args.train_epochs, args.imgsz,
+                                num_classes=args.classes)
+        export_onnx(model, fp32_path, args.imgsz)
+    quantize_int8(fp32_path, int8_path, sample_images(args.frames, args.calibration, seed=1), args.method,
+                  args.activations, keep_head_fp32=not args.quantize_head)
+
+    report = compare(fp32_path, int8_path, args.frames, args.labels, args.eval, args.repeat, args.threads)
+    for name in ['fp32', 'int8']:
+        result = report[name]
+        print(f"{name}: {result['size_mb']} MB, p50 {result['latency']['total']['p50_ms']} ms, "
+              f"p95 {result['latency']['total']['p95_ms']} ms, mAP50 {result['map']['map50']:.4f}, "
+              f"mAP50-95 {result['map']['map50_95']:.4f}")
+    print(f"INT8 speedup {report['speedup_p50']}x, mAP50-95 drop {report['map50_95_drop']} ({report['reference']})")
+    if args.report:
+        with open(args.report, 'w') as report_file:
+            json.dump(report, report_file, indent=1)
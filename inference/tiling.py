@@ -0,0 +1,174 @@
+import os
+import sys
+import numpy as np
+import cv2
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.boxes import box_iou, nms
+from inference.detectors import Detections, make_detections
+
+# Sliced inference for frames much larger than the training imgsz.
+# The frame is cut into overlapping tiles of the model's input size, so small mines
+# keep their pixels; tiles go through the detector in batches, their boxes are moved
+# back to frame coordinates and merged across tile borders with NMS or weighted box
+# fusion. Boxes cut by a tile border are dropped when a neighbouring tile saw the
+# whole object. Flat tiles (plain soil, sky) are skipped.
+
+
+# Start offsets of tiles of size `tile` covering `length`; the last tile ends at the edge
+def tile_starts(length, tile, overlap=0.2):
+    if length <= tile:
+        return np.zeros(1, dtype=np.int64)
+    step = max(1, int(tile * (1 - overlap)))
+    starts = np.arange(0, length - tile, step)
+    return np.append(starts, length - tile).astype(np.int64)
+
+
+# (T, 2) x, y origins of the tiles of a width x height frame
+def tile_grid(width, height, tile=640, overlap=0.2):
+    xs, ys = np.meshgrid(tile_starts(width, tile, overlap), tile_starts(height, tile, overlap))
+    return np.stack([xs.ravel(), ys.ravel()], axis=1)
+
+
+# Standard deviation of the gray values inside every tile, from integral images of a
+# downscaled copy of the frame; all tiles are measured at once
+def tile_std(frame, origins, tile, scale=4):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    height, width = gray.shape
+    small = cv2.resize(gray, (max(1, width // scale), max(1, height // scale)), interpolation=cv2.INTER_AREA)
+    total, squares = cv2.integral2(small, sdepth=cv2.CV_64F)
+    x1, y1 = (origins // scale).T
+    x2 = np.minimum(x1 + max(1, min(tile, width) // scale), small.shape[1])
+    y2 = np.minimum(y1 + max(1, min(tile, height) // scale), small.shape[0])
+
+    def window(table):
+        return table[y2, x2] - table[y1, x2] - table[y2, x1] + table[y1, x1]
+
+    area = (x2 - x1) * (y2 - y1)
+    mean = window(total) / area
+    return np.sqrt(np.maximum(window(squares) / area - mean * mean, 0))
+
+
+# Boxes touching a tile border that lies inside the frame (the object may continue in the next tile)
+def cut_by_tile(boxes, origin, tile_shape, frame_shape, margin=1):
+    x, y = origin
+    height, width = tile_shape[:2]
+    cut = np.zeros(len(boxes), dtype=bool)
+    if x > 0:
+        cut |= boxes[:, 0] <= x + margin
+    if y > 0:
+        cut |= boxes[:, 1] <= y + margin
+    if x + width < frame_shape[1]:
+        cut |= boxes[:, 2] >= x + width - margin
+    if y + height < frame_shape[0]:
+        cut |= boxes[:, 3] >= y + height - margin
+    return cut
+
+
+# Drops cut boxes that mostly lie inside a whole box of the same class
+def drop_cut(detections, cut, overlap=0.5):
+    if not cut.any() or cut.all():
+        return detections
+    parts, whole = detections.boxes[cut], detections.boxes[~cut]
+    top_left = np.maximum(parts[:, None, :2], whole[None, :, :2])
+    bottom_right = np.minimum(parts[:, None, 2:], whole[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    part_areas = np.prod(np.maximum(parts[:, 2:] - parts[:, :2], 1e-9), axis=1)
+    same_class = detections.classes[cut][:, None] == detections.classes[~cut][None, :]
+    covered = ((inter / part_areas[:, None] > overlap) & same_class).any(axis=1)
+    keep = ~cut
+    keep[np.flatnonzero(cut)[~covered]] = True
+    return Detections(*(field[keep] for field in detections))
+
+
+# Weighted box fusion: overlapping boxes of one class become one box whose corners are
+# the score-weighted mean; the fused score is the mean score of the cluster.
+# Returns fused boxes, scores and classes
+def fuse_boxes(boxes, scores, classes, iou_threshold=0.5):
+    order = np.argsort(-scores, kind='stable')
+    fused_boxes, fused_scores, fused_classes = [], [], []
+    members = []
+    for i in order:
+        match = -1
+        same_class = [k for k, c in enumerate(fused_classes) if c == classes[i]]
+        if same_class:
+            iou = box_iou(boxes[i], np.array([fused_boxes[k] for k in same_class]))[0]
+            if iou.max() > iou_threshold:
+                match = same_class[int(iou.argmax())]
+        if match < 0:
+            fused_boxes.append(boxes[i].astype(np.float64))
+            fused_scores.append(scores[i])
+            fused_classes.append(classes[i])
+            members.append([i])
+            continue
+        members[match].append(i)
+        weights = scores[members[match]]
+        fused_boxes[match] = (boxes[members[match]] * weights[:, None]).sum(axis=0) / weights.sum()
+        fused_scores[match] = weights.mean()
+    return (np.array(fused_boxes).reshape(-1, 4), np.array(fused_scores, dtype=np.float32),
+            np.array(fused_classes, dtype=np.int64))
+
+
+# Merges detections gathered from all tiles of one frame
+def merge_detections(detections, merge='nms', iou_threshold=0.5):
+    if len(detections.boxes) == 0:
+        return detections
+    if merge == 'wbf':
+        boxes, scores, classes = fuse_boxes(detections.boxes, detections.scores, detections.classes, iou_threshold)
+        return make_detections(boxes, scores, classes)
+    keep = nms(detections.boxes, detections.scores, iou_threshold, detections.classes)
+    return Detections(*(field[keep] for field in detections))
+
+
+# Wraps a detector so each frame is run as tiles; a drop-in detector for run_pipeline.
+# min_std skips tiles whose gray values vary less than that (0 runs every tile)
+class TiledDetector:
+    def __init__(self, detector, tile=640, overlap=0.2, batch_size=8, merge='nms', iou_threshold=0.5, min_std=4.0):
+        self.detector = detector
+        self.tile = tile
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.merge = merge
+        self.iou_threshold = iou_threshold
+        self.min_std = min_std
+        self.tiles_run = 0
+        self.tiles_skipped = 0
+
+    @property
+    def names(self):
+        return getattr(self.detector, 'names', None)
+
+    # Tile views of one frame worth running, with their origins
+    def tiles(self, frame):
+        height, width = frame.shape[:2]
+        origins = tile_grid(width, height, self.tile, self.overlap)
+        if self.min_std > 0:
+            busy = tile_std(frame, origins, self.tile) >= self.min_std
+            self.tiles_skipped += int((~busy).sum())
+            origins = origins[busy]
+        return [(frame[y:y + self.tile, x:x + self.tile], (x, y)) for x, y in origins.tolist()]
+
+    def __call__(self, frames):
+        jobs = [(index, crop, origin) for index, frame in enumerate(frames) for crop, origin in self.tiles(frame)]
+        self.tiles_run += len(jobs)
+        found = [[] for _ in frames]
+        cuts = [[] for _ in frames]
+        for start in range(0, len(jobs), self.batch_size):
+            batch = jobs[start:start + self.batch_size]
+            for (index, crop, (x, y)), detections in zip(batch, self.detector([crop for _, crop, _ in batch])):
+                detections = detections._replace(boxes=detections.boxes + np.float32([x, y, x, y]))
+                found[index].append(detections)
+                cuts[index].append(cut_by_tile(detections.boxes, (x, y), crop.shape, frames[index].shape))
+        merged = []
+        for parts, cut in zip(found, cuts):
+            detections = self.concat(parts)
+            if parts:
+                detections = drop_cut(detections, np.concatenate(cut))
+            merged.append(merge_detections(detections, self.merge, self.iou_threshold))
+        return merged
+
+    @staticmethod
+    def concat(parts):
+        if not parts:
+            return make_detections()
+        return Detections(*(np.concatenate(field) for field in zip(*parts)))
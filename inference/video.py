@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import cv2
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.profiling import StageStats
+from inference.detectors import StubDetector, YoloDetector, filter_detections
+from inference.onnx_detector import OnnxDetector
+from inference.tiling import TiledDetector
+
+# Video inference as three stages on bounded queues:
+#   decode thread -> infer thread (batches) -> annotate/encode in the caller's thread
+# so reading, running the model and writing the next frames overlap.
+# Replaces the serial cap.read() / model.track() / draw / out.write() loop of the notebooks.
+
+_DONE = object()
+
+
+# Draws the boxes like the notebooks: green box, "ID: .. Conf: .. class" label
+def draw_detections(frame, detections, class_names=None, color=(0, 255, 0)):
+    for (x1, y1, x2, y2), conf, class_id, obj_id in zip(detections.boxes.astype(int).tolist(),
+                                                        detections.scores.tolist(),
+                                                        detections.classes.tolist(), detections.ids.tolist()):
+        class_name = class_names[class_id] if class_names is not None else class_id
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        label = f'ID: {obj_id} Conf: {conf:.2f} {class_name}'
+        cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
+    return frame
+
+
+# Blocks until the item fits in the queue or stop is set
+def _put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+# Waits for the next item until stop is set; None once stopped, so no stage outlives the pipeline
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return None
+
+
+def _decode(frames, out_q, stop, stats):
+    try:
+        iterator = iter(frames)
+        index = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            frame = next(iterator, _DONE)
+            if frame is _DONE:
+                break
+            stats.add('decode', time.perf_counter() - start)
+            if not _put(out_q, (index, frame), stop):
+                return
+            index += 1
+    except Exception as error:
+        _put(out_q, (_DONE, error), stop)
+        return
+    _put(out_q, (_DONE, None), stop)
+
+
+# Runs the detector on every infer_every-th frame, in batches of up to batch_size frames
+# that are already decoded; skipped frames reuse the last detections
+def _infer(detector, in_q, out_q, stop, stats, batch_size, infer_every, min_conf):
+    last = None
+    finished = False
+    try:
+        while not finished and not stop.is_set():
+            item = _get(in_q, stop)
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < batch_size and batch[-1][0] is not _DONE:
+                try:
+                    batch.append(in_q.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1][0] is _DONE:
+                end = batch.pop()
+                if end[1] is not None:
+                    _put(out_q, end, stop)
+                    return
+                finished = True
+
+            todo = [frame for index, frame in batch if index % infer_every == 0]
+            found = []
+            if todo:
+                start = time.perf_counter()
+                found = [filter_detections(d, min_conf) for d in detector(todo)]
+                stats.add('infer', time.perf_counter() - start)
+                stats.add('infer_per_frame', (time.perf_counter() - start) / len(todo))
+            found = iter(found)
+            for index, frame in batch:
+                inferred = index % infer_every == 0
+                if inferred:
+                    last = next(found)
+                if not _put(out_q, (index, frame, last, inferred), stop):
+                    return
+    except Exception as error:
+        _put(out_q, (_DONE, error), stop)
+        return
+    _put(out_q, (_DONE, None), stop)
+
+
+# Runs frames (any iterable of BGR arrays) through detector.
+# on_frame(frame, detections) gets every annotated frame in order, e.g. a VideoWriter.write wrapper.
+# Returns frame counts, overall FPS and per-stage latencies
+def run_pipeline(frames, detector, on_frame=None, batch_size=1, infer_every=1, queue_size=8, min_conf=0.4,
+                 class_names=None, draw=True):
+    stats = StageStats()
+    stop = threading.Event()
+    decoded = queue.Queue(maxsize=max(queue_size, batch_size))
+    detected = queue.Queue(maxsize=max(queue_size, batch_size))
+    threads = [threading.Thread(target=_decode, args=(frames, decoded, stop, stats), name='video-decode',
+                                daemon=True),
+               threading.Thread(target=_infer, args=(detector, decoded, detected, stop, stats, batch_size,
+                                                     infer_every, min_conf), name='video-infer', daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    count = inferred_count = 0
+    start = time.perf_counter()
+    try:
+        while True:
+            item = detected.get()
+            if item[0] is _DONE:
+                if item[1] is not None:
+                    raise item[1]
+                break
+            _, frame, detections, inferred = item
+            stage_start = time.perf_counter()
+            if draw:
+                draw_detections(frame, detections, class_names)
+            if on_frame:
+                on_frame(frame, detections)
+            stats.add('annotate_encode', time.perf_counter() - stage_start)
+            count += 1
+            inferred_count += inferred
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=1)
+
+    seconds = time.perf_counter() - start
+    return {'frames': count, 'inferred_frames': inferred_count, 'seconds': round(seconds, 4),
+            'fps': round(count / seconds, 2) if seconds > 0 else 0.0, 'stages': stats.summary()}
+
+
+# Frames of a video file, read one at a time
+def read_frames(cap):
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            return
+        yield frame
+
+
+# Annotates a video file like the notebooks; output_path=None only runs detection
+def run_video(video_path, output_path, detector, class_names=None, **options):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video file {video_path}")
+    out = None
+    try:
+        if output_path:
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+            fps = cap.get(cv2.CAP_PROP_FPS) or 30
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+        if class_names is None:
+            class_names = getattr(detector, 'names', None)
+        on_frame = (lambda frame, detections: out.write(frame)) if out is not None else None
+        return run_pipeline(read_frames(cap), detector, on_frame, class_names=class_names,
+                            draw=out is not None, **options)
+    finally:
+        cap.release()
+        if out is not None:
+            out.release()
+
+
+# python -m inference.video input.mp4 output.mp4 --weights best_rgb.pt [--batch 4 --infer_every 2]
+# --weights stub runs the CPU stand-in detector, --weights model.onnx the exported FP32/INT8 model
+# (inference/quantize.py) through ONNX Runtime, --tile 640 runs sliced inference (inference/tiling.py)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a detector over a video with pipelined stages")
+    parser.add_argument("video")
+    parser.add_argument("output", nargs='?', default=None)
+    parser.add_argument("--weights", default="best_rgb.pt")
+    parser.add_argument("--no_track", action="store_true", help="Batched predict() instead of track()")
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--infer_every", type=int, default=1, help="Run the model on every n-th frame")
+    parser.add_argument("--queue", type=int, default=8)
+    parser.add_argument("--conf", type=float, default=0.4)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--tile", type=int, default=0, help="Tile size for sliced inference, 0 = whole frames")
+    parser.add_argument("--merge", default="nms", choices=["nms", "wbf"], help="How tile detections are merged")
+    args = parser.parse_args()
+
+    if args.weights == 'stub':
+        model = StubDetector(latency=0.02)
+    elif args.weights.endswith('.onnx'):
+        # The input size is fixed at export time
+        model = OnnxDetector(args.weights)
+    else:
+        # Tracker ids are per tile, so sliced inference always uses predict()
+        model = YoloDetector(args.weights, track=not (args.no_track or args.tile), imgsz=args.imgsz)
+    if args.tile:
+        model = TiledDetector(model, tile=args.tile, batch_size=8, merge=args.merge)
+    report = run_video(args.video, args.output, model, batch_size=args.batch, infer_every=args.infer_every,
+                       queue_size=args.queue, min_conf=args.conf)
+    print(json.dumps(report, indent=1))
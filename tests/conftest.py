@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The pipelines are plain script folders, so tests import them the way the scripts do
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in [ROOT, os.path.join(ROOT, 'Thermal-model'), os.path.join(ROOT, 'RGB-model')]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,71 @@
+import time
+import numpy as np
+import pytest
+from PIL import Image, ImageFilter
+
+from array_backend import augment_array
+from augmentation import crop
+
+CROP_SIZE = (96, 64)
+
+
+# Noisy RGBA frame with a hot square, and a half-transparent biome overlay
+def sample_images(seed, size=(128, 100), opaque=True):
+    rng = np.random.default_rng(seed)
+    width, height = size
+    img = rng.integers(0, 256, (height, width, 4), dtype=np.uint8)
+    if opaque:
+        img[..., 3] = 255
+    img[30:60, 40:80, :3] = 250
+    return img
+
+
+def biome_overlay(seed, size):
+    rng = np.random.default_rng(seed + 1)
+    overlay = rng.integers(0, 256, (size[1], size[0], 4), dtype=np.uint8)
+    overlay[..., 3] = rng.integers(0, 160, (size[1], size[0]), dtype=np.uint8)
+    return overlay
+
+
+# PIL's crop -> GaussianBlur -> rotate -> alpha_composite chain
+def pil_chain(img, overlay, angle, crop_size=CROP_SIZE):
+    background = crop(Image.fromarray(img, 'RGBA'), crop_size)
+    background = background.filter(ImageFilter.GaussianBlur(radius=2)).rotate(angle, expand=True)
+    return Image.alpha_composite(background, Image.fromarray(overlay, 'RGBA'))
+
+
+# The array chain must match the PIL chain, on opaque frames and on ones with their own alpha
+@pytest.mark.parametrize('opaque', [True, False])
+@pytest.mark.parametrize('angle', [0, 90, 180, 270])
+def test_augment_array_matches_pil(angle, opaque):
+    img = sample_images(angle, opaque=opaque)
+    size = CROP_SIZE if angle % 180 == 0 else CROP_SIZE[::-1]
+    overlay = biome_overlay(angle, size)
+
+    expected = np.array(pil_chain(img, overlay, angle), dtype=np.int16)
+    result = augment_array(img.copy(), overlay, CROP_SIZE, angle).astype(np.int16)
+    assert result.shape == expected.shape
+    diff = np.abs(result - expected)
+    assert diff.max() <= 15
+    assert diff.mean() <= 0.5
+
+
+# Best of a few runs, in seconds
+def best_time(func, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+# The point of the array backend: the same chain at the real 1980 crop size in less time than PIL
+@pytest.mark.parametrize('opaque', [True, False])
+def test_augment_array_faster_than_pil(opaque):
+    crop_size = (1980, 1980)
+    img = sample_images(0, (2100, 2100), opaque)
+    overlay = biome_overlay(0, crop_size)
+    pil = best_time(lambda: pil_chain(img, overlay, 90, crop_size))
+    array = best_time(lambda: augment_array(img.copy(), overlay, crop_size, 90))
+    assert array < 0.8 * pil, f"array backend {array * 1000:.0f} ms, PIL {pil * 1000:.0f} ms"
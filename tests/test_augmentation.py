@@ -0,0 +1,65 @@
+import os
+import numpy as np
+import pytest
+from PIL import Image
+
+from augmentation import augment, augment_stream, image_key, plan_jobs, rotated_size
+from common.manifest import BuildManifest
+from common.shards import read_yolo_txt
+
+
+# A few small thermal frames and biome overlays
+def write_inputs(root, images=4, size=160):
+    rng = np.random.default_rng(0)
+    img_dir, biome_dir = os.path.join(root, 'thermal'), os.path.join(root, 'biomes')
+    os.makedirs(img_dir)
+    os.makedirs(biome_dir)
+    for i in range(images):
+        frame = rng.integers(60, 120, (size, size, 3), dtype=np.uint8)
+        frame[50:70, 80:100] = 240
+        Image.fromarray(frame).save(os.path.join(img_dir, f'thermal_{i * 4 + 1}.png'))
+    for i in range(2):
+        Image.fromarray(rng.integers(0, 256, (size, size, 4), dtype=np.uint8)).save(
+            os.path.join(biome_dir, f'biome_{i}.png'))
+    return img_dir, biome_dir
+
+
+# augment() writes exactly the samples augment_stream() yields, for both backends
+def test_augment_saves_the_streamed_samples(tmp_path):
+    img_dir, biome_dir = write_inputs(str(tmp_path))
+    options = dict(crop_size=(128, 128), angles=[0, 90, 30], seed=5, bboxes=[(20, 20, 60, 50)])
+    for backend in ['pil', 'numpy']:
+        dataset, labels = str(tmp_path / backend / 'images'), str(tmp_path / backend / 'labels')
+        augment(img_dir, biome_dir, dataset, labels, backend=backend, **options)
+        samples = list(augment_stream(img_dir, biome_dir, backend=backend, with_names=True, **options))
+        assert sorted(os.listdir(dataset)) == sorted(fn + '.png' for fn, _, _ in samples)
+        for fn, image, yolo in samples:
+            with Image.open(os.path.join(dataset, fn + '.png')) as saved:
+                assert np.array_equal(np.asarray(saved), image)
+            assert np.allclose(read_yolo_txt(os.path.join(labels, fn + '.txt'))[1], yolo, atol=1e-5)
+
+
+# An incremental rerun rebuilds nothing; the key follows the job's named fields, not the angle list
+def test_incremental_keys(tmp_path, capsys):
+    img_dir, biome_dir = write_inputs(str(tmp_path))
+    dataset, labels = str(tmp_path / 'images'), str(tmp_path / 'labels')
+    options = dict(crop_size=(128, 128), seed=3, bboxes=[(20, 20, 60, 50)], incremental=True)
+    augment(img_dir, biome_dir, dataset, labels, **options)
+    capsys.readouterr()
+    augment(img_dir, biome_dir, dataset, labels, **options)
+    assert '4 of 4 images are up to date' in capsys.readouterr().out
+
+    manifest = BuildManifest(str(tmp_path / 'manifest.json'))
+    job = plan_jobs(img_dir, biome_dir, (128, 128), [0, 90], seed=3, bboxes=[(20, 20, 60, 50)])[0][0]
+    key = image_key(manifest, job, ['txt'])
+    assert image_key(manifest, job._replace(img_path=img_dir + os.sep, biome_cache_bytes=1), ['txt']) == key
+    for changed in [job._replace(seed='other'), job._replace(backend='numpy'), job._replace(crop_size=(120, 128)),
+                    job._replace(bboxes=[(20, 20, 60, 51)])]:
+        assert image_key(manifest, changed, ['txt']) != key
+
+
+# rotated_size gives the size PIL's rotate(expand=True) makes, odd sizes included
+@pytest.mark.parametrize('size', [(101, 77), (128, 128), (1980, 1980), (33, 250), (640, 481)])
+@pytest.mark.parametrize('angle', [0, 7, 30, 45, 90, 135, 200, 270, 333, -15])
+def test_rotated_size_matches_pil(size, angle):
+    assert rotated_size(size, angle) == Image.new('L', size).rotate(angle, expand=True).size
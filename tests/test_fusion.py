@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from inference.detectors import make_detections
+from inference.fusion import (BOTH, RGB, THERMAL, FusionStream, GridIndex, apply_homography, fuse_frame,
+                              homography_from_points, run_streams, synthetic_streams, warp_boxes)
+
+MATRIX = np.array([[2.9, 0.02, 40.0], [-0.01, 2.9, 25.0], [0.0, 0.0, 1.0]])
+
+
+# Four point pairs give back the homography, and boxes map to the envelope of their corners
+def test_homography():
+    thermal = np.array([[0, 0], [640, 0], [640, 360], [0, 360], [320, 180]], dtype=np.float64)
+    matrix = homography_from_points(thermal, apply_homography(MATRIX, thermal))
+    assert np.allclose(matrix / matrix[2, 2], MATRIX, atol=1e-6)
+    assert np.allclose(warp_boxes(MATRIX, [[0, 0, 10, 10]]),
+                       [[40, 24.9, 40 + 29.2, 25 + 29]], atol=1e-9)
+
+
+# The grid finds exactly the pairs a brute-force search finds
+def test_grid_index_matches_brute_force():
+    rng = np.random.default_rng(0)
+    points, queries = rng.uniform(-50, 500, (300, 2)), rng.uniform(-50, 500, (200, 2))
+    query_index, point_index, distances = GridIndex(points, 30.0).query_pairs(queries, 30.0)
+    gaps = np.linalg.norm(queries[:, None] - points[None], axis=2)
+    assert sorted(zip(query_index.tolist(), point_index.tolist())) == sorted(zip(*map(list, np.nonzero(gaps <= 30.0))))
+    assert np.allclose(distances, gaps[query_index, point_index])
+
+
+# One RGB box matches the warped thermal box and gets the noisy-OR score; the others stay single-sensor
+def test_fuse_frame():
+    rgb = make_detections([[100, 100, 160, 160], [900, 500, 950, 550]], [0.6, 0.8], [2, 3])
+    thermal = make_detections([[40, 40, 50, 50], [200, 100, 210, 110]], [0.5, 0.7], [0, 0])
+    fused = fuse_frame(rgb, thermal, np.array([[3.0, 0, 0], [0, 3.0, 0], [0, 0, 1]]), radius=40.0,
+                       single_sensor_scale=0.5)
+    assert fused.sources.tolist() == [BOTH, RGB, THERMAL]
+    assert np.allclose(fused.scores, [1 - 0.4 * 0.5, 0.4, 0.35])
+    assert fused.rgb_index.tolist() == [0, 1, -1] and fused.thermal_index.tolist() == [0, -1, 1]
+    assert fused.classes.tolist() == [2, 3, -1]
+    assert np.allclose(fused.boxes[2], [600, 300, 630, 330])
+
+
+# An RGB frame waits for a thermal frame max_dt newer, or for max_wait on the injected clock
+def test_fusion_stream_clock():
+    now = [0.0]
+    stream = FusionStream(MATRIX, max_dt=0.05, max_wait=0.1, clock=lambda: now[0])
+    assert stream.add_rgb(1.0, make_detections()) == []
+    assert stream.add_thermal(1.02, make_detections()) == []
+    now[0] = 0.1
+    assert stream.add_thermal(1.04, make_detections()) == []
+    now[0] = 0.11
+    assert [t for t, _ in stream.ready()] == [1.0]
+    assert stream.add_rgb(2.0, make_detections()) == []
+    assert [t for t, _ in stream.add_thermal(2.05, make_detections())] == [2.0]
+
+
+# clock=None waits in frame time, so replaying the same streams gives the same result every time
+def test_fusion_stream_replay_is_deterministic():
+    rgb, thermal, _ = synthetic_streams(MATRIX, frames=60, objects=10, seed=3)
+    runs = [run_streams(FusionStream(MATRIX, max_dt=0.06, max_wait=0.02, clock=None), rgb, thermal)
+            for _ in range(2)]
+    assert [t for t, _ in runs[0]] == [t for t, _ in rgb]
+    for (_, first), (_, second) in zip(*runs):
+        assert first.sources.tolist() == second.sources.tolist()
+        assert np.array_equal(first.boxes, second.boxes) and np.array_equal(first.scores, second.scores)
+    assert sum(int((f.sources == BOTH).sum()) for _, f in runs[0]) > 0
@@ -0,0 +1,29 @@
+import json
+import numpy as np
+import pytest
+
+from inference.georef import CameraModel
+
+
+# The camera comes from the image size render_and_label.py wrote; old meta files are refused
+def test_camera_from_meta(tmp_path):
+    meta_path = tmp_path / 'meta.json'
+    meta = {'altitude': 3, 'tilt_angle': 20.0, 'FOV': 60.0}
+    meta_path.write_text(json.dumps(meta))
+    with pytest.raises(ValueError, match='resolution'):
+        CameraModel.from_meta(str(meta_path))
+
+    meta_path.write_text(json.dumps(dict(meta, resolution=[1280, 720])))
+    camera = CameraModel.from_meta(str(meta_path))
+    assert (camera.width, camera.height, camera.fov, camera.tilt_angle) == (1280, 720, 60.0, 20.0)
+    assert camera.focal == pytest.approx(640 / np.tan(np.deg2rad(30)))
+
+
+# Pixels projected to the ground and back land where they started
+def test_pixels_ground_round_trip():
+    camera = CameraModel(1280, 720, 60.0, 20.0)
+    rng = np.random.default_rng(0)
+    pixels = rng.uniform([0, 0], [1280, 720], (50, 2))
+    poses = np.column_stack([rng.uniform(-5, 5, (50, 2)), np.full(50, 10.0), rng.uniform(0, 360, 50)])
+    ground = camera.pixels_to_ground(pixels, poses)
+    assert np.allclose(camera.ground_to_pixels(ground, poses), pixels, atol=1e-6)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from placement import min_spacing, plan_layout, poisson_disk
+
+
+# Smallest gap between two points, checked over every pair
+def brute_force_spacing(points):
+    gaps = np.linalg.norm(points[:, None, :2] - points[None, :, :2], axis=2)
+    return gaps[np.triu_indices(len(points), 1)].min()
+
+
+# Samples stay inside the rectangle, keep min_distance, and fill it (no gap fits another point)
+@pytest.mark.parametrize('width, height, min_distance, seed', [(20, 20, 0.5, 0), (7.3, 3.1, 0.25, 1), (5, 40, 1.7, 2)])
+def test_poisson_disk(width, height, min_distance, seed):
+    points = poisson_disk(width, height, min_distance, seed=seed)
+    assert np.all((points >= 0) & (points < [width, height]))
+    assert brute_force_spacing(points) >= min_distance
+    assert min_spacing(points) == pytest.approx(brute_force_spacing(points))
+
+    # Any point of a fine grid is within 2 * min_distance of a sample
+    xs, ys = np.meshgrid(np.linspace(0, width, 50, endpoint=False), np.linspace(0, height, 50, endpoint=False))
+    probes = np.stack([xs.ravel(), ys.ravel()], axis=1)
+    nearest = np.min(np.linalg.norm(probes[:, None] - points[None], axis=2), axis=1)
+    assert nearest.max() < 2 * min_distance
+    assert np.array_equal(points, poisson_disk(width, height, min_distance, seed=seed))
+
+
+# Layouts are within the area, keep the spacing, and have as many mines as fit
+def test_plan_layout():
+    area = (-3, 5, 10, 12)
+    positions, tilts, labels = plan_layout(40, ['mon', 'pomz'], area, min_distance=0.5, seed=4)
+    assert len(positions) == len(tilts) == len(labels) == 40
+    assert np.all((positions[:, 0] >= -3) & (positions[:, 0] < 5) & (positions[:, 1] >= 10) & (positions[:, 1] < 12))
+    assert brute_force_spacing(positions) >= 0.5
+    assert sorted(set(labels)) == ['mon', 'pomz'] and labels.count('mon') == 20
+
+    crowded, _, _ = plan_layout(10000, ['mon'], (0, 2, 0, 2), min_distance=0.5, seed=4)
+    assert 4 < len(crowded) < 10000
+    assert brute_force_spacing(crowded) >= 0.5
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from projection import transform_points, view_bounds_2d, view_bounds_2d_batch
+
+
+# Per-point reference like Blender's world_to_camera_view: world -> camera space, then the
+# frame corners rescaled to the point's depth (perspective) or used as they are (ortho)
+def world_to_camera_view(camera, frame, point, perspective=True):
+    co = np.linalg.inv(camera) @ np.append(point, 1.0)
+    z = -co[2]
+    if perspective:
+        if z == 0.0:
+            return 0.5, 0.5
+        frame = [v / (v[2] / z) for v in frame]
+    min_x, max_x = frame[1][0], frame[2][0]
+    min_y, max_y = frame[0][1], frame[1][1]
+    return (co[0] - min_x) / (max_x - min_x), (co[1] - min_y) / (max_y - min_y)
+
+
+# Bounds of one object the way the per-vertex loop in render_and_label.py used to compute them
+def reference_bounds(camera, frame, points, perspective=True):
+    lx, ly = zip(*[world_to_camera_view(camera, frame, p, perspective) for p in points])
+    center_x = min(max((max(lx) + min(lx)) / 2, 0.), 1.)
+    center_y = min(max((max(ly) + min(ly)) / 2, 0.), 1.)
+    bad_bbox = center_x in (0., 1.) and center_y in (0., 1.)
+    bad_bbox |= min(lx) <= 0 and max(lx) >= 1
+    bad_bbox |= min(ly) <= 0 and max(ly) >= 1
+    if bad_bbox:
+        return 0., 0., 0., 0.
+    return tuple(min(max(v, 0.), 1.) for v in (min(lx), min(ly), max(lx), max(ly)))
+
+
+# Camera 10 m above the origin looking down, tilted a little; frame is the negated view frame
+def camera_setup(rng, perspective):
+    angle = rng.uniform(-0.3, 0.3)
+    camera = np.eye(4)
+    camera[:3, :3] = [[1, 0, 0], [0, np.cos(angle), -np.sin(angle)], [0, np.sin(angle), np.cos(angle)]]
+    camera[:3, 3] = [rng.uniform(-1, 1), rng.uniform(-1, 1), 10.0]
+    half = np.tan(np.deg2rad(30)) if perspective else 5.0
+    view_frame = np.array([[half, half, -1.0], [half, -half, -1.0], [-half, -half, -1.0]])
+    return camera, -view_frame
+
+
+# Random small objects, some inside the view, some crossing its edges, some outside
+@pytest.mark.parametrize('perspective', [True, False])
+def test_batch_matches_per_point_reference(perspective):
+    rng = np.random.default_rng(1)
+    camera, frame = camera_setup(rng, perspective)
+    objects = [rng.uniform(-8, 8, 3) * [1, 1, 0.1] + rng.normal(0, rng.uniform(0.05, 2), (int(n), 3))
+               for n in rng.integers(1, 40, 50)]
+    co = transform_points(np.concatenate(objects), np.linalg.inv(camera))
+    offsets = np.cumsum([0] + [len(points) for points in objects[:-1]])
+
+    bounds = view_bounds_2d_batch(co, offsets, frame, perspective)
+    expected = np.array([reference_bounds(camera, frame, points, perspective) for points in objects])
+    assert np.allclose(bounds, expected, atol=1e-9)
+    assert np.any(expected.sum(axis=1) == 0) and np.any(expected.sum(axis=1) > 0)
+    for i in [0, 7, 49]:
+        local = transform_points(objects[i], np.linalg.inv(camera))
+        assert np.allclose(view_bounds_2d(local, frame, perspective), expected[i], atol=1e-9)
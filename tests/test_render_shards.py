@@ -0,0 +1,68 @@
+import json
+import os
+import sys
+import pytest
+
+from render_shards import make_shards, merge_shards, run_shards, split_frames, blender_command
+
+# Stands in for Blender running render_and_label.py: reads the shard arguments after "--" and
+# writes a render and a label per frame, and meta.json; frame 13 has no label, FAIL fails
+FAKE_WORKER = '''
+import json, os, sys
+args = sys.argv[sys.argv.index("--") + 1:]
+options = dict(zip(args[::2], args[1::2]))
+project_dir = options["--project_dir"]
+if os.environ.get("FAKE_WORKER_FAIL") and options["--frame_start"] == "10":
+    sys.exit(3)
+for folder in ["rendered", "labels"]:
+    os.makedirs(os.path.join(project_dir, folder), exist_ok=True)
+for frame in range(int(options["--frame_start"]), int(options["--frame_end"]) + 1):
+    with open(os.path.join(project_dir, "rendered", "ILLIA_PMN_1_frame_%04d.png" % frame), "w") as image:
+        image.write(options["--altitude"])
+    if frame != 13:
+        with open(os.path.join(project_dir, "labels", "frame_%04d.txt" % frame), "w") as label:
+            label.write("0 0.5 0.5 0.1 0.1\\n")
+with open(os.path.join(project_dir, "meta.json"), "w") as meta:
+    json.dump({"data": {"altitude": float(options["--altitude"])}}, meta)
+'''
+
+
+def test_split_frames():
+    assert split_frames(0, 9, 4) == [(0, 3), (4, 7), (8, 9)]
+    assert split_frames(5, 5, 10) == [(5, 5)]
+    assert split_frames(0, 2, 0) == [(0, 0), (1, 1), (2, 2)]
+
+
+def test_make_shards():
+    shards = make_shards(0, 14, 10, [3.0, 5.0], [0.0], [60.0])
+    assert [s['name'] for s in shards] == ['alt3_tilt0_fov60_f0000-0009', 'alt3_tilt0_fov60_f0010-0014',
+                                           'alt5_tilt0_fov60_f0000-0009', 'alt5_tilt0_fov60_f0010-0014']
+    assert all(s['path_end'] == 14 for s in shards)
+
+
+# Shards rendered by the fake worker merge into one dataset, images paired with labels
+def test_run_and_merge_shards(tmp_path, monkeypatch):
+    worker = tmp_path / 'fake_worker.py'
+    worker.write_text(FAKE_WORKER)
+    shards = make_shards(0, 14, 10, [3.0, 5.0], [0.0], [60.0])
+    command = blender_command([sys.executable, str(worker)])
+    shards_dir, output_dir = str(tmp_path / 'shards'), str(tmp_path / 'dataset')
+    run_shards(shards, command, shards_dir, workers=2)
+    merged = merge_shards(shards, shards_dir, output_dir)
+
+    images = sorted(os.listdir(os.path.join(output_dir, 'images')))
+    labels = sorted(os.listdir(os.path.join(output_dir, 'labels')))
+    assert len(images) == 2 * 14
+    assert [os.path.splitext(fn)[0] for fn in images] == [os.path.splitext(fn)[0] for fn in labels]
+    assert 'alt5_tilt0_fov60_f0010-0014_frame_0014.png' in images
+    assert 'alt5_tilt0_fov60_f0010-0014_frame_0013.png' not in images
+    with open(os.path.join(output_dir, 'images', 'alt5_tilt0_fov60_f0000-0009_frame_0002.png')) as image:
+        assert image.read() == '5.0'
+    with open(os.path.join(output_dir, 'meta.json')) as meta:
+        assert json.load(meta)['images'] == 28
+    assert [m['images'] for m in merged] == [10, 4, 10, 4]
+    assert merged[2]['data'] == {'altitude': 5.0}
+
+    monkeypatch.setenv('FAKE_WORKER_FAIL', '1')
+    with pytest.raises(RuntimeError, match='2 shard'):
+        run_shards(shards, command, shards_dir, workers=2)
@@ -0,0 +1,62 @@
+import os
+import random
+import numpy as np
+import pytest
+
+from common.shards import ShardWriter, TorchShardDataset, shard_trainer
+
+
+# Small shard of grey frames with one bright square each
+def write_shard(path, count=8, imgsz=64):
+    rng = np.random.default_rng(0)
+    with ShardWriter(path, imgsz) as writer:
+        for i in range(count):
+            image = np.full((imgsz, imgsz, 3), 90, dtype=np.uint8)
+            x, y = rng.integers(8, imgsz - 24, 2)
+            image[y:y + 16, x:x + 16] = 230
+            box = [(x + 8) / imgsz, (y + 8) / imgsz, 16 / imgsz, 16 / imgsz]
+            writer.add(f'frame_{i:04d}', image, [0], [box])
+
+
+# Two epochs with close_mosaic=1: the trainer closes mosaic and reset()s the loader in the second
+def test_shard_trainer_runs_past_close_mosaic(tmp_path):
+    pytest.importorskip('torch')
+    ultralytics = pytest.importorskip('ultralytics')
+    shard = str(tmp_path / 'shard')
+    write_shard(shard)
+    data_yaml = tmp_path / 'shards.yaml'
+    data_yaml.write_text(f"train: {shard}\nval: {shard}\nnc: 1\nnames: ['mine']\n")
+
+    model = ultralytics.YOLO('yolov8n.yaml')
+    model.train(data=str(data_yaml), trainer=shard_trainer(), epochs=2, close_mosaic=1, imgsz=64, batch=4,
+                workers=0, device='cpu', plots=False, amp=False, project=str(tmp_path / 'runs'), name='train',
+                exist_ok=True, verbose=False)
+    assert model.trainer.epoch == 1
+    assert os.path.isfile(model.trainer.last)
+
+
+# Training samples go through YOLO augmentation (mosaic, flips, HSV...), validation samples don't
+def test_torch_shard_dataset_augments(tmp_path):
+    pytest.importorskip('torch')
+    pytest.importorskip('ultralytics')
+    from ultralytics.cfg import get_cfg
+    shard = str(tmp_path / 'shard')
+    write_shard(shard)
+    hyp = get_cfg(overrides={'imgsz': 64, 'mosaic': 1.0, 'fliplr': 0.5})
+    random.seed(0)
+    np.random.seed(0)
+
+    plain = TorchShardDataset(shard)
+    augmented = TorchShardDataset(shard, augment=True, hyp=hyp, imgsz=64)
+    assert plain[0]['img'].shape == augmented[0]['img'].shape == (3, 64, 64)
+    samples = [augmented[i % 8] for i in range(16)]
+    assert any(not np.array_equal(s['img'].numpy(), plain[i % 8]['img'].numpy()) for i, s in enumerate(samples))
+    # A mosaic holds boxes of several frames, each frame has one
+    assert max(len(s['cls']) for s in samples) > 1
+    for sample in samples:
+        boxes = sample['bboxes'].numpy()
+        assert boxes.shape == (len(sample['cls']), 4) and np.all((boxes >= 0) & (boxes <= 1))
+
+    augmented.close_mosaic(hyp)
+    assert hyp.mosaic == 0.0
+    assert all(len(augmented[i]['cls']) <= 1 for i in range(8))
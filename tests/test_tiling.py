@@ -0,0 +1,33 @@
+import numpy as np
+
+from common.boxes import nms
+from inference.detectors import make_detections
+from inference.tiling import TiledDetector, merge_detections
+
+
+# Two overlapping boxes of different classes, partly left of and above the frame
+OVERLAPPING = [[-100, -100, 0, 0], [-98, -98, 2, 2]]
+
+
+def test_nms_keeps_overlapping_boxes_of_other_classes():
+    assert sorted(nms(OVERLAPPING, [0.9, 0.8], 0.5, [0, 1]).tolist()) == [0, 1]
+    assert nms(OVERLAPPING, [0.9, 0.8], 0.5, [1, 1]).tolist() == [0]
+    assert nms(OVERLAPPING, [0.9, 0.8], 0.5).tolist() == [0]
+
+
+def test_merge_keeps_overlapping_boxes_of_other_classes():
+    detections = make_detections(OVERLAPPING, [0.9, 0.8], [0, 1])
+    for merge in ['nms', 'wbf']:
+        assert sorted(merge_detections(detections, merge).classes.tolist()) == [0, 1]
+
+
+# Detector that finds a mine of class 2 and one of class 5 in the same spot of every tile
+class OverlapDetector:
+    def __call__(self, frames):
+        return [make_detections([[300, 300, 340, 340], [302, 302, 342, 342]], [0.9, 0.8], [2, 5]) for _ in frames]
+
+
+def test_tiled_detector_keeps_overlapping_boxes_of_other_classes():
+    frame = np.zeros((640, 640, 3), dtype=np.uint8)
+    detections = TiledDetector(OverlapDetector(), tile=640, min_std=0)([frame])[0]
+    assert sorted(detections.classes.tolist()) == [2, 5]
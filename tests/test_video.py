@@ -0,0 +1,42 @@
+import threading
+import time
+import numpy as np
+import pytest
+
+from inference.detectors import StubDetector
+from inference.video import run_pipeline
+
+
+# Every frame comes out once, in order, with detections from the last inferred frame
+@pytest.mark.parametrize('batch_size, infer_every', [(1, 1), (4, 1), (3, 2)])
+def test_run_pipeline_keeps_order(batch_size, infer_every):
+    frames = [np.full((48, 64, 3), i, dtype=np.uint8) for i in range(10)]
+    seen = []
+    report = run_pipeline(frames, StubDetector(), lambda frame, detections: seen.append(int(frame[0, 0, 0])),
+                          batch_size=batch_size, infer_every=infer_every, min_conf=0.0, draw=False)
+    assert seen == list(range(10))
+    assert report['frames'] == 10 and report['inferred_frames'] == len(range(0, 10, infer_every))
+
+
+# A consumer that fails while the source stalls must not leave the infer thread waiting forever
+def test_stalled_source_does_not_leak_infer_thread():
+    release = threading.Event()
+
+    def frames():
+        yield np.zeros((48, 64, 3), dtype=np.uint8)
+        release.wait()
+
+    def fail(frame, detections):
+        raise RuntimeError('writer failed')
+
+    before = set(threading.enumerate())
+    try:
+        with pytest.raises(RuntimeError, match='writer failed'):
+            run_pipeline(frames(), StubDetector(), fail)
+        deadline = time.monotonic() + 2
+        while len(set(threading.enumerate()) - before) > 1 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        # Only the decode thread is left, stuck inside the source until it is released
+        assert [t.name for t in set(threading.enumerate()) - before] == ['video-decode']
+    finally:
+        release.set()